@@ -0,0 +1,144 @@
+# analytics.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# АНАЛІТИКА ВИТРАТ: ТРЕНДИ Й ПРОГНОЗ
+# Денні суми витрат користувача (один запит до daily_rollup) розкладаються
+# у щільну матрицю категорія × день, далі — лише векторні операції numpy,
+# без циклів по днях чи місяцях:
+#  • ковзне середнє — різниця кумулятивних сум;
+#  • підсумки місяців — np.add.reduceat по межах місяців;
+#  • тренд — нахил МНК по TREND_MONTHS останніх повних місяцях, для всіх
+#    категорій одним матричним добутком;
+#  • прогноз на кінець місяця — сезонний (торішній залишок цього місяця ×
+#    темп росту за SEASONAL_WINDOW днів), якщо історії вистачає на рік,
+#    інакше лінійний (витрачене + середнє за ROLLING_DAYS × днів, що лишилися).
+# Багаторічна історія рахується за мілісекунди (bench/bench_analytics.py).
+# ─────────────────────────────────────────────────────────────────────────────
+
+from datetime import date
+
+import numpy as np
+
+ROLLING_DAYS = 28
+TREND_MONTHS = 6
+SEASONAL_WINDOW = 90
+GROWTH_CLIP = (0.25, 4.0)   # темп росту рік до року поза межами — шум, а не сезонність
+
+
+def to_dates(days) -> np.ndarray:
+    # YYYYMMDD -> datetime64[D] векторно
+    days = np.asarray(days, dtype=np.int64)
+    months = (days // 10000 - 1970) * 12 + days // 100 % 100 - 1
+    return months.astype("datetime64[M]").astype("datetime64[D]") + (days % 100 - 1)
+
+
+class Series:
+    __slots__ = ("start", "categories", "values")
+
+    def __init__(self, start, categories, values):
+        self.start = start              # datetime64[D] першого стовпця
+        self.categories = categories    # назви рядків
+        self.values = values            # float64 [категорія, день], останній стовпець — end
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self.start + np.arange(self.values.shape[1])
+
+    def index(self, day) -> int:
+        return int((np.datetime64(day, "D") - self.start).astype(np.int64))
+
+
+def build_series(days, categories, amounts, end: date) -> Series:
+    # рядки daily_rollup (day, category, amount) -> матриця від першого запису до end включно
+    end = np.datetime64(end, "D")
+    dates = to_dates(days)
+    # коди категорій словником: np.unique по рядках (object) у рази повільніший
+    codes = {}
+    rows = np.fromiter((codes.setdefault(c, len(codes)) for c in categories), dtype=np.int64, count=len(dates))
+    # не пізніше 1-го числа поточного місяця: ковзне середнє новачка — за дні місяця, а не за один день
+    start = end.astype("datetime64[M]").astype("datetime64[D]")
+    if len(dates):
+        start = min(dates.min(), start)
+    width = int((end - start).astype(np.int64)) + 1
+    cols = (dates - start).astype(np.int64)
+    keep = cols < width   # майбутні дати (запис наперед) не враховуємо
+    flat = np.bincount(rows[keep] * width + cols[keep], weights=np.asarray(amounts, dtype=np.float64)[keep],
+                       minlength=len(codes) * width)
+    return Series(start, list(codes), flat.reshape(len(codes), width))
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    # [категорія, день] -> середнє за window днів, що закінчуються цим днем (на початку — за наявні дні)
+    c = np.cumsum(np.pad(values, ((0, 0), (1, 0))), axis=1)
+    hi = np.arange(1, c.shape[1])
+    lo = np.maximum(hi - window, 0)
+    return (c[:, hi] - c[:, lo]) / (hi - lo)
+
+
+def monthly_totals(s: Series):
+    # -> (місяці datetime64[M], суми [категорія, місяць])
+    months = s.dates.astype("datetime64[M]")
+    starts = np.flatnonzero(np.r_[True, months[1:] != months[:-1]])
+    return months[starts], np.add.reduceat(s.values, starts, axis=1)
+
+
+def trend(totals: np.ndarray) -> np.ndarray:
+    # відносний нахил (частка середнього за місяць) по стовпцях totals; nan, якщо місяців < 3
+    k = totals.shape[1]
+    if k < 3:
+        return np.full(totals.shape[0], np.nan)
+    x = np.arange(k) - (k - 1) / 2
+    mean = totals.mean(axis=1)
+    slope = (totals - mean[:, None]) @ x / (x @ x)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(mean > 0, slope / mean, np.nan)
+
+
+def project_month_end(s: Series, end: date):
+    # -> (витрачено з 1-го, прогноз на кінець місяця, ознака сезонного прогнозу) по категоріях
+    end = np.datetime64(end, "D")
+    month = end.astype("datetime64[M]")
+    col, first = s.index(end), s.index(month.astype("datetime64[D]"))
+    left = int(((month + 1).astype("datetime64[D]") - end).astype(np.int64)) - 1
+    spent = s.values[:, first:col + 1].sum(axis=1)
+    linear = spent + rolling_mean(s.values[:, max(col - ROLLING_DAYS + 1, 0):col + 1], ROLLING_DAYS)[:, -1] * left
+
+    # той самий день і решта місяця рік тому; темп — останні SEASONAL_WINDOW днів до і рік тому
+    ly_month = month - 12
+    ly_last = (ly_month + 1).astype("datetime64[D]") - 1
+    ly_end = s.index(min(ly_month.astype("datetime64[D]") + (end - month.astype("datetime64[D]")), ly_last))
+    if ly_end - SEASONAL_WINDOW + 1 < 0:
+        return spent, linear, np.zeros(len(spent), dtype=bool)
+    ly_total = s.values[:, s.index(ly_month.astype("datetime64[D]")):s.index(ly_last) + 1].sum(axis=1)
+    rest = s.values[:, ly_end + 1:s.index(ly_last) + 1].sum(axis=1)
+    recent = s.values[:, col - SEASONAL_WINDOW + 1:col + 1].sum(axis=1)
+    before = s.values[:, ly_end - SEASONAL_WINDOW + 1:ly_end + 1].sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        growth = np.nan_to_num(np.clip(recent / before, *GROWTH_CLIP))
+    seasonal = (before > 0) & (ly_total > 0)
+    return spent, np.where(seasonal, spent + rest * growth, linear), seasonal
+
+
+def analyze(days, categories, amounts, end: date) -> dict:
+    # days/categories/amounts — витрати з daily_rollup у валюті користувача; end — «сьогодні»
+    s = build_series(days, categories, amounts, end)
+    months, totals = monthly_totals(s)
+    spent, projected, seasonal = project_month_end(s, end)
+    full = totals[:, :-1]   # поточний місяць неповний
+    last = full[:, -1] if full.shape[1] >= 1 else np.zeros(len(s.categories))
+    prev = full[:, -2] if full.shape[1] >= 2 else np.zeros(len(s.categories))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mom = np.where(prev > 0, (last - prev) / prev, np.nan)
+    return {
+        "month": months[-1],
+        "categories": s.categories,
+        "spent": spent,
+        "projected": projected,
+        "seasonal": seasonal,
+        "last_month": last,
+        "prev_month": prev,
+        "mom": mom,
+        "trend": trend(full[:, -TREND_MONTHS:]),
+        "avg_daily": rolling_mean(s.values[:, -ROLLING_DAYS:], ROLLING_DAYS)[:, -1],
+    }
@@ -0,0 +1,128 @@
+# bench/bench_analytics.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# БЕНЧМАРК АНАЛІТИКИ (ТРЕНДИ Й ПРОГНОЗ)
+# Запуск:  python bench/bench_analytics.py [--years 5] [--per-day 15] [--repeat 20]
+# Генерує багаторічну історію одного користувача у тимчасовій базі і
+# порівнює: цикл Python по fetch_month кожного місяця (словники, ковзне
+# середнє по днях) проти одного запиту до daily_rollup + analytics.analyze.
+# Підсумки місяців обох варіантів звіряються.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import analytics  # noqa: E402
+import rollups  # noqa: E402
+from migrations import migrate, day_key, month_range  # noqa: E402
+
+CATS = ["Харчування", "Одяг та взуття", "Оренда/житло", "Розваги", "Дорога/подорожі",
+        "Онлайн підписки", "Здоров’я", "Інше"]
+
+MONTH_SQL = """SELECT type, category, subcategory, amount, currency, comment, day
+               FROM transactions WHERE user_id=? AND day BETWEEN ? AND ? ORDER BY day, id"""
+SERIES_SQL = """SELECT day, category, currency, amount FROM daily_rollup
+                WHERE user_id=? AND type='💸 Витрати'"""
+
+
+def populate(conn, years, per_day, today):
+    rnd = random.Random(42)
+    start = today - timedelta(days=365 * years)
+    rows = []
+    d = start
+    while d <= today:
+        ds = d.isoformat()
+        for _ in range(rnd.randint(per_day // 2, per_day * 3 // 2)):
+            rows.append((1, "💸 Витрати", rnd.choice(CATS), None, round(rnd.uniform(10, 800), 2), "грн",
+                         None, ds, day_key(d.year, d.month, d.day), ds))
+        d += timedelta(days=1)
+    conn.execute("BEGIN")
+    conn.executemany("""INSERT INTO transactions (user_id, type, category, subcategory, amount,
+                        currency, comment, date, day, created_at) VALUES (?,?,?,?,?,?,?,?,?,?)""", rows)
+    rollups.rebuild(conn, 1)
+    conn.execute("COMMIT")
+    return len(rows), start
+
+
+def python_loop(conn, start, today):
+    # «до»: fetch_month на кожен місяць і агрегація словниками
+    monthly = defaultdict(lambda: defaultdict(float))
+    daily = defaultdict(lambda: defaultdict(float))
+    y, m = start.year, start.month
+    while (y, m) <= (today.year, today.month):
+        for t, c, _, a, _, _, day in conn.execute(MONTH_SQL, (1, *month_range(y, m))):
+            if t == "💸 Витрати":
+                monthly[(y, m)][c] += a
+                daily[c][day] += a
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    avg = {}
+    for c, by_day in daily.items():
+        window = [by_day.get(day_key(x.year, x.month, x.day), 0.0)
+                  for x in (today - timedelta(days=i) for i in range(analytics.ROLLING_DAYS))]
+        avg[c] = sum(window) / len(window)
+    months = sorted(monthly)
+    mom = {c: (monthly[months[-2]][c] - monthly[months[-3]][c]) / monthly[months[-3]][c]
+           for c in monthly[months[-3]] if monthly[months[-3]][c]}
+    return monthly, avg, mom
+
+
+def vectorized(conn, today):
+    rows = conn.execute(SERIES_SQL, (1,)).fetchall()
+    return analytics.analyze([r[0] for r in rows], [r[1] for r in rows], [r[3] for r in rows], today)
+
+
+def bench(fn, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = fn()
+    return (time.perf_counter() - t0) / repeat * 1000, out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--per-day", type=int, default=15)
+    ap.add_argument("--repeat", type=int, default=20)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    today = date.today()
+    n, start = populate(conn, args.years, args.per_day, today)
+    rollup_rows = conn.execute("SELECT COUNT(*) FROM daily_rollup WHERE user_id=1").fetchone()[0]
+    print(f"Історія: {n} транзакцій за {args.years} р., {rollup_rows} рядків daily_rollup")
+
+    ms_loop, (monthly, _, _) = bench(lambda: python_loop(conn, start, today), max(1, args.repeat // 4))
+    ms_vec, report = bench(lambda: vectorized(conn, today), args.repeat)
+    rows = conn.execute(SERIES_SQL, (1,)).fetchall()
+    ms_np, _ = bench(lambda: analytics.analyze([r[0] for r in rows], [r[1] for r in rows],
+                                               [r[3] for r in rows], today), args.repeat)
+    print(f"  цикл по fetch_month      {ms_loop:9.2f} мс")
+    print(f"  daily_rollup + analyze   {ms_vec:9.2f} мс   (з них numpy: {ms_np:.2f} мс)")
+
+    # звірка: торішні підсумки місяців по категоріях
+    s = analytics.build_series([r[0] for r in rows], [r[1] for r in rows], [r[3] for r in rows], today)
+    months, totals = analytics.monthly_totals(s)
+    ref = np.array([[monthly[(mm.astype(object).year, mm.astype(object).month)].get(c, 0.0) for mm in months]
+                    for c in s.categories])
+    print("  підсумки місяців збігаються:", bool(np.allclose(ref, totals)))
+    print(f"  прогноз на кінець місяця: {report['projected'].sum():.2f} "
+          f"(сезонних категорій: {int(report['seasonal'].sum())}/{len(report['categories'])})")
+    conn.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
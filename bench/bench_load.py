@@ -0,0 +1,304 @@
+# bench/bench_load.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# НАВАНТАЖУВАЛЬНИЙ ТЕСТ З ЛОКАЛЬНИМ ФЕЙКОВИМ BOT API
+# Запуск:  python bench/bench_load.py [--users 10,50,200] [--tx 3] [--quiz 20]
+# Для кожної кількості користувачів — окремий процес: піднімається stub
+# Bot API (getUpdates/sendMessage/editMessageText/sendDocument/…) і stub
+# курсів на localhost, бот будується справжнім build_app() і ходить туди
+# по HTTP через BOT_API_URL. Кожен користувач проходить сесію: онбординг,
+# кілька транзакцій, статистика за місяць + PDF + діаграма, вікторина.
+# Крок сесії чекає, поки бот повністю обробить апдейт (як живий користувач).
+# Звіт: пропускна здатність, p50/p99 по маршрутах і піковий RSS.
+# Воркери рендеру прогріваються до заміру (--cold — без прогріву).
+# ─────────────────────────────────────────────────────────────────────────────
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+# ---------- stub Bot API ----------
+class FakeBotAPI(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.updates = queue.Queue()
+        self.calls = Counter()
+        self.busy = 0
+        self._ids = itertools.count(1000)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def message(self, text="", document=False, photo=False):
+        msg = {"message_id": next(self._ids), "date": int(time.time()),
+               "chat": {"id": 1, "type": "private"}, "text": text}
+        if document:
+            msg["document"] = {"file_id": f"DOC{msg['message_id']}", "file_unique_id": "d"}
+        if photo:
+            msg["photo"] = [{"file_id": f"PH{msg['message_id']}", "file_unique_id": "p", "width": 1, "height": 1}]
+        return msg
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive, як у справжнього API
+    disable_nagle_algorithm = True  # інакше заголовки й тіло окремими сегментами ловлять delayed ACK (~40 мс)
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _params(self, body: bytes) -> dict:
+        ctype = self.headers.get("Content-Type", "")
+        if ctype.startswith("application/x-www-form-urlencoded"):
+            return {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        if ctype.startswith("application/json") and body:
+            return json.loads(body)
+        return {}   # multipart (sendDocument/sendPhoto) — вміст не потрібен
+
+    def do_GET(self):
+        # stub джерел курсів (NBU_URL / COINGECKO_URL)
+        if self.path.startswith("/nbu"):
+            return self._reply([{"r030": 840, "rate": 41.5}, {"r030": 978, "rate": 45.1}])
+        if self.path.startswith("/coingecko"):
+            return self._reply({"bitcoin": {"usd": 65000}, "ethereum": {"usd": 3200}})
+        self._reply({"ok": False}, 404)
+
+    def do_POST(self):
+        srv = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        method = self.path.rsplit("/", 1)[-1]
+        params = self._params(body)
+        with srv._lock:
+            srv.calls[method] += 1
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        elif method == "getUpdates":
+            result = []
+            wait = min(float(params.get("timeout") or 0), 1.0) or 0.05
+            try:
+                result.append(srv.updates.get(timeout=wait))
+                while len(result) < 100:
+                    result.append(srv.updates.get_nowait())
+            except queue.Empty:
+                pass
+        elif method in ("sendMessage", "editMessageText"):
+            text = params.get("text", "")
+            if text.startswith("⏳"):
+                srv.busy += 1
+            result = srv.message(text)
+        elif method == "sendDocument":
+            result = srv.message(document=True)
+        elif method == "sendPhoto":
+            result = srv.message(photo=True)
+        else:
+            result = True   # answerCallbackQuery, deleteWebhook, …
+        self._reply({"ok": True, "result": result})
+
+
+# ---------- синтетичні сесії ----------
+_update_ids = itertools.count(1)
+
+
+def _msg(uid, text):
+    upd = {"update_id": next(_update_ids), "message": {
+        "message_id": 1, "date": int(time.time()), "text": text,
+        "chat": {"id": uid, "type": "private"}, "from": {"id": uid, "is_bot": False, "first_name": "u"}}}
+    if text.startswith("/"):
+        upd["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return upd
+
+
+def _cb(uid, data):
+    return {"update_id": next(_update_ids), "callback_query": {
+        "id": str(next(_update_ids)), "chat_instance": "x", "data": data,
+        "from": {"id": uid, "is_bot": False, "first_name": "u"},
+        "message": {"message_id": 5, "date": int(time.time()), "text": "x",
+                    "chat": {"id": uid, "type": "private"}}}}
+
+
+def session(uid, n_tx, n_quiz):
+    # -> [(мітка маршруту, апдейт), ...]; мітки текстових кроків — text:<що вводимо>
+    today = date.today()
+    yield "cmd:/start", _msg(uid, "/start")
+    yield "text:name", _msg(uid, f"User{uid}")
+    yield None, _cb(uid, "onb:setcur:грн")
+    for i in range(n_tx):
+        yield None, _cb(uid, "type:exp")
+        yield None, _cb(uid, f"cat:{i % 3}")
+        yield None, _cb(uid, "sub:0")
+        yield "text:amount", _msg(uid, str(10 + i * 7.5))
+        yield "text:comment", _msg(uid, f"покупка {i}")
+    for data in ("stats:open", "stats:mode:mon", f"stats:year:{today.year}", f"stats:month:{today.month:02d}",
+                 "stats:pdf", "stats:pie"):
+        yield None, _cb(uid, data)
+    if n_quiz:
+        yield None, _cb(uid, "quiz:start")
+        for i in range(n_quiz):
+            yield None, _cb(uid, f"quiz:ans:{i}:{i % 4}")
+    yield None, _cb(uid, "main:open")
+
+
+def _pct(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def _children_hwm_kb():
+    # пікова пам’ять воркерів рендеру (Linux /proc); вони ще живі на момент виклику
+    total = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                status = f.read()
+        except OSError:
+            continue
+        if f"PPid:\t{os.getpid()}\n" in status:
+            for line in status.splitlines():
+                if line.startswith("VmHWM:"):
+                    total += int(line.split()[1])
+    return total
+
+
+# ---------- один прогін (у дочірньому процесі) ----------
+def child(users: int, n_tx: int, n_quiz: int, cold: bool):
+    import asyncio
+
+    api = FakeBotAPI()
+    threading.Thread(target=api.serve_forever, daemon=True).start()
+    os.environ.update({"BOT_TOKEN": "123:load", "BOT_API_URL": api.url, "RENDER_WARM": "0",
+                       "NBU_URL": f"{api.url}/nbu", "COINGECKO_URL": f"{api.url}/coingecko"})
+    # stub не має flood-лімітів, тож міряємо пропускну здатність самого бота, а не ліміти Telegram
+    for var in ("SEND_GLOBAL_RATE", "SEND_CHAT_RATE", "SEND_CHAT_BURST"):
+        os.environ.setdefault(var, "100000")
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, ROOT)
+    import main
+    from telegram import Update
+
+    async def run():
+        app = main.build_app()
+        pending = {}
+        process_update = app.process_update
+
+        async def tracked(update):
+            # крок завершено, коли бот повністю обробив апдейт (з усіма викликами API)
+            try:
+                await process_update(update)
+            finally:
+                fut = pending.pop(getattr(update, "update_id", None), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(time.perf_counter())
+
+        app.process_update = tracked
+        await app.initialize()
+        await app.updater.start_polling(poll_interval=0, timeout=1, allowed_updates=Update.ALL_TYPES)
+        await app.start()
+        await main.on_startup(app)
+        if not cold:
+            await main.renderer.warm()
+
+        latencies = defaultdict(list)
+        loop = asyncio.get_running_loop()
+
+        async def user(uid):
+            for label, upd in session(uid, n_tx, n_quiz):
+                if label is None:
+                    route, _ = main.router.match(upd["callback_query"]["data"])
+                    label = route.pattern if route else "unknown"
+                fut = loop.create_future()
+                pending[upd["update_id"]] = fut
+                start = time.perf_counter()
+                api.updates.put(upd)
+                latencies[label].append(await fut - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(1_000_000 + i) for i in range(users)))
+        elapsed = time.perf_counter() - start
+        workers_kb = _children_hwm_kb()
+
+        await app.updater.stop()
+        await app.stop()
+        await app.shutdown()
+        await main.on_shutdown(app)
+        return latencies, elapsed, workers_kb
+
+    latencies, elapsed, workers_kb = asyncio.run(run())
+    api.shutdown()
+    n = sum(len(v) for v in latencies.values())
+    print(json.dumps({
+        "users": users,
+        "updates": n,
+        "elapsed": elapsed,
+        "throughput": n / elapsed,
+        "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "workers_kb": workers_kb,
+        "busy": api.busy,
+        "api_calls": dict(api.calls),
+        "routes": {label: {"n": len(v), "p50": _pct(v, 0.5), "p99": _pct(v, 0.99),
+                           "mean": statistics.fmean(v)}
+                   for label, v in latencies.items()},
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", default="10,50,200", help="кількості користувачів через кому")
+    ap.add_argument("--tx", type=int, default=3, help="транзакцій на користувача")
+    ap.add_argument("--quiz", type=int, default=20, help="відповідей у вікторині (0 — без вікторини)")
+    ap.add_argument("--cold", action="store_true", help="не прогрівати воркери рендеру")
+    ap.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return child(args.child, args.tx, args.quiz, args.cold)
+
+    for users in (int(u) for u in args.users.split(",")):
+        cmd = [sys.executable, __file__, "--child", str(users), "--tx", str(args.tx), "--quiz", str(args.quiz)]
+        if args.cold:
+            cmd.append("--cold")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr[-3000:])
+            sys.exit(proc.returncode)
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"\n=== користувачів: {r['users']} ===")
+        print(f"апдейтів: {r['updates']}, час: {r['elapsed']:.2f} с, "
+              f"пропускна здатність: {r['throughput']:.1f} апд/с")
+        print(f"піковий RSS: бот {r['rss_kb'] / 1024:.1f} МБ, воркери рендеру {r['workers_kb'] / 1024:.1f} МБ; "
+              f"відмов «зайнято»: {r['busy']}")
+        print(f"{'маршрут':<62} {'n':>6} {'p50 мс':>9} {'p99 мс':>9}")
+        for label, s in sorted(r["routes"].items(), key=lambda kv: -kv[1]["p99"]):
+            print(f"{label:<62} {s['n']:>6} {s['p50'] * 1000:>9.1f} {s['p99'] * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench/bench_queries.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# БЕНЧМАРК ЗАПИТІВ ДЕНЬ/МІСЯЦЬ/ВСЯ ІСТОРІЯ: стара схема vs міграція 2
+# Запуск:  python bench/bench_queries.py [--rows 1000000] [--users 2000]
+# Генерує синтетичну базу у тимчасовому файлі, показує EXPLAIN QUERY PLAN
+# та середній час запиту до і після міграцій.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from migrations import migrate, day_key, month_range  # noqa: E402
+
+TYPES = ["💸 Витрати", "💰 Надходження", "📈 Інвестиції"]
+CATS = ["Харчування", "Одяг та взуття", "Оренда/житло", "Розваги", "Зарплата", "Крипта"]
+
+OLD_QUERIES = {
+    "day": ("""SELECT type, category, subcategory, amount, currency, comment
+               FROM transactions WHERE user_id=? AND date=?""",
+            lambda u, y, m, d: (u, f"{y:04d}-{m:02d}-{d:02d}")),
+    "month": ("""SELECT type, category, subcategory, amount, currency, comment
+                 FROM transactions
+                 WHERE user_id=? AND strftime('%Y', date)=? AND strftime('%m', date)=?""",
+              lambda u, y, m, d: (u, str(y), f"{m:02d}")),
+    "all": ("""SELECT type, category, subcategory, amount, currency, comment
+               FROM transactions WHERE user_id=? ORDER BY date ASC, id ASC""",
+            lambda u, y, m, d: (u,)),
+}
+
+NEW_QUERIES = {
+    "day": ("""SELECT type, category, subcategory, amount, currency, comment
+               FROM transactions WHERE user_id=? AND day=? ORDER BY id""",
+            lambda u, y, m, d: (u, day_key(y, m, d))),
+    "month": ("""SELECT type, category, subcategory, amount, currency, comment
+                 FROM transactions WHERE user_id=? AND day BETWEEN ? AND ? ORDER BY day, id""",
+              lambda u, y, m, d: (u, *month_range(y, m))),
+    "all": ("""SELECT type, category, subcategory, amount, currency, comment
+               FROM transactions WHERE user_id=? ORDER BY day, id""",
+            lambda u, y, m, d: (u,)),
+}
+
+
+def populate(conn, rows, users, days=3 * 365):
+    start = date.today() - timedelta(days=days)
+    rnd = random.Random(42)
+    batch = []
+    conn.execute("BEGIN")
+    for i in range(rows):
+        ds = (start + timedelta(days=rnd.randrange(days))).isoformat()
+        batch.append((rnd.randrange(1, users + 1), rnd.choice(TYPES), rnd.choice(CATS), None,
+                      round(rnd.uniform(1, 5000), 2), "грн", None, ds, ds))
+        if len(batch) == 50000:
+            conn.executemany("""INSERT INTO transactions (user_id, type, category, subcategory, amount,
+                                currency, comment, date, created_at) VALUES (?,?,?,?,?,?,?,?,?)""", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("""INSERT INTO transactions (user_id, type, category, subcategory, amount,
+                            currency, comment, date, created_at) VALUES (?,?,?,?,?,?,?,?,?)""", batch)
+    conn.execute("COMMIT")
+
+
+def run(conn, queries, users, repeat):
+    rnd = random.Random(7)
+    today = date.today()
+    for name, (sql, params) in queries.items():
+        args = params(1, today.year, today.month, today.day)
+        plan = [r[-1] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, args)]
+        n = repeat if name != "all" else max(1, repeat // 5)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            d = today - timedelta(days=rnd.randrange(365))
+            conn.execute(sql, params(rnd.randrange(1, users + 1), d.year, d.month, d.day)).fetchall()
+        ms = (time.perf_counter() - t0) / n * 1000
+        print(f"  {name:<6} {ms:9.3f} ms/запит   план: {' | '.join(plan)}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=2000)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn, target=1)
+    t0 = time.perf_counter()
+    populate(conn, args.rows, args.users)
+    print(f"Згенеровано {args.rows} транзакцій ({args.users} користувачів) за {time.perf_counter() - t0:.1f} с")
+
+    print("До міграцій (strftime, без індексів):")
+    run(conn, OLD_QUERIES, args.users, args.repeat)
+
+    t0 = time.perf_counter()
+    migrate(conn)
+    print(f"Міграції застосовано за {time.perf_counter() - t0:.1f} с")
+
+    print("Після міграцій (day + idx_tx_user_day):")
+    run(conn, NEW_QUERIES, args.users, args.repeat)
+    conn.close()
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
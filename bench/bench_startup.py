@@ -0,0 +1,116 @@
+# bench/bench_startup.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# БЕНЧМАРК ХОЛОДНОГО СТАРТУ
+# Запуск:  python bench/bench_startup.py [--runs 5] [--eager]
+# Кожен прогін — окремий процес: import main, build_app(), initialize/start
+# з фейковим Bot API (без мережі), потім /start у update_queue і час до
+# першого sendMessage. --eager заздалегідь імпортує reports/charts, як
+# було до лінивого завантаження, — для порівняння.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def child(eager: bool):
+    t0 = time.perf_counter()
+    os.environ.setdefault("BOT_TOKEN", "123:bench")
+    os.environ["RENDER_WARM"] = "0"
+    os.chdir(tempfile.mkdtemp())
+    sys.path.insert(0, ROOT)
+    import asyncio
+
+    if eager:
+        import charts
+        import reports
+        charts.warm()
+        reports.warm()
+    import main
+    from telegram import Update
+    from telegram.request import BaseRequest
+    t_import = time.perf_counter()
+
+    first = asyncio.Event()
+
+    class FakeRequest(BaseRequest):
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, **kwargs):
+            ep = url.rsplit("/", 1)[-1]
+            if ep == "getMe":
+                res = {"id": 1, "is_bot": True, "first_name": "b", "username": "b"}
+            else:
+                res = {"message_id": 1, "date": int(time.time()), "chat": {"id": 1, "type": "private"}}
+                first.set()
+            return 200, json.dumps({"ok": True, "result": res}).encode()
+
+    async def run():
+        app = main.build_app()
+        app.bot._request = (FakeRequest(), FakeRequest())
+        await app.initialize()
+        await app.start()
+        t_ready = time.perf_counter()
+        update = {"update_id": 1, "message": {
+            "message_id": 1, "date": int(time.time()), "text": "/start",
+            "chat": {"id": 7, "type": "private"}, "from": {"id": 7, "is_bot": False, "first_name": "u"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}
+        await app.update_queue.put(Update.de_json(update, app.bot))
+        await first.wait()
+        t_first = time.perf_counter()
+        await app.stop()
+        await app.shutdown()
+        await main.on_shutdown(app)
+        return t_ready, t_first
+
+    t_ready, t_first = asyncio.run(run())
+    print(json.dumps({
+        "import": t_import - t0,
+        "ready": t_ready - t0,
+        "first_response": t_first - t0,
+        "matplotlib_loaded": "matplotlib" in sys.modules,
+        "reportlab_loaded": "reportlab" in sys.modules,
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--eager", action="store_true")
+    ap.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        return child(args.eager)
+
+    results = []
+    for _ in range(args.runs):
+        t = time.perf_counter()
+        cmd = [sys.executable, __file__, "--child"] + (["--eager"] if args.eager else [])
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        r["process"] = time.perf_counter() - t
+        results.append(r)
+
+    print(f"режим: {'eager (reports/charts при імпорті)' if args.eager else 'lazy'}, прогонів: {args.runs}")
+    for key, label in [("import", "import main"), ("ready", "build_app+start"),
+                       ("first_response", "перша відповідь"), ("process", "процес (з інтерпретатором)")]:
+        vals = [r[key] * 1000 for r in results]
+        print(f"  {label:<28} медіана {statistics.median(vals):8.1f} мс   мін {min(vals):8.1f} мс")
+    print(f"  matplotlib завантажено: {results[-1]['matplotlib_loaded']}, reportlab: {results[-1]['reportlab_loaded']}")
+
+
+if __name__ == "__main__":
+    main()
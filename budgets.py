@@ -0,0 +1,147 @@
+# budgets.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# БЮДЖЕТИ ПО КАТЕГОРІЯХ ВИТРАТ
+# Ліміт на користувача/категорію/період (місяць або тиждень) разом із
+# поточною сумою витрат за період (spent) і номером періоду (bucket:
+# YYYYMM для місяця, YYYYMMDD понеділка для тижня). spent оновлюється в тій
+# самій транзакції, що й запис у save_tx (budget_ops), — пошук по PK; новий
+# період обнуляє суму, записи «заднім числом» у минулий період її не
+# чіпають. Тож перевірка ліміту після запису — читання одного-двох рядків
+# по PK, а не підсумовування місяця. Сповіщення «наближаєтесь до ліміту» /
+# «перевищено» надсилаються задачею job_queue, по одному на рівень за період
+# (notified). Ліміт рахується у валюті, в якій його задано; записи в інших
+# валютах на нього не впливають. Імпорт пише повз save_tx — після нього
+# refresh() перераховує суми з rollup-ів.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import os
+import zlib
+from datetime import date, timedelta
+
+BUDGET_WARN = float(os.getenv("BUDGET_WARN", "0.8"))   # частка ліміту для попередження
+EXPENSE = "💸 Витрати"
+
+PERIODS = {"month": "місяць", "week": "тиждень"}
+WARNED, EXCEEDED = 1, 2
+
+# праві частини SET бачать старі значення рядка, тож bucket у CASE — попередній період
+_TRACK = """
+UPDATE budgets SET
+    spent = CASE WHEN ?1 > bucket THEN ?2 WHEN ?1 = bucket THEN spent + ?2 ELSE spent END,
+    notified = CASE WHEN ?1 > bucket THEN 0 ELSE notified END,
+    bucket = MAX(bucket, ?1)
+WHERE user_id = ?3 AND category = ?4 AND period = ?5 AND currency = ?6
+"""
+
+_SPENT = {
+    "month": """SELECT COALESCE(SUM(amount), 0) FROM monthly_rollup
+                WHERE user_id=? AND month=? AND type=? AND category=? AND currency=?""",
+    "week": """SELECT COALESCE(SUM(amount), 0) FROM daily_rollup
+               WHERE user_id=? AND day BETWEEN ? AND ? AND type=? AND category=? AND currency=?""",
+}
+
+
+def _key(dt: date) -> int:
+    return dt.year * 10000 + dt.month * 100 + dt.day
+
+
+def bucket(period: str, day: int) -> int:
+    # день YYYYMMDD -> номер періоду
+    if period == "month":
+        return day // 100
+    dt = date(day // 10000, day // 100 % 100, day % 100)
+    return _key(dt - timedelta(days=dt.weekday()))
+
+
+def budget_ops(user_id, day, ttype, cat, currency, amount):
+    # операції для Storage.write() разом з INSERT транзакції (для бюджетів, яких немає, — нуль рядків)
+    if ttype != EXPENSE:
+        return []
+    return [(_TRACK, (bucket(p, day), float(amount or 0), user_id, cat, p, currency or "")) for p in PERIODS]
+
+
+def ref(category: str) -> str:
+    # коротке стабільне посилання на категорію для callback_data: не залежить від
+    # порядку в CATEGORIES і працює для категорій, яких у дереві вже немає
+    return f"{zlib.crc32(category.encode()):08x}"
+
+
+def level(spent: float, limit: float) -> int:
+    if spent >= limit:
+        return EXCEEDED
+    return WARNED if spent >= limit * BUDGET_WARN else 0
+
+
+def progress_bar(share: float, width: int = 10) -> str:
+    full = min(width, int(share * width))
+    return "▓" * full + "░" * (width - full)
+
+
+def alert_text(category, period, spent, limit, currency) -> str:
+    share = spent / limit if limit else 0
+    head = "🚨 Бюджет перевищено" if level(spent, limit) == EXCEEDED else "⚠️ Бюджет майже вичерпано"
+    return (f"{head}: {category} за {PERIODS[period]}\n"
+            f"{progress_bar(share)} {share * 100:.0f}%\n"
+            f"Витрачено {spent:.2f} з {limit:.2f} {currency}"
+            + (f", понад ліміт {spent - limit:.2f} {currency}." if spent > limit
+               else f", лишилось {limit - spent:.2f} {currency}."))
+
+
+class Budgets:
+    def __init__(self, db):
+        self.db = db
+
+    async def list(self, user_id, today: int):
+        # -> [(category, period, limit, currency, spent у поточному періоді), ...]
+        rows = await self.db.fetchall("""SELECT category, period, limit_amount, currency, bucket, spent
+                                         FROM budgets WHERE user_id=? ORDER BY category, period""", (user_id,))
+        return [(c, p, lim, cur, spent if b == bucket(p, today) else 0.0) for c, p, lim, cur, b, spent in rows]
+
+    async def _current(self, user_id, category, period, currency, today: int) -> float:
+        b = bucket(period, today)
+        if period == "month":
+            params = (user_id, b, EXPENSE, category, currency)
+        else:
+            params = (user_id, b, _key(date(b // 10000, b // 100 % 100, b % 100) + timedelta(days=6)),
+                      EXPENSE, category, currency)
+        return (await self.db.fetchone(_SPENT[period], params))[0]
+
+    async def set(self, user_id, category, period, limit, currency, today: int):
+        # новий або змінений ліміт: поточну суму періоду один раз беремо з rollup-ів
+        spent = await self._current(user_id, category, period, currency, today)
+        await self.db.execute("""INSERT INTO budgets (user_id, category, period, limit_amount, currency, bucket, spent, notified)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                                 ON CONFLICT(user_id, category, period) DO UPDATE SET
+                                     limit_amount=excluded.limit_amount, currency=excluded.currency,
+                                     bucket=excluded.bucket, spent=excluded.spent, notified=excluded.notified""",
+                              (user_id, category, period, limit, currency, bucket(period, today), spent,
+                               level(spent, limit)))
+
+    async def remove(self, user_id, category, period):
+        await self.db.execute("DELETE FROM budgets WHERE user_id=? AND category=? AND period=?",
+                              (user_id, category, period))
+
+    async def refresh(self, user_id, today: int):
+        for c, p, lim, cur, _ in await self.list(user_id, today):
+            spent = await self._current(user_id, c, p, cur, today)
+            await self.db.execute("""UPDATE budgets SET bucket=?, spent=?,
+                                     notified=CASE WHEN bucket=? THEN notified ELSE 0 END
+                                     WHERE user_id=? AND category=? AND period=?""",
+                                  (bucket(p, today), spent, bucket(p, today), user_id, c, p))
+
+    async def check(self, user_id, category, currency, today: int):
+        # після save_tx: -> [(period, spent, limit), ...] рівні, про які ще не сповіщали в цьому періоді
+        rows = await self.db.fetchall("""SELECT period, limit_amount, bucket, spent, notified FROM budgets
+                                         WHERE user_id=? AND category=? AND currency=?""",
+                                      (user_id, category, currency))
+        alerts = []
+        for period, limit, b, spent, notified in rows:
+            lvl = level(spent, limit)
+            if b == bucket(period, today) and lvl > notified:
+                await self.db.execute("""UPDATE budgets SET notified=?
+                                         WHERE user_id=? AND category=? AND period=? AND bucket=?""",
+                                      (lvl, user_id, category, period, b))
+                alerts.append((period, spent, limit))
+        return alerts
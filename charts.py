@@ -0,0 +1,120 @@
+# charts.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ДІАГРАМИ (matplotlib, об’єктний API)
+# Кожен графік — окремий Figure з власним Agg-canvas, без глобального стану
+# pyplot, тож рендери безпечно йдуть паралельно у воркерах RenderService.
+# Результат — PNG-байти, жодних спільних файлів на диску.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import io
+import warnings
+from collections import defaultdict
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib import rcParams
+
+from constants import CATEGORY_EMOJI, CATEGORY_COLORS, TYPES
+
+TYPE_COLORS = {"💸 Витрати": "#E53935", "💰 Надходження": "#43A047", "📈 Інвестиції": "#1E88E5"}
+DPI = 100
+
+_ready = False
+
+
+def _setup():
+    # спільні налаштування шрифтів/стилю — один раз на процес
+    global _ready
+    if not _ready:
+        rcParams.update({"font.family": "DejaVu Sans", "font.size": 9, "axes.titlesize": 11})
+        # у DejaVu немає емодзі — matplotlib попереджає на кожен підпис
+        warnings.filterwarnings("ignore", message="Glyph .* missing from")
+        _ready = True
+
+
+def warm():
+    _setup()
+    # перший savefig тягне кеш шрифтів і PNG-кодек — робимо його до першого користувача
+    fig = Figure(figsize=(1, 1))
+    fig.text(0.5, 0.5, "₴")
+    _render(fig)
+
+
+def _render(fig) -> bytes:
+    buf = io.BytesIO()
+    FigureCanvasAgg(fig)
+    fig.savefig(buf, format="png", dpi=DPI)
+    return buf.getvalue()
+
+
+def _day_label(day: int) -> str:
+    return str(day % 100)
+
+
+def pie_expenses(totals, title):
+    # totals: [(type, category, amount), ...] → PNG або None, якщо витрат немає
+    _setup()
+    sums_by_cat = defaultdict(float)
+    for t, c, a in totals:
+        if t == "💸 Витрати" and a:
+            sums_by_cat[c] += float(a)
+    if not sums_by_cat:
+        return None
+    labels = [f"{CATEGORY_EMOJI.get(k,'')} {k}" for k in sums_by_cat.keys()]
+    values = list(sums_by_cat.values())
+    colors_list = [CATEGORY_COLORS.get(k, "#999999") for k in sums_by_cat.keys()]
+    fig = Figure(figsize=(6.4, 4.8))
+    ax = fig.add_subplot()
+    ax.pie(values, labels=labels, autopct="%1.1f%%", colors=colors_list)
+    ax.set_title(title)
+    fig.tight_layout()
+    return _render(fig)
+
+
+def bar_by_day(day_totals, title, ttype="💸 Витрати"):
+    # day_totals: [(day YYYYMMDD, type, amount), ...] → стовпчики одного типу по днях
+    _setup()
+    per_day = defaultdict(float)
+    for day, t, a in day_totals:
+        if t == ttype and a:
+            per_day[day] += float(a)
+    if not per_day:
+        return None
+    days = sorted(per_day)
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    ax.bar([_day_label(d) for d in days], [per_day[d] for d in days], color=TYPE_COLORS.get(ttype, "#999999"))
+    ax.set_title(title)
+    ax.set_xlabel("День")
+    ax.grid(axis="y", alpha=0.3)
+    fig.tight_layout()
+    return _render(fig)
+
+
+def stacked_by_type(day_totals, title):
+    # стовпчик на кожен день, поділений на витрати/надходження/інвестиції
+    _setup()
+    per_type = {t: defaultdict(float) for t in TYPES}
+    for day, t, a in day_totals:
+        if t in per_type and a:
+            per_type[t][day] += float(a)
+    days = sorted({d for series in per_type.values() for d in series})
+    if not days:
+        return None
+    labels = [_day_label(d) for d in days]
+    fig = Figure(figsize=(8, 4))
+    ax = fig.add_subplot()
+    bottom = [0.0] * len(days)
+    for t in TYPES:
+        values = [per_type[t].get(d, 0.0) for d in days]
+        if any(values):
+            ax.bar(labels, values, bottom=bottom, label=t.split()[-1], color=TYPE_COLORS[t])
+            bottom = [b + v for b, v in zip(bottom, values)]
+    ax.set_title(title)
+    ax.set_xlabel("День")
+    ax.legend()
+    ax.grid(axis="y", alpha=0.3)
+    fig.tight_layout()
+    return _render(fig)
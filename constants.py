@@ -0,0 +1,85 @@
+# constants.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СПІЛЬНІ КОНСТАНТИ: місяці, типи, дерево категорій, емодзі та кольори.
+# Винесені окремо, щоб їх могли імпортувати воркери рендеру (PDF/діаграми)
+# без підняття всього бота.
+# ─────────────────────────────────────────────────────────────────────────────
+
+MONTHS = {
+    1: "Січень", 2: "Лютий", 3: "Березень", 4: "Квітень",
+    5: "Травень", 6: "Червень", 7: "Липень", 8: "Серпень",
+    9: "Вересень", 10: "Жовтень", 11: "Листопад", 12: "Грудень"
+}
+MONTHS_BY_NAME = {v: k for k, v in MONTHS.items()}
+QUARTERS = {1: "I", 2: "II", 3: "III", 4: "IV"}
+
+TYPES = ["💸 Витрати", "💰 Надходження", "📈 Інвестиції"]
+CURRENCIES = ["грн", "$"]
+
+CATEGORIES = {
+    "💸 Витрати": {
+        "Харчування": ["Кафе", "Супермаркет/ринок", "Гульки", "Трати на роботі"],
+        "Одяг та взуття": ["Секонд", "Фізичний магазин", "Онлайн"],
+        "Оренда/житло": None,
+        "Господарчі товари": None,
+        "Дорога/подорожі": ["Маршрутки", "Автобуси/дальність"],
+        "Онлайн підписки": ["iCloud", "YouTube", "Prom"],
+        "Поповнення мобільного": None,
+        "Розваги": None,
+        "Vodafone": ["Чай/поповнення", "Сім-карти"],
+        "Інше": None,
+    },
+    "📈 Інвестиції": {
+        "Крипта": None,
+        "Зарядні пристрої": None,
+        "Hub station": None,
+        "Акаунти": None,
+        "Купівля $": None,
+    },
+    "💰 Надходження": {
+        "Зарплата": None,
+        "Переказ": None,
+        "Інше": None,
+    },
+}
+
+CATEGORY_EMOJI = {
+    "Харчування": "🍔",
+    "Одяг та взуття": "👕",
+    "Оренда/житло": "🏠",
+    "Господарчі товари": "🧴",
+    "Дорога/подорожі": "🚌",
+    "Онлайн підписки": "📲",
+    "Поповнення мобільного": "📶",
+    "Розваги": "🎉",
+    "Vodafone": "📡",
+    "Крипта": "🪙",
+    "Зарядні пристрої": "🔌",
+    "Hub station": "🖥️",
+    "Акаунти": "👤",
+    "Купівля $": "💵",
+    "Зарплата": "💼",
+    "Переказ": "🔁",
+    "Інше": "➕",
+}
+CATEGORY_COLORS = {
+    "Харчування": "#FF9800",
+    "Одяг та взуття": "#3F51B5",
+    "Оренда/житло": "#009688",
+    "Господарчі товари": "#795548",
+    "Дорога/подорожі": "#4CAF50",
+    "Онлайн підписки": "#9C27B0",
+    "Поповнення мобільного": "#607D8B",
+    "Розваги": "#673AB7",
+    "Vodafone": "#E91E63",
+    "Крипта": "#FBC02D",
+    "Зарядні пристрої": "#8BC34A",
+    "Hub station": "#00BCD4",
+    "Акаунти": "#CDDC39",
+    "Купівля $": "#FF5722",
+    "Зарплата": "#2196F3",
+    "Переказ": "#00ACC1",
+    "Інше": "#9E9E9E",
+}
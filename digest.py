@@ -0,0 +1,242 @@
+# digest.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ЩОМІСЯЧНИЙ ПІДСУМОК ДЛЯ ВСІХ КОРИСТУВАЧІВ
+# 1-го числа (job_queue.run_monthly) кожен, хто мав записи минулого місяця,
+# отримує текст із підсумками, діаграму витрат і, якщо DIGEST_PDF=1, PDF.
+# Користувачі йдуть пачками по DIGEST_CHUNK за user_id (keyset, без OFFSET);
+# на пачку — кілька запитів до monthly_rollup/daily_rollup з IN (...), а не
+# fetch_month на кожного. Рендер — в окремому пулі процесів, тож інтерактивні
+# PDF/діаграми не отримують «зайнято»; відправка — з пріоритетом BULK через
+# SendScheduler (outbound.py), тож розсилка не відбирає ліміти в живих відповідей.
+# Прогрес (останній user_id завершеної пачки) пишеться в digest_runs після
+# кожної пачки: після рестарту розсилка продовжується з наступної пачки
+# (користувачі з перерваної пачки можуть отримати підсумок двічі).
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, time as dtime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from telegram import InputFile
+from telegram.error import BadRequest, Forbidden
+
+import metrics
+from constants import MONTHS, CATEGORY_EMOJI, TYPES
+from migrations import month_range
+from outbound import BULK
+from render import RenderService
+
+DIGEST_CHUNK = int(os.getenv("DIGEST_CHUNK", "200"))
+DIGEST_CONCURRENCY = int(os.getenv("DIGEST_CONCURRENCY", "8"))
+DIGEST_RENDER_WORKERS = int(os.getenv("DIGEST_RENDER_WORKERS", "2"))
+DIGEST_PDF = os.getenv("DIGEST_PDF", "0") == "1"
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "10"))
+DIGEST_CATCHUP_DAYS = int(os.getenv("DIGEST_CATCHUP_DAYS", "3"))
+DIGEST_TOP = 5
+
+try:
+    DIGEST_TZ = ZoneInfo(os.getenv("DIGEST_TZ", "Europe/Kyiv"))
+except ZoneInfoNotFoundError:
+    DIGEST_TZ = timezone.utc
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def send_time() -> dtime:
+    return dtime(hour=DIGEST_HOUR, tzinfo=DIGEST_TZ)
+
+
+def previous_month(now: datetime):
+    first = now.replace(day=1)
+    prev = first - timedelta(days=1)
+    return prev.year, prev.month
+
+
+def _placeholders(n: int) -> str:
+    return ",".join("?" * n)
+
+
+def digest_text(name, y, m, totals, currency) -> str:
+    # totals: [(type, category, amount), ...] у валюті користувача
+    by_type = defaultdict(float)
+    by_cat = defaultdict(float)
+    for t, c, a in totals:
+        by_type[t] += a
+        if t == "💸 Витрати":
+            by_cat[c] += a
+    exp = by_type["💸 Витрати"]
+    lines = [
+        f"📊 ПІДСУМОК ЗА {MONTHS[m].upper()} {y}",
+        "━━━━━━━━━━━━━━━━━━━",
+    ]
+    if name:
+        lines.append(f"👤 {name}")
+    lines += [f"{t}: {by_type[t]:.2f} {currency}" for t in TYPES]
+    lines.append(f"⚖️ Баланс: {by_type['💰 Надходження'] - exp:+.2f} {currency}")
+    if by_cat:
+        lines.append("\nНайбільші витрати:")
+        for c, a in sorted(by_cat.items(), key=lambda kv: -kv[1])[:DIGEST_TOP]:
+            share = a / exp * 100 if exp else 0
+            lines.append(f"• {CATEGORY_EMOJI.get(c, '')} {c} — {a:.2f} {currency} ({share:.0f}%)")
+    return "\n".join(lines)
+
+
+class MonthlyDigest:
+    def __init__(self, db, convert, chunk: int = DIGEST_CHUNK, concurrency: int = DIGEST_CONCURRENCY,
+                 render_workers: int = DIGEST_RENDER_WORKERS, with_pdf: bool = DIGEST_PDF):
+        # convert(amounts, currencies, days, to_currency) -> суми у to_currency (див. RateHistory.convert)
+        self.db = db
+        self.convert = convert
+        self.chunk = chunk
+        self.concurrency = concurrency
+        self.render_workers = render_workers
+        self.with_pdf = with_pdf
+        self._running = False
+
+    # ---------- прогрес ----------
+    async def progress(self, month: int):
+        # -> (last_user_id, sent, skipped, failed, finished_at) або None
+        return await self.db.fetchone("""SELECT last_user_id, sent, skipped, failed, finished_at
+                                         FROM digest_runs WHERE month=?""", (month,))
+
+    async def _checkpoint(self, month, last_user_id, sent, skipped, failed, finished=False):
+        await self.db.execute("""UPDATE digest_runs SET last_user_id=?, sent=sent+?, skipped=skipped+?, failed=failed+?,
+                                 finished_at=CASE WHEN ? THEN ? ELSE finished_at END WHERE month=?""",
+                              (last_user_id, sent, skipped, failed, finished,
+                               datetime.utcnow().isoformat(), month))
+
+    def due(self, now: datetime, run) -> bool:
+        # догоняюча перевірка при старті: незавершена розсилка — продовжуємо;
+        # не розпочата — лише якщо час уже настав і від 1-го минуло не більше DIGEST_CATCHUP_DAYS
+        if run is not None:
+            return run[4] is None
+        return now.day <= DIGEST_CATCHUP_DAYS and (now.day > 1 or now.hour >= DIGEST_HOUR)
+
+    # ---------- масові вибірки на пачку ----------
+    async def _users(self, after: int):
+        return await self.db.fetchall("""SELECT user_id, name, COALESCE(NULLIF(currency, ''), 'грн') FROM users
+                                         WHERE user_id > ? ORDER BY user_id LIMIT ?""", (after, self.chunk))
+
+    async def _totals(self, users, y, m):
+        # -> {user_id: [(type, category, amount), ...]} у валюті кожного користувача
+        currency = {uid: cur for uid, _, cur in users}
+        ids = list(currency)
+        rows = await self.db.fetchall(f"""SELECT user_id, type, category, currency, SUM(amount) FROM monthly_rollup
+                                          WHERE user_id IN ({_placeholders(len(ids))}) AND month = ?
+                                          GROUP BY user_id, type, category, currency""", (*ids, y * 100 + m))
+        sums = defaultdict(lambda: defaultdict(float))
+        foreign = set()
+        for uid, t, c, cur, a in rows:
+            if cur in (currency[uid], ""):
+                sums[uid][(t, c)] += a
+            else:
+                foreign.add(uid)
+        if foreign:
+            # записи в іншій валюті — поденно, щоб перерахувати за курсом на дату операції
+            fids = sorted(foreign)
+            daily = await self.db.fetchall(f"""SELECT user_id, day, type, category, currency, SUM(amount) FROM daily_rollup
+                                               WHERE user_id IN ({_placeholders(len(fids))}) AND day BETWEEN ? AND ?
+                                               GROUP BY user_id, day, type, category, currency""",
+                                           (*fids, *month_range(y, m)))
+            by_target = defaultdict(list)
+            for r in daily:
+                if r[4] not in (currency[r[0]], ""):
+                    by_target[currency[r[0]]].append(r)
+            for target, rs in by_target.items():
+                amounts = await self.convert([r[5] for r in rs], [r[4] for r in rs], [r[1] for r in rs], target)
+                for (uid, _, t, c, _, _), a in zip(rs, amounts):
+                    sums[uid][(t, c)] += float(a)
+        return {uid: [(t, c, a) for (t, c), a in s.items()] for uid, s in sums.items()}
+
+    async def _rows(self, ids, y, m):
+        # рядки для PDF одним запитом по idx_tx_user_day
+        rows = await self.db.fetchall(f"""SELECT user_id, type, category, subcategory, amount, currency, comment
+                                          FROM transactions WHERE user_id IN ({_placeholders(len(ids))})
+                                          AND day BETWEEN ? AND ? ORDER BY user_id, day, id""",
+                                      (*ids, *month_range(y, m)))
+        out = defaultdict(list)
+        for uid, *rest in rows:
+            out[uid].append(tuple(rest))
+        return out
+
+    # ---------- відправка одному користувачу ----------
+    async def _deliver(self, bot, renderer, uid, name, currency, totals, rows, y, m) -> str:
+        title = f"{MONTHS[m]} {y}"
+        try:
+            await bot.send_message(uid, digest_text(name, y, m, totals, currency), rate_limit_args=BULK)
+            pie = await renderer.submit("charts:pie_expenses", totals, f"Розподіл витрат — {title}")
+            if pie:
+                await bot.send_photo(uid, pie, rate_limit_args=BULK)
+            if rows is not None:
+                pdf = await renderer.submit("reports:make_pdf", rows, f"📆 {title}", totals, currency)
+                await bot.send_document(uid, InputFile(pdf, filename=f"report_{y}_{m:02d}.pdf"),
+                                        caption=f"📆 {title}", rate_limit_args=BULK)
+            return "sent"
+        except (Forbidden, BadRequest) as exc:
+            # бота заблоковано / чат недоступний — це не збій розсилки
+            _LOGGER.info("Підсумок для %s не доставлено: %s", uid, exc)
+            return "skipped"
+        except Exception:
+            _LOGGER.exception("Підсумок для %s: помилка", uid)
+            return "failed"
+
+    # ---------- розсилка ----------
+    async def run(self, bot, y: int | None = None, m: int | None = None, catchup: bool = False):
+        if self._running:
+            return None
+        now = datetime.now(DIGEST_TZ)
+        if y is None:
+            y, m = previous_month(now)
+        month = y * 100 + m
+        run = await self.progress(month)
+        if catchup and not self.due(now, run):
+            return None
+        if run is not None and run[4] is not None:
+            return run
+        self._running = True
+        renderer = RenderService(workers=self.render_workers, max_pending=self.concurrency)
+        try:
+            if run is None:
+                await self.db.execute("INSERT OR IGNORE INTO digest_runs (month, started_at) VALUES (?, ?)",
+                                      (month, datetime.utcnow().isoformat()))
+                after = 0
+            else:
+                after = run[0]
+                _LOGGER.info("Підсумок за %s: продовжуємо після user_id=%s", month, after)
+            await renderer.warm()
+            gate = asyncio.Semaphore(self.concurrency)
+            while True:
+                users = await self._users(after)
+                if not users:
+                    break
+                totals = await self._totals(users, y, m)
+                active = [u for u in users if totals.get(u[0])]
+                rows = await self._rows([u[0] for u in active], y, m) if self.with_pdf and active else {}
+
+                async def one(uid, name, currency):
+                    async with gate:
+                        return await self._deliver(bot, renderer, uid, name, currency, totals[uid],
+                                                   rows.get(uid, []) if self.with_pdf else None, y, m)
+
+                results = await asyncio.gather(*(one(*u) for u in active))
+                # skipped — лише заблоковані/недоступні чати; без записів за місяць — окремо, лише в метриці
+                counts = {"sent": 0, "skipped": 0, "failed": 0}
+                for r in results:
+                    counts[r] += 1
+                after = users[-1][0]
+                await self._checkpoint(month, after, counts["sent"], counts["skipped"], counts["failed"])
+                for k, v in {**counts, "inactive": len(users) - len(active)}.items():
+                    metrics.inc("digest_users_total", v, result=k)
+            await self._checkpoint(month, after, 0, 0, 0, finished=True)
+            run = await self.progress(month)
+            _LOGGER.info("Підсумок за %s розіслано: %s надіслано, %s недоступних чатів, %s збоїв",
+                         month, run[1], run[2], run[3])
+            return run
+        finally:
+            self._running = False
+            await asyncio.to_thread(renderer.shutdown)
@@ -0,0 +1,100 @@
+# dispatch.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ПАРАЛЕЛЬНА ОБРОБКА АПДЕЙТІВ ЗІ ЗБЕРЕЖЕННЯМ ПОРЯДКУ ДЛЯ КОЖНОГО КОРИСТУВАЧА
+# Стандартний concurrent_updates у PTB 20.3 не гарантує порядок в межах
+# одного чату, а ConversationHandler на це розраховує. Тут кожен користувач
+# має свою «смугу» (чергу): апдейти різних людей виконуються паралельно
+# (не більше MAX_CONCURRENT одночасно), апдейти однієї людини — строго по
+# черзі. Якщо в обробці вже MAX_PENDING апдейтів, ми перестаємо забирати
+# нові з update_queue; вона обмежена за розміром, тож webhook-запит від
+# Telegram чекає (а при таймауті Telegram повторить його пізніше).
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import logging
+import os
+from collections import deque
+
+from telegram import Update
+from telegram.ext import Application
+# PTB кладе цей маркер у update_queue в Application.stop(); версія закріплена (==20.3)
+from telegram.ext._application import _STOP_SIGNAL
+
+MAX_CONCURRENT = int(os.getenv("MAX_CONCURRENT_UPDATES", "32"))
+MAX_PENDING = int(os.getenv("MAX_PENDING_UPDATES", "512"))
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _lane_key(update):
+    if isinstance(update, Update):
+        if update.effective_user:
+            return ("user", update.effective_user.id)
+        if update.effective_chat:
+            return ("chat", update.effective_chat.id)
+    return ("anon", id(update))
+
+
+class OrderedApplication(Application):
+    def __init__(self, *, max_concurrent: int = MAX_CONCURRENT, max_pending: int = MAX_PENDING, **kwargs):
+        super().__init__(**kwargs)
+        self.max_concurrent = max_concurrent
+        self.max_pending = max_pending
+        self._lanes = {}
+        self._in_flight = 0
+
+    @property
+    def pending_updates(self) -> int:
+        # апдейти, прийняті в обробку, але ще не завершені (включно з тими, що чекають у смугах)
+        return self._in_flight
+
+    @property
+    def active_lanes(self) -> int:
+        return len(self._lanes)
+
+    async def _update_fetcher(self) -> None:
+        workers = set()
+        running = asyncio.Semaphore(self.max_concurrent)
+        capacity = asyncio.Semaphore(self.max_pending)
+        while True:
+            update = await self.update_queue.get()
+            if update is _STOP_SIGNAL:
+                # Application.stop(): доробляємо все прийняте і виходимо
+                await asyncio.gather(*workers, return_exceptions=True)
+                while not self.update_queue.empty():
+                    self.update_queue.get_nowait()
+                    self.update_queue.task_done()
+                self.update_queue.task_done()
+                return
+            await capacity.acquire()
+            self._in_flight += 1
+            key = _lane_key(update)
+            lane = self._lanes.get(key)
+            if lane is not None:
+                lane.append(update)
+                continue
+            self._lanes[key] = deque([update])
+            task = asyncio.create_task(self._run_lane(key, running, capacity))
+            workers.add(task)
+            task.add_done_callback(workers.discard)
+
+    async def _run_lane(self, key, running, capacity):
+        lane = self._lanes[key]
+        try:
+            while lane:
+                update = lane[0]
+                try:
+                    async with running:
+                        await self.process_update(update)
+                except Exception:
+                    _LOGGER.exception("Помилка обробки апдейту %s", update)
+                finally:
+                    lane.popleft()
+                    self._in_flight -= 1
+                    capacity.release()
+                    self.update_queue.task_done()
+        finally:
+            # між останньою перевіркою lane і цим рядком немає await — нові апдейти не загубляться
+            del self._lanes[key]
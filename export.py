@@ -0,0 +1,74 @@
+# export.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ЕКСПОРТ ІСТОРІЇ ТРАНЗАКЦІЙ (CSV / NDJSON, gzip)
+# Дешева машиночитна альтернатива історичному PDF. write_export() виконується
+# у воркері рендеру: власне read-only з’єднання, курсор по idx_tx_user_day,
+# fetchmany пачками по EXPORT_CHUNK і запис одразу в gzip-файл на диску —
+# пам’ять не залежить від кількості записів. Колонки CSV (COLUMNS нижче) —
+# власний формат бота, який розпізнає імпорт (importer.HEADER_ALIASES),
+# тож розпакований експорт можна завантажити назад.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import calendar
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+
+EXPORT_CHUNK = 1000
+FORMATS = {"csv": ".csv.gz", "json": ".ndjson.gz"}
+
+# власний формат бота; importer.py розпізнає саме ці колонки
+COLUMNS = ["date", "type", "category", "subcategory", "amount", "currency", "comment"]
+
+
+def parse_period(arg: str, end: bool = False) -> int:
+    # "2025", "2025-03", "2025-03-14" -> YYYYMMDD (початок або, якщо end, кінець періоду)
+    parts = [int(p) for p in arg.strip().split("-")]
+    if not 1 <= len(parts) <= 3 or not 1900 <= parts[0] <= 9999:
+        raise ValueError(arg)
+    y = parts[0]
+    m = parts[1] if len(parts) > 1 else (12 if end else 1)
+    if len(parts) > 2:
+        d = parts[2]
+    else:
+        d = calendar.monthrange(y, m)[1] if end else 1
+    if not (1 <= m <= 12 and 1 <= d <= calendar.monthrange(y, m)[1]):
+        raise ValueError(arg)
+    return y * 10000 + m * 100 + d
+
+
+def write_export(db_path, user_id, fmt="csv", lo=0, hi=99999999) -> str:
+    # -> шлях до тимчасового .gz; видаляє його той, хто відправляє
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=FORMATS[fmt])
+    os.close(fd)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        cur = conn.execute("""SELECT date, type, category, subcategory, amount, currency, comment
+                              FROM transactions WHERE user_id=? AND day BETWEEN ? AND ?
+                              ORDER BY day, id""", (user_id, lo, hi))
+        with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=6) as f:
+            writer = csv.writer(f) if fmt == "csv" else None
+            if writer:
+                writer.writerow(COLUMNS)
+            while True:
+                chunk = cur.fetchmany(EXPORT_CHUNK)
+                if not chunk:
+                    break
+                if writer:
+                    writer.writerows((date[:10] if date else "", t, c, s or "", a, curx, com or "")
+                                     for date, t, c, s, a, curx, com in chunk)
+                else:
+                    f.writelines(json.dumps(dict(zip(COLUMNS, (date[:10] if date else None, *rest))),
+                                            ensure_ascii=False) + "\n"
+                                 for date, *rest in chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        conn.close()
+    return path
@@ -0,0 +1,343 @@
+# importer.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ІМПОРТ CSV / БАНКІВСЬКИХ ВИПИСОК
+# Користувач надсилає файл документом — бот читає його потоково (рядок за
+# рядком, у потоці, без завантаження всього файлу в пам’ять) і додає записи
+# пачками по IMPORT_BATCH: одна транзакція на пачку, у якій INSERT-и та
+# оновлення rollup-ів згруповані так, що Storage виконує їх трьома executemany
+# (плюс один перерахунок префіксних сум, див. rollups.bulk_rollup_ops).
+#
+# Формат розпізнається за заголовком (він може йти не першим рядком, як у
+# виписках Приватбанку): власний CSV бота (date,type,category,subcategory,
+# amount,currency,comment — його ж дає /export), виписка monobank (MCC,
+# «Сума в валюті картки (UAH)»), виписка Приват24 («Категорія», «Опис
+# операції»). Кодування — UTF-8 або CP1251, роздільник — «,», «;» або Tab.
+#
+# Категорію визначає RULES: MCC-коди і ключові слова в описі/категорії банку
+# → (тип, категорія, підкатегорія) з дерева CATEGORIES. Знак суми визначає
+# напрям: від’ємні — витрати (або інвестиції), додатні — надходження.
+# Дублікати: рядок пропускається, якщо в БД уже є запис з тим самим днем,
+# типом, сумою і валютою (кожен наявний запис «гасить» один рядок файлу,
+# тож дві однакові кави за день у виписці не злипаються в одну).
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import csv
+import os
+import re
+from collections import Counter
+from datetime import datetime
+
+from constants import CATEGORIES
+from rollups import bulk_rollup_ops
+
+IMPORT_BATCH = int(os.getenv("IMPORT_BATCH", "1000"))
+IMPORT_MAX_MB = int(os.getenv("IMPORT_MAX_MB", "20"))   # Bot API віддає ботам файли до 20 МБ
+HEADER_SCAN_ROWS = 30
+SNIFF_BYTES = 64 * 1024
+MAX_ERRORS_SHOWN = 5
+
+EXPENSE, INCOME, INVEST = "💸 Витрати", "💰 Надходження", "📈 Інвестиції"
+
+# назва колонки у файлі (нижній регістр) → поле; перший збіг виграє
+HEADER_ALIASES = {
+    "date": ["date", "дата", "дата i час операції", "дата і час операції", "дата операції",
+             "дата транзакції", "дата та час"],
+    "amount": ["amount", "сума", "сума в валюті картки", "сума операції", "сума в валюті рахунку"],
+    "currency": ["currency", "валюта картки", "валюта рахунку", "валюта"],
+    "type": ["type", "тип"],
+    "category": ["category", "категорія"],
+    "subcategory": ["subcategory", "підкатегорія"],
+    "comment": ["comment", "коментар", "деталі операції", "опис операції", "опис", "призначення платежу",
+                "description"],
+    "mcc": ["mcc"],
+}
+
+CURRENCY_ALIASES = {"грн": "грн", "uah": "грн", "₴": "грн", "$": "$", "usd": "$"}
+
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y",
+                "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%d/%m/%Y", "%d.%m.%y")
+
+
+def _mcc(*spans):
+    out = set()
+    for s in spans:
+        out.update(range(s[0], s[1] + 1) if isinstance(s, tuple) else (s,))
+    return frozenset(out)
+
+
+# (тип, категорія, підкатегорія, MCC-коди, регулярка по опису + категорії банку); перше правило виграє
+RULES = [
+    (EXPENSE, "Vodafone", "Чай/поповнення", frozenset(), r"vodafone|водафон"),
+    (EXPENSE, "Поповнення мобільного", None, _mcc(4814), r"київстар|kyivstar|lifecell|мобільн"),
+    (EXPENSE, "Онлайн підписки", "iCloud", frozenset(), r"icloud|apple\.com"),
+    (EXPENSE, "Онлайн підписки", "YouTube", frozenset(), r"youtube"),
+    (EXPENSE, "Онлайн підписки", "Prom", frozenset(), r"prom\.ua|\bprom\b"),
+    (EXPENSE, "Онлайн підписки", None, _mcc((5815, 5818)), r"netflix|spotify|megogo|google|підписк"),
+    (INVEST, "Крипта", None, _mcc(6051), r"binance|whitebit|kuna|bybit|крипт"),
+    (INVEST, "Купівля $", None, frozenset(), r"купівля валют|обмін валют|купівля usd"),
+    (EXPENSE, "Харчування", "Кафе", _mcc((5812, 5814)), r"кафе|кав['’]?ярн|coffee|ресторан|mcdonald|kfc|пузата"),
+    (EXPENSE, "Харчування", "Супермаркет/ринок", _mcc(5411, 5412, 5422, 5441, 5451, 5462, 5499),
+     r"сільпо|атб|novus|ашан|auchan|metro|фора|varus|ринок|супермаркет|продукт"),
+    (EXPENSE, "Одяг та взуття", "Секонд", _mcc(5931), r"секонд|second|humana"),
+    (EXPENSE, "Одяг та взуття", "Онлайн", frozenset(), r"rozetka.*одяг|lamoda|answear|zara\.com"),
+    (EXPENSE, "Одяг та взуття", "Фізичний магазин", _mcc((5611, 5699)), r"одяг|взутт"),
+    (EXPENSE, "Дорога/подорожі", "Автобуси/дальність", _mcc(4112, 4131, 4511, (3000, 3299)),
+     r"укрзалізниц|uz\.gov|flixbus|busfor|автобус|авіа"),
+    (EXPENSE, "Дорога/подорожі", "Маршрутки", _mcc(4111), r"маршрут|метро|проїзд"),
+    (EXPENSE, "Дорога/подорожі", None, _mcc(4121, 5541, 5542), r"uber|bolt|uklon|таксі|wog|окко|азс|пальне"),
+    (EXPENSE, "Оренда/житло", None, _mcc(4900, 6513), r"оренд|комунал|квартплат|осбб|газопостач|нафтогаз|електроенерг"),
+    (EXPENSE, "Господарчі товари", None, _mcc(5200, 5251, 5712, 5719, 5722, 5912),
+     r"епіцентр|нова лінія|\beva\b|watsons|аптек|господар"),
+    (EXPENSE, "Розваги", None, _mcc(7832, 7841, 7922, 7991, 7996, 7999), r"кіно|multiplex|planeta|концерт|театр|розваг"),
+    (INCOME, "Зарплата", None, frozenset(), r"зарплат|заробітн|salary|аванс|премі"),
+    (INCOME, "Переказ", None, frozenset(), r"переказ|transfer|від:|з картки|поповнення картки"),
+]
+_RULES = [(t, c, s, mccs, re.compile(rx, re.IGNORECASE) if rx else None) for t, c, s, mccs, rx in RULES]
+DEFAULT_CATEGORY = {EXPENSE: "Інше", INCOME: "Інше"}
+
+
+class StatementError(Exception):
+    # файл не схожий на підтримувану виписку (нема заголовка з датою і сумою)
+    pass
+
+
+def classify(sign: int, text: str, mcc):
+    # -> (тип, категорія, підкатегорія) за RULES; sign < 0 — витрата/інвестиція, > 0 — надходження
+    for t, c, s, mccs, rx in _RULES:
+        if (t == INCOME) != (sign > 0):
+            continue
+        if (mcc is not None and mcc in mccs) or (rx is not None and rx.search(text)):
+            return t, c, s
+    t = INCOME if sign > 0 else EXPENSE
+    return t, DEFAULT_CATEGORY[t], None
+
+
+def parse_amount(raw: str) -> float:
+    s = raw.strip().replace(" ", "").replace("\u00a0", "").replace("\u202f", "").replace("\u2212", "-")
+    s = re.sub(r"[^\d,.\-+]", "", s)
+    if "," in s and "." in s:
+        s = s.replace(",", "") if s.rfind(".") > s.rfind(",") else s.replace(".", "").replace(",", ".")
+    else:
+        s = s.replace(",", ".")
+    return float(s)
+
+
+def parse_date(raw: str) -> str:
+    raw = raw.strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"дата {raw!r}")
+
+
+def _detect_encoding(head: bytes) -> str:
+    try:
+        head.decode("utf-8")
+        return "utf-8-sig"
+    except UnicodeDecodeError as exc:
+        # обрізаний посередині багатобайтовий символ у кінці шматка — все ж UTF-8
+        if exc.start >= len(head) - 3:
+            return "utf-8-sig"
+        return "cp1251"
+
+
+def _map_header(row):
+    # -> ({поле: індекс колонки}, валюта з назви колонки суми, напр. «(UAH)») або (None, None)
+    names = [c.strip().lower() for c in row]
+    plain = [re.sub(r"\s*\(.*\)$", "", n) for n in names]
+    cols = {}
+    for field, aliases in HEADER_ALIASES.items():
+        for alias in aliases:
+            if alias in plain:
+                cols[field] = plain.index(alias)
+                break
+    if "date" not in cols or "amount" not in cols:
+        return None, None
+    m = re.search(r"\((\w+)\)$", names[cols["amount"]])
+    return cols, (CURRENCY_ALIASES.get(m.group(1).lower()) if m else None)
+
+
+def _find_header(sample: str):
+    # -> (роздільник, номер рядка заголовка, колонки, валюта суми); перед заголовком може бути «шапка» виписки
+    lines = sample.splitlines()[:HEADER_SCAN_ROWS]
+    for delimiter in sorted(",;\t", key=lambda d: -sample.count(d)):
+        reader = csv.reader(lines, delimiter=delimiter)
+        for row in reader:
+            cols, currency = _map_header(row)
+            if cols:
+                return delimiter, reader.line_num, cols, currency
+    raise StatementError("не знайдено заголовка з колонками дати і суми")
+
+
+class StatementParser:
+    # синхронний потоковий розбір; batches() викликається через asyncio.to_thread пачка за пачкою
+    def __init__(self, path: str, default_currency: str = "грн"):
+        self.path = path
+        self.default_currency = default_currency
+        self.size = os.path.getsize(path)
+        self.read_bytes = 0
+        self.rows = 0          # рядків даних (без заголовка і порожніх)
+        self.errors = []       # (номер рядка, причина) — перші MAX_ERRORS_SHOWN
+        self.n_errors = 0
+
+    def _lines(self, f, encoding):
+        for raw in f:
+            self.read_bytes += len(raw)
+            yield raw.decode(encoding, errors="replace")
+
+    def _error(self, lineno, reason):
+        self.n_errors += 1
+        if len(self.errors) < MAX_ERRORS_SHOWN:
+            self.errors.append((lineno, reason))
+
+    def batches(self, size: int = IMPORT_BATCH):
+        # -> ітератор списків (date_str, day, type, category, subcategory, amount, currency, comment)
+        with open(self.path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+            encoding = _detect_encoding(head)
+            delimiter, header_line, cols, fixed_currency = _find_header(head.decode(encoding, errors="ignore"))
+            f.seek(0)
+            reader = csv.reader(self._lines(f, encoding), delimiter=delimiter)
+            for _ in reader:
+                if reader.line_num >= header_line:
+                    break
+            batch = []
+            for row in reader:
+                if not any(c.strip() for c in row):
+                    continue
+                self.rows += 1
+                try:
+                    batch.append(self._convert(row, cols, fixed_currency))
+                except (ValueError, IndexError, KeyError) as exc:
+                    self._error(reader.line_num, str(exc) or exc.__class__.__name__)
+                    continue
+                if len(batch) >= size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    def _convert(self, row, cols, fixed_currency):
+        def get(field):
+            i = cols.get(field)
+            return row[i].strip() if i is not None and i < len(row) else ""
+
+        date_str = parse_date(get("date"))
+        amount = parse_amount(get("amount"))
+        if amount == 0:
+            raise ValueError("нульова сума")
+        currency = fixed_currency
+        if currency is None:
+            raw_currency = get("currency")
+            currency = CURRENCY_ALIASES.get(raw_currency.lower()) if raw_currency else self.default_currency
+            if currency is None:
+                raise ValueError(f"валюта {raw_currency!r}")
+        comment = get("comment") or None
+        ttype, cat, sub = get("type"), get("category"), get("subcategory") or None
+        if ttype in CATEGORIES and cat in CATEGORIES[ttype]:
+            # власний формат: тип і категорія вже з дерева, сума додатна
+            subs = CATEGORIES[ttype][cat]
+            sub = sub if subs and sub in subs else None
+        else:
+            mcc = get("mcc")
+            text = " ".join(filter(None, (comment, cat)))
+            sign = -1 if amount < 0 else 1
+            if ttype in CATEGORIES:
+                sign = 1 if ttype == INCOME else -1
+            ttype, cat, sub = classify(sign, text, int(mcc) if mcc.isdigit() else None)
+        return date_str, int(date_str.replace("-", "")), ttype, cat, sub, round(abs(amount), 2), currency, comment
+
+
+def dedup_key(day, ttype, amount, currency):
+    return day, ttype, round(amount * 100), currency
+
+
+INSERT_TX = """INSERT INTO transactions (user_id, type, category, subcategory, amount, currency, comment, date, day, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+class Importer:
+    def __init__(self, db, on_batch=None, batch: int = IMPORT_BATCH):
+        # on_batch(user_id, days) — після кожної пачки (напр. інвалідація кешу рендерів)
+        self.db = db
+        self.on_batch = on_batch
+        self.batch = batch
+        self._active = set()
+
+    def busy(self, user_id) -> bool:
+        return user_id in self._active
+
+    def reserve(self, user_id) -> bool:
+        # зайняти користувача до запуску фонової задачі: False, якщо імпорт уже йде
+        if user_id in self._active:
+            return False
+        self._active.add(user_id)
+        return True
+
+    def release(self, user_id):
+        self._active.discard(user_id)
+
+    async def _existing(self, user_id, days, seen_days, budget: Counter):
+        # наявні записи за ще не завантажені дні — один діапазонний запит по idx_tx_user_day
+        new_days = {d for d in days if d not in seen_days}
+        if not new_days:
+            return
+        rows = await self.db.fetchall("""SELECT day, type, amount, currency FROM transactions
+                                         WHERE user_id=? AND day BETWEEN ? AND ?""",
+                                      (user_id, min(new_days), max(new_days)))
+        for day, t, a, cur in rows:
+            if day in new_days:
+                budget[dedup_key(day, t, float(a or 0), cur)] += 1
+        seen_days |= new_days
+
+    async def run(self, user_id, path, default_currency="грн", progress=None, reserved=False):
+        # -> dict зі статистикою; progress(stats) — async, після кожної пачки.
+        # reserved=True — користувача вже зайняв reserve(), звільняє той, хто викликав
+        if not reserved and not self.reserve(user_id):
+            raise RuntimeError("імпорт уже виконується")
+        parser = StatementParser(path, default_currency)
+        stats = {"rows": 0, "added": 0, "duplicates": 0, "errors": 0, "percent": 0, "error_lines": parser.errors}
+        seen_days, budget = set(), Counter()
+        try:
+            it = parser.batches(self.batch)
+            while True:
+                batch = await asyncio.to_thread(next, it, None)
+                if batch is None:
+                    break
+                await self._existing(user_id, {r[1] for r in batch}, seen_days, budget)
+                fresh = []
+                for r in batch:
+                    key = dedup_key(r[1], r[2], r[5], r[6])
+                    if budget[key] > 0:
+                        budget[key] -= 1
+                        stats["duplicates"] += 1
+                    else:
+                        fresh.append(r)
+                if fresh:
+                    await self.db.write(self._ops(user_id, fresh))
+                    if self.on_batch:
+                        self.on_batch(user_id, {r[1] for r in fresh})
+                stats["added"] += len(fresh)
+                stats["rows"], stats["errors"] = parser.rows, parser.n_errors
+                stats["percent"] = min(99, parser.read_bytes * 100 // max(parser.size, 1))
+                if progress:
+                    await progress(stats)
+            stats["rows"], stats["errors"], stats["percent"] = parser.rows, parser.n_errors, 100
+            return stats
+        finally:
+            if not reserved:
+                self.release(user_id)
+
+    @staticmethod
+    def _ops(user_id, rows):
+        # однакові SQL підряд: Storage зливає їх у executemany (INSERT-и, денні, місячні rollup-и),
+        # наприкінці — один перерахунок префіксних сум
+        created = datetime.utcnow().isoformat()
+        tx = [(INSERT_TX, (user_id, t, c, s, amount, cur, comment, date_str, day, created))
+              for date_str, day, t, c, s, amount, cur, comment in rows]
+        return tx + bulk_rollup_ops(user_id, [(day, t, c, cur, amount) for _, day, t, c, _, amount, cur, _ in rows])
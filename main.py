@@ -6,42 +6,55 @@
 # КУРСИ (НБУ + COINGECKO), ФІНАНСОВА ВІКТОРИНА, ТА 📚 ФІНАНСОВИЙ БЛОГ (посилання)
 # ─────────────────────────────────────────────────────────────────────────────
 # ВИМОГИ (requirements.txt):
-# python-telegram-bot[job-queue]==20.3
+# python-telegram-bot[job-queue,webhooks]==20.3
 # reportlab
 # matplotlib
-# requests
+# httpx
+# numpy
 # ─────────────────────────────────────────────────────────────────────────────
 # ПРИМІТКА: повністю прибрано AI і залежності torch/transformers.
 # ─────────────────────────────────────────────────────────────────────────────
 
 import os
-import sqlite3
+import asyncio
 import calendar
 import random
-import requests
+import re
+import tempfile
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, date, timedelta
 
 from telegram import (
     Update, InlineKeyboardMarkup, InlineKeyboardButton, InputFile
 )
+from telegram.error import BadRequest
 from telegram.ext import (
     Application, CommandHandler, ConversationHandler,
-    MessageHandler, CallbackQueryHandler, ContextTypes, filters
+    MessageHandler, CallbackQueryHandler, TypeHandler, ContextTypes, filters
 )
 
-# ==== PDF ====
-from reportlab.lib.pagesizes import A4
-from reportlab.lib import colors
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-
-# ==== Charts ====
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from constants import (
+    MONTHS, MONTHS_BY_NAME, QUARTERS, TYPES, CURRENCIES, CATEGORIES, CATEGORY_EMOJI, CATEGORY_COLORS
+)
+from storage import Storage
+from migrations import migrate, day_key, month_range
+from rollups import rollup_ops, RANGE_TOTALS
+from render import RenderService, RenderBusy
+from render_cache import RenderCache
+from rates import RatesProvider
+from rate_history import RateHistory
+from dispatch import OrderedApplication, MAX_PENDING
+from persistence import SQLitePersistence
+from router import CallbackRouter
+from outbound import SendScheduler
+from digest import MonthlyDigest, send_time as digest_send_time
+from importer import Importer, StatementError, IMPORT_MAX_MB
+from export import FORMATS as EXPORT_FORMATS, parse_period
+from budgets import (
+    Budgets, budget_ops, alert_text, progress_bar, ref as budget_ref, PERIODS as BUDGET_PERIODS, BUDGET_WARN
+)
+import metrics
+from metrics import timed, MetricsServer, TimedRequest
 
 # ===================== CONFIG =====================
 BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -49,114 +62,39 @@ if not BOT_TOKEN:
     raise RuntimeError("BOT_TOKEN не знайдено у змінних середовища (Railway → Variables).")
 
 DB_PATH = "finance.db"
-pdfmetrics.registerFont(TTFont('DejaVu', 'DejaVuSans.ttf'))
+
+# Власний Bot API сервер (напр. self-hosted telegram-bot-api або локальний stub для бенчмарків)
+BOT_API_URL = os.getenv("BOT_API_URL", "").rstrip("/")
+
+# Webhook: якщо задано WEBHOOK_URL (публічна адреса, напр. https://bot.example.com),
+# бот слухає HTTP на WEBHOOK_LISTEN:WEBHOOK_PORT замість long polling.
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8443")))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 
 # URL фінансового блогу (головна сторінка зі всіма статтями)
 BLOG_URL = "https://hnidets523.github.io/My-finance-/index.html"
 
 # ===================== DB =====================
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cur = conn.cursor()
-cur.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    user_id INTEGER PRIMARY KEY,
-    name TEXT,
-    currency TEXT DEFAULT 'грн',
-    created_at TEXT
-)
-""")
-cur.execute("""
-CREATE TABLE IF NOT EXISTS transactions (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    type TEXT,
-    category TEXT,
-    subcategory TEXT,
-    amount REAL,
-    currency TEXT,
-    comment TEXT,
-    date TEXT,
-    created_at TEXT
-)
-""")
-conn.commit()
+db = Storage(DB_PATH)
+db.bootstrap(migrate)
 
-# ===================== CONSTANTS =====================
-MONTHS = {
-    1: "Січень", 2: "Лютий", 3: "Березень", 4: "Квітень",
-    5: "Травень", 6: "Червень", 7: "Липень", 8: "Серпень",
-    9: "Вересень", 10: "Жовтень", 11: "Листопад", 12: "Грудень"
-}
-MONTHS_BY_NAME = {v: k for k, v in MONTHS.items()}
-
-TYPES = ["💸 Витрати", "💰 Надходження", "📈 Інвестиції"]
-CURRENCIES = ["грн", "$"]
-
-CATEGORIES = {
-    "💸 Витрати": {
-        "Харчування": ["Кафе", "Супермаркет/ринок", "Гульки", "Трати на роботі"],
-        "Одяг та взуття": ["Секонд", "Фізичний магазин", "Онлайн"],
-        "Оренда/житло": None,
-        "Господарчі товари": None,
-        "Дорога/подорожі": ["Маршрутки", "Автобуси/дальність"],
-        "Онлайн підписки": ["iCloud", "YouTube", "Prom"],
-        "Поповнення мобільного": None,
-        "Розваги": None,
-        "Vodafone": ["Чай/поповнення", "Сім-карти"],
-    },
-    "📈 Інвестиції": {
-        "Крипта": None,
-        "Зарядні пристрої": None,
-        "Hub station": None,
-        "Акаунти": None,
-        "Купівля $": None,
-    },
-    "💰 Надходження": {
-        "Зарплата": None,
-        "Переказ": None,
-        "Інше": None,
-    },
-}
-
-CATEGORY_EMOJI = {
-    "Харчування": "🍔",
-    "Одяг та взуття": "👕",
-    "Оренда/житло": "🏠",
-    "Господарчі товари": "🧴",
-    "Дорога/подорожі": "🚌",
-    "Онлайн підписки": "📲",
-    "Поповнення мобільного": "📶",
-    "Розваги": "🎉",
-    "Vodafone": "📡",
-    "Крипта": "🪙",
-    "Зарядні пристрої": "🔌",
-    "Hub station": "🖥️",
-    "Акаунти": "👤",
-    "Купівля $": "💵",
-    "Зарплата": "💼",
-    "Переказ": "🔁",
-    "Інше": "➕",
-}
-CATEGORY_COLORS = {
-    "Харчування": "#FF9800",
-    "Одяг та взуття": "#3F51B5",
-    "Оренда/житло": "#009688",
-    "Господарчі товари": "#795548",
-    "Дорога/подорожі": "#4CAF50",
-    "Онлайн підписки": "#9C27B0",
-    "Поповнення мобільного": "#607D8B",
-    "Розваги": "#673AB7",
-    "Vodafone": "#E91E63",
-    "Крипта": "#FBC02D",
-    "Зарядні пристрої": "#8BC34A",
-    "Hub station": "#00BCD4",
-    "Акаунти": "#CDDC39",
-    "Купівля $": "#FF5722",
-    "Зарплата": "#2196F3",
-    "Переказ": "#00ACC1",
-    "Інше": "#9E9E9E",
-}
+# ===================== RENDER (PDF у пулі процесів) =====================
+renderer = RenderService()
+render_cache = RenderCache()
+RENDER_WARM = os.getenv("RENDER_WARM", "1") == "1"
+RENDER_BUSY_TEXT = "⏳ Зараз формується забагато звітів. Спробуй ще раз за хвилину."
+
+# Імпорт CSV/виписок (importer.py): прогрес редагується не частіше, ніж раз на IMPORT_PROGRESS_EVERY с
+IMPORT_PROGRESS_EVERY = 2.0
 
+# Статистика показується сторінками: підсумки з rollup-ів, рядки — keyset-пагінацією
+STATS_PAGE_SIZE = 15
+STATS_COMMENT_MAX = 60
+
+# ===================== CONSTANTS =====================
 TIPS = [
     "Не заощаджуй те, що залишилось після витрат — витрачай те, що залишилось після заощаджень. — Уоррен Баффет",
     "Бюджет — це те, що змушує ваші гроші робити те, що ви хочете. — Дейв Ремзі",
@@ -225,42 +163,63 @@ QUIZ_QUESTIONS_BASE = [
     STAT_MONTH_SELECT,
     STAT_DAY_SELECT,
     PROFILE_EDIT_NAME,
-    QUIZ_ACTIVE        # вікторина
-) = range(9)
+    QUIZ_ACTIVE,       # вікторина
+    STAT_RANGE_INPUT,  # ввід довільного періоду статистики
+    BUDGET_LIMIT       # ввід ліміту бюджету
+) = range(11)
 
 # ===================== RATES (NBU + CoinGecko) =====================
-async def refresh_rates_job(context: ContextTypes.DEFAULT_TYPE):
-    # NBU
-    try:
-        r = requests.get("https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?json", timeout=12)
-        data = r.json()
-        usd = next((x for x in data if str(x.get("r030")) == "840"), None)
-        eur = next((x for x in data if str(x.get("r030")) == "978"), None)
-        usd_uah = float(usd["rate"]) if usd else None
-        eur_uah = float(eur["rate"]) if eur else None
-    except Exception:
-        usd_uah = eur_uah = None
-
-    # CoinGecko
-    try:
-        c = requests.get(
-            "https://api.coingecko.com/api/v3/simple/price",
-            params={"ids": "bitcoin,ethereum", "vs_currencies": "usd"},
-            timeout=12
-        ).json()
-        btc_usd = float(c.get("bitcoin", {}).get("usd", 0) or 0)
-        eth_usd = float(c.get("ethereum", {}).get("usd", 0) or 0)
-    except Exception:
-        btc_usd = eth_usd = None
+rates_provider = RatesProvider()
+rate_history = RateHistory(db)
 
+@timed("job_seconds")
+async def refresh_rates_job(context: ContextTypes.DEFAULT_TYPE):
+    # НБУ та CoinGecko опитуються паралельно; джерело у відступі після збою пропускається
+    fresh = await rates_provider.refresh()
     rates = context.application.bot_data.get("rates", {})
-    if usd_uah: rates["usd_uah"] = usd_uah
-    if eur_uah: rates["eur_uah"] = eur_uah
-    if btc_usd: rates["btc_usd"] = btc_usd
-    if eth_usd: rates["eth_usd"] = eth_usd
+    rates.update(fresh)
+    await rate_history.record(fresh)
     context.application.bot_data["rates"] = rates
+    context.application.bot_data["rates_meta"] = rates_provider.snapshot()
     context.application.bot_data["rates_updated"] = datetime.utcnow().isoformat()
 
+@timed("job_seconds")
+async def rates_downsample_job(context: ContextTypes.DEFAULT_TYPE):
+    await rate_history.downsample()
+
+@timed("job_seconds")
+async def rates_backfill_job(context: ContextTypes.DEFAULT_TYPE):
+    # курси НБУ за минулі дні з валютними записами, яких немає в історії (див. rate_history.backfill)
+    await rate_history.backfill(rates_provider.fetch_nbu_day, today_key())
+
+# Щомісячний підсумок (digest.py): суми в чужій валюті — за курсом на дату операції
+async def _digest_convert(amounts, currencies, days, to_currency):
+    return await rate_history.convert(amounts, currencies, days, to_currency, rates_provider.rates())
+
+monthly_digest = MonthlyDigest(db, _digest_convert)
+
+@timed("job_seconds")
+async def monthly_digest_job(context: ContextTypes.DEFAULT_TYPE):
+    # data={"catchup": True} — перевірка при старті: дописати перервану розсилку або пропущену 1-го
+    await monthly_digest.run(context.bot, catchup=bool(context.job.data and context.job.data.get("catchup")))
+
+budgets = Budgets(db)
+
+def today_key() -> int:
+    now = datetime.now()
+    return day_key(now.year, now.month, now.day)
+
+@timed("job_seconds")
+async def budget_alert_job(context: ContextTypes.DEFAULT_TYPE):
+    # data=(category, period, spent, limit, currency); ставиться з handle_comment, щоб не гальмувати відповідь
+    await context.bot.send_message(context.job.chat_id, alert_text(*context.job.data),
+                                   reply_markup=ikb([[("🎯 Бюджети", "budget:open")]]))
+
+@timed("job_seconds")
+async def warm_render_job(context: ContextTypes.DEFAULT_TYPE):
+    # PDF/діаграми вантажаться лише у воркерах рендеру; піднімаємо їх уже після старту бота
+    await renderer.warm()
+
 def fmtn(v: float) -> str:
     return f"{v:,.2f}".replace(",", " ").replace(".", ",")
 
@@ -277,6 +236,7 @@ def rates_block(bot_data: dict) -> str:
         return "📡 Котирування недоступні зараз. Спробуй пізніше."
     btc_uah = btc * usd
     eth_uah = eth * usd
+    stale = any(m["stale"] for m in bot_data.get("rates_meta", {}).values())
     return (
         "📈 КОТИРУВАННЯ (реальний час)\n"
         "━━━━━━━━━━━━━━━━━━━\n"
@@ -284,115 +244,336 @@ def rates_block(bot_data: dict) -> str:
         f"💶 Євро: 1 EUR = {fmtn(eur)} грн\n"
         f"₿ Біткоїн: ${fmtd(btc)} ≈ {fmtn(btc_uah)} грн\n"
         f"Ξ Ефір: ${fmtd(eth)} ≈ {fmtn(eth_uah)} грн"
+        + ("\n⚠️ Дані можуть бути застарілими — джерело тимчасово недоступне." if stale else "")
     )
 
 # ===================== HELPERS (DB) =====================
-def get_user(user_id: int):
-    cur.execute("SELECT user_id, name, currency, created_at FROM users WHERE user_id=?", (user_id,))
-    return cur.fetchone()
+@timed("db_helper_seconds")
+async def get_user(user_id: int):
+    return await db.fetchone("SELECT user_id, name, currency, created_at FROM users WHERE user_id=?", (user_id,))
 
-def create_or_update_user(user_id: int, name: str, currency: str):
-    cur.execute("""
+@timed("db_helper_seconds")
+async def create_or_update_user(user_id: int, name: str, currency: str):
+    await db.execute("""
         INSERT INTO users (user_id, name, currency, created_at)
         VALUES (?, ?, ?, ?)
         ON CONFLICT(user_id) DO UPDATE SET name=excluded.name, currency=excluded.currency
     """, (user_id, name, currency, datetime.utcnow().isoformat()))
-    conn.commit()
-
-def save_tx(user_id, ttype, cat, sub, amount, currency, comment, date_str):
-    cur.execute("""
-        INSERT INTO transactions (user_id, type, category, subcategory, amount, currency, comment, date, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (user_id, ttype, cat, sub, amount, currency, comment, date_str, datetime.utcnow().isoformat()))
-    conn.commit()
 
-def fetch_day(user_id, y, m, d):
+@timed("db_helper_seconds")
+async def set_user_name(user_id: int, name: str):
+    await db.execute("UPDATE users SET name=? WHERE user_id=?", (name, user_id))
+
+@timed("db_helper_seconds")
+async def set_user_currency(user_id: int, currency: str):
+    await db.execute("UPDATE users SET currency=? WHERE user_id=?", (currency, user_id))
+
+@timed("db_helper_seconds")
+async def save_tx(user_id, ttype, cat, sub, amount, currency, comment, date_str):
+    day = int(date_str.replace("-", ""))
+    await db.write([("""
+        INSERT INTO transactions (user_id, type, category, subcategory, amount, currency, comment, date, day, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (user_id, ttype, cat, sub, amount, currency, comment, date_str,
+          day, datetime.utcnow().isoformat()))]
+        + rollup_ops(user_id, day, ttype, cat, currency, amount)
+        + budget_ops(user_id, day, ttype, cat, currency, amount))
+    render_cache.invalidate(user_id, [day])
+
+@timed("db_helper_seconds")
+async def fetch_day(user_id, y, m, d):
     ds = f"{y:04d}-{m:02d}-{d:02d}"
-    cur.execute("""SELECT type, category, subcategory, amount, currency, comment
-                   FROM transactions WHERE user_id=? AND date=?""", (user_id, ds))
-    return cur.fetchall(), ds
-
-def fetch_month(user_id, y, m):
-    cur.execute("""SELECT type, category, subcategory, amount, currency, comment
-                   FROM transactions
-                   WHERE user_id=? AND strftime('%Y', date)=? AND strftime('%m', date)=?""",
-                (user_id, str(y), f"{m:02d}"))
-    return cur.fetchall()
+    rows = await db.fetchall("""SELECT type, category, subcategory, amount, currency, comment
+                                FROM transactions WHERE user_id=? AND day=? ORDER BY id""",
+                             (user_id, day_key(y, m, d)))
+    return rows, ds
+
+@timed("db_helper_seconds")
+async def fetch_month(user_id, y, m):
+    return await db.fetchall("""SELECT type, category, subcategory, amount, currency, comment
+                                FROM transactions
+                                WHERE user_id=? AND day BETWEEN ? AND ? ORDER BY day, id""",
+                             (user_id, *month_range(y, m)))
+
+# Підсумки з rollup-таблиць у валюті користувача: суми в іншій валюті
+# перераховуються за курсом НБУ на дату операції (rate_history) одним проходом.
+@timed("db_helper_seconds")
+async def fetch_daily_converted(user_id, lo, hi, currency):
+    # [(day, type, category, amount), ...]
+    rows = await db.fetchall("""SELECT day, type, category, currency, SUM(amount) FROM daily_rollup
+                                WHERE user_id=? AND day BETWEEN ? AND ?
+                                GROUP BY day, type, category, currency""", (user_id, lo, hi))
+    if not rows:
+        return []
+    amounts = await rate_history.convert([r[4] for r in rows], [r[3] for r in rows], [r[0] for r in rows],
+                                         currency, rates_provider.rates())
+    return [(day, t, c, float(a)) for (day, t, c, _, _), a in zip(rows, amounts)]
+
+# Підсумки за довільний діапазон — з префіксних сум daily_rollup (rollups.RANGE_TOTALS):
+# дві суми на серію незалежно від довжини періоду. Лише серії в іншій валюті
+# читаються поденно — курс залежить від дати операції.
+@timed("db_helper_seconds")
+async def fetch_range_totals(user_id, lo, hi, currency):
+    # -> ([(type, category, amount), ...], кількість записів)
+    sums = defaultdict(float)
+    foreign = set()
+    count = 0
+    for t, c, cur, a, n in await db.fetchall(RANGE_TOTALS, (user_id, lo, hi)):
+        if not n:
+            continue
+        count += n
+        if cur in (currency, ""):
+            sums[(t, c)] += a
+        else:
+            foreign.add(cur)
+    if foreign:
+        marks = ",".join("?" * len(foreign))
+        rows = await db.fetchall(f"""SELECT day, type, category, currency, amount FROM daily_rollup
+                                     WHERE user_id=? AND day BETWEEN ? AND ? AND currency IN ({marks})""",
+                                 (user_id, lo, hi, *sorted(foreign)))
+        amounts = await rate_history.convert([r[4] for r in rows], [r[3] for r in rows], [r[0] for r in rows],
+                                             currency, rates_provider.rates())
+        for (_, t, c, _, _), a in zip(rows, amounts):
+            sums[(t, c)] += float(a)
+    return [(t, c, a) for (t, c), a in sums.items()], count
+
+@timed("db_helper_seconds")
+async def fetch_rate_factors(user_id, currency):
+    # {(day, валюта): множник у currency} для днів із записами в іншій валюті — для воркера PDF,
+    # який не має доступу до rate_history в пам’яті
+    rows = await db.fetchall("""SELECT DISTINCT day, currency FROM daily_rollup
+                                WHERE user_id=? AND currency NOT IN (?, '')""", (user_id, currency))
+    if not rows:
+        return {}
+    factors = await rate_history.convert([1.0] * len(rows), [r[1] for r in rows], [r[0] for r in rows],
+                                         currency, rates_provider.rates())
+    return {(day, cur): float(f) for (day, cur), f in zip(rows, factors)}
+
+async def fetch_totals(user_id, lo, hi, currency):
+    # [(type, category, amount), ...]
+    return (await fetch_range_totals(user_id, lo, hi, currency))[0]
+
+@timed("db_helper_seconds")
+async def fetch_expense_series(user_id, currency):
+    # усі денні витрати одним запитом -> (days, categories, amounts) для analytics.analyze
+    rows = await db.fetchall("""SELECT day, category, currency, amount FROM daily_rollup
+                                WHERE user_id=? AND type='💸 Витрати'""", (user_id,))
+    days = [r[0] for r in rows]
+    amounts = [r[3] for r in rows]
+    foreign = [i for i, r in enumerate(rows) if r[2] not in (currency, "")]
+    if foreign:
+        converted = await rate_history.convert([amounts[i] for i in foreign], [rows[i][2] for i in foreign],
+                                               [days[i] for i in foreign], currency, rates_provider.rates())
+        for i, a in zip(foreign, converted):
+            amounts[i] = float(a)
+    return days, [r[1] for r in rows], amounts
+
+@timed("db_helper_seconds")
+async def fetch_years(user_id):
+    # роки, за які є записи (з monthly_rollup), від новіших
+    rows = await db.fetchall("SELECT DISTINCT month / 100 FROM monthly_rollup WHERE user_id=? ORDER BY 1 DESC",
+                             (user_id,))
+    return [r[0] for r in rows]
+
+@timed("db_helper_seconds")
+async def fetch_month_daily_totals(user_id, y, m, currency):
+    # [(day, type, amount), ...] для графіків по днях
+    sums = defaultdict(float)
+    for day, t, _, a in await fetch_daily_converted(user_id, *month_range(y, m), currency):
+        sums[(day, t)] += a
+    return [(day, t, a) for (day, t), a in sums.items()]
+
+async def user_currency(user_id) -> str:
+    u = await get_user(user_id)
+    return (u[2] if u else None) or "грн"
+
+@timed("db_helper_seconds")
+async def fetch_stats_page(user_id, lo, hi, cursor=None, backward=False, limit=STATS_PAGE_SIZE):
+    # keyset-пагінація по (day, id): сторінка після курсора, або перед ним, якщо backward —
+    # попередні сторінки не перечитуються, OFFSET не потрібен.
+    # [(day, id, type, category, subcategory, amount, currency, comment), ...]
+    sql = """SELECT day, id, type, category, subcategory, amount, currency, comment
+             FROM transactions WHERE user_id=? AND day BETWEEN ? AND ?"""
+    params = [user_id, lo, hi]
+    if cursor:
+        sql += " AND (day, id) < (?, ?)" if backward else " AND (day, id) > (?, ?)"
+        params += cursor
+    sql += " ORDER BY day DESC, id DESC LIMIT ?" if backward else " ORDER BY day, id LIMIT ?"
+    rows = await db.fetchall(sql, (*params, limit))
+    return rows[::-1] if backward else rows
+
+@timed("db_helper_seconds")
+async def fetch_period_version(user_id, lo, hi):
+    # версія даних періоду для ключа кешу рендерів -> (кількість, останній id) (покривний індекс)
+    cnt, last = await db.fetchone("""SELECT COUNT(*), MAX(id) FROM transactions
+                                     WHERE user_id=? AND day BETWEEN ? AND ?""", (user_id, lo, hi))
+    return cnt, last or 0
+
+@timed("db_helper_seconds")
+async def has_transactions(user_id) -> bool:
+    return await db.fetchone("SELECT 1 FROM transactions WHERE user_id=? LIMIT 1", (user_id,)) is not None
 
 # ===================== HELPERS (TEXT/PDF/CHARTS) =====================
-def build_stats_text(rows, title):
+def build_stats_text(rows, totals, title, currency="", page=(1, 1)):
+    # rows — лише поточна сторінка (fetch_stats_page), totals — за весь період з rollup-ів
     if not rows:
         return f"{title}\n📭 Немає записів."
     sums = {"💸 Витрати": 0.0, "💰 Надходження": 0.0, "📈 Інвестиції": 0.0}
+    for t, c, a in totals:
+        sums[t] = sums.get(t, 0.0) + float(a or 0)
     lines = []
-    for t, c, s, a, curx, com in rows:
+    for _, _, t, c, s, a, curx, com in rows:
         a = float(a or 0)
-        if t not in sums:
-            sums[t] = 0.0
-        sums[t] += a
-        lines.append(f"• {t} | {CATEGORY_EMOJI.get(c, '')} {c}/{s or '-'} — {a:.2f} {curx} ({com or '-'})")
-    total = "\n".join([f"{k}: {v:.2f}" for k, v in sums.items()])
+        com = com or "-"
+        if len(com) > STATS_COMMENT_MAX:
+            com = com[:STATS_COMMENT_MAX - 1] + "…"
+        lines.append(f"• {t} | {CATEGORY_EMOJI.get(c, '')} {c}/{s or '-'} — {a:.2f} {curx} ({com})")
+    if page[1] > 1:
+        lines.append(f"\n📄 Сторінка {page[0]}/{page[1]}")
+    total = "\n".join([f"{k}: {v:.2f} {currency}".rstrip() for k, v in sums.items()])
     tip = random.choice(TIPS)
     return f"{title}\n\n" + "\n".join(lines) + f"\n\nПідсумок:\n{total}\n\n💡 {tip}"
 
-def make_pdf(rows, title, filename):
-    doc = SimpleDocTemplate(filename, pagesize=A4)
-    styles = getSampleStyleSheet()
-    if "Ukr" not in styles:
-        styles.add(ParagraphStyle(name="Ukr", fontName="DejaVu", fontSize=12, leading=15))
-    elements = [Paragraph(title, styles["Ukr"])]
-    data = [["Тип", "Категорія", "Підкатегорія", "Сума", "Валюта", "Коментар"]]
-    totals = defaultdict(float)
-    for t, c, s, a, curx, com in rows:
-        a = float(a or 0)
-        totals[t] += a
-        data.append([t, f"{CATEGORY_EMOJI.get(c,'')} {c}", s or "-", f"{a:.2f}", curx, com or "-"])
-    data.append(["", "", "", "", "", ""])
-    for k in ["💸 Витрати", "💰 Надходження", "📈 Інвестиції"]:
-        data.append([k, "", "", f"{totals[k]:.2f}", "", ""])
-    table = Table(data, repeatRows=1, hAlign='LEFT')
-    table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'DejaVu'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-    ]))
-    elements.append(table)
-    doc.build(elements)
-
-def make_pie_expenses(rows, title, path_png):
-    sums_by_cat = defaultdict(float)
-    for t, c, s, a, curx, com in rows:
-        if t == "💸 Витрати":
-            sums_by_cat[c] += float(a or 0)
-    if not sums_by_cat:
-        return False
-    labels = [f"{CATEGORY_EMOJI.get(k,'')} {k}" for k in sums_by_cat.keys()]
-    values = list(sums_by_cat.values())
-    colors_list = [CATEGORY_COLORS.get(k, "#999999") for k in sums_by_cat.keys()]
-    plt.figure()
-    plt.pie(values, labels=labels, autopct="%1.1f%%", colors=colors_list)
-    plt.title(title)
-    plt.tight_layout()
-    plt.savefig(path_png)
-    plt.close()
-    return True
+def key_date(day: int) -> date:
+    return date(day // 10000, day // 100 % 100, day % 100)
+
+def parse_day(day: int):
+    # YYYYMMDD з callback_data -> date або None, якщо такого дня немає (дані могли підробити)
+    try:
+        return key_date(day)
+    except ValueError:
+        return None
+
+def valid_range(lo: int, hi: int) -> bool:
+    return parse_day(lo) is not None and parse_day(hi) is not None and lo <= hi
+
+def date_key(dt: date) -> int:
+    return day_key(dt.year, dt.month, dt.day)
+
+def fmt_day(day: int) -> str:
+    return key_date(day).strftime("%d.%m.%Y")
 
-def profile_summary(user_id):
-    cur.execute("SELECT name, currency, created_at FROM users WHERE user_id=?", (user_id,))
-    u = cur.fetchone()
+def range_title(lo: int, hi: int) -> str:
+    return f"📆 {fmt_day(lo)} — {fmt_day(hi)}"
+
+def pct_change(now: float, before: float) -> str:
+    if not before:
+        return "нове" if now else "—"
+    return f"{(now - before) / before * 100:+.0f}%"
+
+def build_range_text(title, totals, count, currency):
+    # підсумки періоду без списку записів: за рік їх можуть бути тисячі
+    if not count:
+        return f"{title}\n📭 Немає записів."
+    by_type = defaultdict(float)
+    by_cat = defaultdict(float)
+    for t, c, a in totals:
+        by_type[t] += a
+        if t == "💸 Витрати":
+            by_cat[c] += a
+    exp = by_type["💸 Витрати"]
+    lines = [title, "━━━━━━━━━━━━━━━━━━━", f"🧾 Записів: {count}"]
+    lines += [f"{t}: {by_type[t]:.2f} {currency}" for t in TYPES]
+    lines.append(f"⚖️ Баланс: {by_type['💰 Надходження'] - exp:+.2f} {currency}")
+    if by_cat:
+        lines.append("\nВитрати за категоріями:")
+        for c, a in sorted(by_cat.items(), key=lambda kv: -kv[1]):
+            share = a / exp * 100 if exp else 0
+            lines.append(f"• {CATEGORY_EMOJI.get(c, '')} {c} — {a:.2f} {currency} ({share:.0f}%)")
+    return "\n".join(lines) + f"\n\n💡 {random.choice(TIPS)}"
+
+def build_budgets_text(items):
+    lines = ["🎯 БЮДЖЕТИ", "━━━━━━━━━━━━━━━━━━━"]
+    if not items:
+        lines.append("Поки що немає лімітів. Додай, напр., «Харчування ≤ 8000 на місяць» — "
+                     "бот попередить, коли витрати наблизяться до ліміту.")
+    for c, p, limit, cur, spent in items:
+        share = spent / limit if limit else 0
+        mark = " 🚨" if spent >= limit else " ⚠️" if spent >= limit * BUDGET_WARN else ""
+        lines.append(f"{CATEGORY_EMOJI.get(c, '')} {c} — за {BUDGET_PERIODS.get(p, p)}{mark}\n"
+                     f"{progress_bar(share)} {spent:.2f} / {limit:.2f} {cur} ({share * 100:.0f}%)")
+    return "\n".join(lines)
+
+def trend_arrow(rel) -> str:
+    if rel != rel:   # nan — замало місяців
+        return "—"
+    return ("↗️" if rel > TREND_FLAT else "↘️" if rel < -TREND_FLAT else "➡️") + f" {rel * 100:+.0f}%/міс"
+
+def build_trends_text(report, currency):
+    from analytics import TREND_MONTHS, ROLLING_DAYS
+    m = report["month"].astype(object)
+    lines = [f"📉 ТРЕНДИ Й ПРОГНОЗ — {MONTHS[m.month]} {m.year}", "━━━━━━━━━━━━━━━━━━━"]
+    if not report["categories"]:
+        return "\n".join(lines) + "\n📭 Ще немає витрат для аналізу."
+    spent, projected, last = report["spent"].sum(), report["projected"].sum(), report["last_month"].sum()
+    lines.append(f"💸 Витрачено з 1-го: {spent:.2f} {currency}")
+    lines.append(f"🔮 Прогноз на кінець місяця: {projected:.2f} {currency} "
+                 f"(минулий місяць: {last:.2f}, {pct_change(projected, last)})")
+    prev = report["prev_month"].sum()
+    lines.append(f"📆 Минулий місяць до попереднього: {pct_change(last, prev)}")
+    order = sorted(range(len(report["categories"])), key=lambda i: -report["projected"][i])
+    shown = [i for i in order if report["projected"][i] or report["last_month"][i]][:TRENDS_TOP]
+    if shown:
+        lines.append(f"\nЗа категоріями (витрачено → прогноз; тренд за {TREND_MONTHS} міс.):")
+    for i in shown:
+        c = report["categories"][i]
+        mark = "🗓" if report["seasonal"][i] else "📏"
+        lines.append(f"• {CATEGORY_EMOJI.get(c, '')} {c}: {report['spent'][i]:.2f} → {report['projected'][i]:.2f} {mark}"
+                     f" | {trend_arrow(report['trend'][i])}"
+                     f" | ~{report['avg_daily'][i]:.2f}/день")
+    lines.append(f"\n🗓 — сезонний прогноз (як торік, з поправкою на темп), 📏 — лінійний "
+                 f"(середнє за {ROLLING_DAYS} дн.). Суми в {currency}.")
+    return "\n".join(lines)
+
+def build_yoy_text(y, months, cur_year, prev_year, currency):
+    # months: [(m, витрати y, витрати y-1), ...]; cur_year/prev_year — totals за однакові відрізки років
+    def by_type(totals, t):
+        return sum(a for tt, _, a in totals if tt == t)
+
+    lines = [f"🔀 {y} ПРОТИ {y - 1}", "━━━━━━━━━━━━━━━━━━━", f"Витрати по місяцях ({currency}):"]
+    for m, a, b in months:
+        lines.append(f"{MONTHS[m]}: {a:.2f} ← {b:.2f} ({pct_change(a, b)})")
+    lines.append("")
+    for t in TYPES:
+        a, b = by_type(cur_year, t), by_type(prev_year, t)
+        lines.append(f"{t}: {a:.2f} ← {b:.2f} {currency} ({pct_change(a, b)})")
+    cats = defaultdict(lambda: [0.0, 0.0])
+    for i, totals in enumerate((cur_year, prev_year)):
+        for t, c, a in totals:
+            if t == "💸 Витрати":
+                cats[c][i] += a
+    if cats:
+        lines.append("\nНайбільші зміни витрат:")
+        for c, (a, b) in sorted(cats.items(), key=lambda kv: -abs(kv[1][0] - kv[1][1]))[:YOY_TOP]:
+            lines.append(f"• {CATEGORY_EMOJI.get(c, '')} {c}: {a:.2f} ← {b:.2f} ({pct_change(a, b)})")
+    return "\n".join(lines)
+
+@timed("db_helper_seconds")
+async def profile_summary(user_id):
+    u = await db.fetchone("SELECT name, currency, created_at FROM users WHERE user_id=?", (user_id,))
     if not u:
         return None, None
     name, currency, created = u
-    cur.execute("""SELECT COUNT(*),
-                          SUM(CASE WHEN type='💸 Витрати' THEN amount ELSE 0 END),
-                          SUM(CASE WHEN type='💰 Надходження' THEN amount ELSE 0 END)
-                   FROM transactions WHERE user_id=?""", (user_id,))
-    cnt, exp_sum, inc_sum = cur.fetchone()
+    currency = currency or "грн"
+    # суми у валюті профілю беремо з місячних підсумків як є,
+    # а записи в інших валютах — поденно, щоб перерахувати за курсом на дату
+    cnt, exp_sum, inc_sum = await db.fetchone("""SELECT COALESCE(SUM(cnt), 0),
+                          SUM(CASE WHEN type='💸 Витрати' AND currency=? THEN amount ELSE 0 END),
+                          SUM(CASE WHEN type='💰 Надходження' AND currency=? THEN amount ELSE 0 END)
+                   FROM monthly_rollup WHERE user_id=?""", (currency, currency, user_id))
     exp_sum = exp_sum or 0
     inc_sum = inc_sum or 0
+    foreign = await db.fetchall("""SELECT day, type, currency, SUM(amount) FROM daily_rollup
+                                   WHERE user_id=? AND currency<>? AND type IN ('💸 Витрати', '💰 Надходження')
+                                   GROUP BY day, type, currency""", (user_id, currency))
+    if foreign:
+        amounts = await rate_history.convert([r[3] for r in foreign], [r[2] for r in foreign],
+                                             [r[0] for r in foreign], currency, rates_provider.rates())
+        for (_, t, _, _), a in zip(foreign, amounts):
+            if t == "💸 Витрати":
+                exp_sum += float(a)
+            else:
+                inc_sum += float(a)
     text = (
         "📇 ОСОБИСТИЙ КАБІНЕТ\n"
         "━━━━━━━━━━━━━━━━━━━\n"
@@ -407,6 +588,80 @@ def profile_summary(user_id):
     )
     return text, currency
 
+# ===================== RENDER + КЕШ =====================
+def report_period(y, m, d=None) -> str:
+    return str(day_key(y, m, d)) if d else str(y * 100 + m)
+
+def report_range(y, m, d=None):
+    return (day_key(y, m, d), day_key(y, m, d)) if d else month_range(y, m)
+
+def report_title(y, m, d=None) -> str:
+    return f"📅 {d} {MONTHS[m]} {y}" if d else f"📆 {MONTHS[m]} {y}"
+
+async def show_stats_page(q, context, uid, y, m, d=None, page=1, cursor=None, backward=False):
+    lo, hi = report_range(y, m, d)
+    currency = await user_currency(uid)
+    count, last_id = await fetch_period_version(uid, lo, hi)
+    pages = max(1, -(-count // STATS_PAGE_SIZE))
+    page = min(page, pages)
+    rows = await fetch_stats_page(uid, lo, hi, cursor, backward) if count else []
+    totals = await fetch_totals(uid, lo, hi, currency) if rows else []
+    kind = "day" if d else "month"
+    # лише дескриптор звіту: рядки для PDF/діаграм перечитуються (або беруться з кешу рендерів)
+    context.user_data["last_report"] = (kind, uid, y, m, d, count, last_id)
+    text = build_stats_text(rows, totals, report_title(y, m, d), currency, (page, pages))
+    nav = stats_nav_row(report_period(y, m, d), page, pages, rows)
+    await q.edit_message_text(text, reply_markup=stats_actions_ikb(kind, nav))
+
+async def fetch_report_rows(user_id, y, m, d=None):
+    if d:
+        return (await fetch_day(user_id, y, m, d))[0]
+    return await fetch_month(user_id, y, m)
+
+def read_and_remove(path) -> bytes:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(path)
+
+async def _reply_media(message, media, caption, filename=None):
+    # media: bytes або file_id вже завантаженого в Telegram файлу
+    if filename:
+        doc = InputFile(media, filename=filename) if isinstance(media, bytes) else media
+        return await message.reply_document(document=doc, caption=caption)
+    return await message.reply_photo(photo=media, caption=caption)
+
+async def reply_rendered(message, scope, kind, render, caption, filename=None):
+    # scope = (user_id, period, (кількість, останній id) з fetch_period_version);
+    # render() -> bytes | None (може кинути RenderBusy).
+    # Повтори того самого звіту йдуть з кешу: спершу file_id, потім байти з диска.
+    user_id, period, (count, last_id) = scope
+    version = f"{count}.{last_id}"
+    data, file_id = await render_cache.get(user_id, period, kind, version)
+    if file_id:
+        try:
+            return await _reply_media(message, file_id, caption, filename)
+        except BadRequest:
+            render_cache.set_file_id(user_id, period, kind, version, None)
+            data, _ = await render_cache.get(user_id, period, kind, version)
+    if data is None:
+        data = await render()
+        if data is None:
+            return None
+        await render_cache.put(user_id, period, kind, version, data)
+    sent = await _reply_media(message, data, caption, filename)
+    media = sent.document if filename else (sent.photo[-1] if sent.photo else None)
+    if media is not None:
+        render_cache.set_file_id(user_id, period, kind, version, media.file_id)
+    return sent
+
+def invalidate_imported(user_id, days):
+    # імпорт пише повз save_tx — скидаємо кеш рендерів для періодів із зачепленими днями
+    render_cache.invalidate(user_id, days)
+
+importer = Importer(db, on_batch=invalidate_imported)
+
 # ===================== UI (Inline Keyboards) =====================
 def ikb(rows):
     return InlineKeyboardMarkup([[InlineKeyboardButton(t, callback_data=d) for (t, d) in row] for row in rows])
@@ -416,7 +671,7 @@ def main_menu_ikb():
         [("💸 Витрати", "type:exp"), ("💰 Надходження", "type:inc")],
         [("📈 Інвестиції", "type:inv"), ("📊 Статистика", "stats:open")],
         [("🎮 Гра", "quiz:start"), ("👤 Мій профіль", "profile:open")],
-        [("📚 Фінансовий блог", "blog:open")]
+        [("📚 Фінансовий блог", "blog:open"), ("🎯 Бюджети", "budget:open")]
     ])
 
 def categories_ikb(tname):
@@ -448,14 +703,25 @@ def subcategories_ikb(tname, cat_name):
 def stat_mode_ikb():
     return ikb([
         [("📅 За день", "stats:mode:day"), ("📅 За місяць", "stats:mode:mon")],
+        [("🗓 Тиждень", "stats:mode:week"), ("📆 Квартал", "stats:mode:qtr")],
+        [("📈 Рік", "stats:mode:year"), ("🔀 Рік до року", "stats:mode:yoy")],
+        [("✍️ Свій період", "stats:mode:custom"), ("📉 Тренди й прогноз", "stats:trend")],
         [("↩️ Назад", "back:main"), ("🏠 Головне меню", "main:open")]
     ])
 
-def years_ikb():
+def years_ikb(years=()):
+    # роки з даними (fetch_years) + поточний; по 4 в ряд
     y = datetime.now().year
+    years = sorted({y, *years}, reverse=True)
+    rows = [[(str(v), f"stats:year:{v}") for v in years[i:i + 4]] for i in range(0, len(years), 4)]
+    rows.append([("↩️ Назад", "back:statsmode"), ("🏠 Головне меню", "main:open")])
+    return ikb(rows)
+
+def quarters_ikb(year: int):
     return ikb([
-        [(str(y), f"stats:year:{y}"), (str(y-1), f"stats:year:{y-1}")],
-        [("↩️ Назад", "back:statsmode"), ("🏠 Головне меню", "main:open")]
+        [(f"{QUARTERS[q]} кв.", f"stats:qtr:{year}:{q}") for q in (1, 2)],
+        [(f"{QUARTERS[q]} кв.", f"stats:qtr:{year}:{q}") for q in (3, 4)],
+        [("↩️ Назад", "back:year"), ("🏠 Головне меню", "main:open")]
     ])
 
 def months_ikb():
@@ -479,16 +745,53 @@ def days_ikb(year: int, month: int):
     rows.append([("↩️ Назад", "back:month"), ("🏠 Головне меню", "main:open")])
     return ikb(rows)
 
-def stats_actions_ikb():
-    return ikb([
-        [("📄 PDF", "stats:pdf"), ("🥧 Діаграма", "stats:pie")],
-        [("↩️ Назад", "back:statselect"), ("🏠 Головне меню", "main:open")]
-    ])
+def stats_nav_row(period: str, page: int, pages: int, rows):
+    # курсор у callback_data: ◀️ — перед першим рядком сторінки, ▶️ — після останнього
+    if pages <= 1 or not rows:
+        return None
+    nav = []
+    if page > 1:
+        nav.append(("◀️", f"stats:pg:{period}:{page - 1}:p:{rows[0][0]}:{rows[0][1]}"))
+    if page < pages:
+        nav.append(("▶️", f"stats:pg:{period}:{page + 1}:n:{rows[-1][0]}:{rows[-1][1]}"))
+    return nav
+
+def stats_actions_ikb(kind: str = "day", nav=None):
+    rows = [nav] if nav else []
+    rows.append([("📄 PDF", "stats:pdf"), ("🥧 Діаграма", "stats:pie")])
+    if kind == "month":
+        rows.append([("📊 По днях", "stats:bar"), ("📚 За типами", "stats:stack")])
+    rows.append([("↩️ Назад", "back:statselect"), ("🏠 Головне меню", "main:open")])
+    return ikb(rows)
+
+def range_ikb(lo: int, hi: int, nav=None, back="back:statsmode"):
+    rows = [nav] if nav else []
+    rows.append([("🥧 Діаграма", f"stats:rpie:{lo}:{hi}"), ("🗂 CSV", f"stats:rcsv:{lo}:{hi}")])
+    rows.append([("↩️ Назад", back), ("🏠 Головне меню", "main:open")])
+    return ikb(rows)
+
+def budgets_ikb(items):
+    rows = [[("➕ Додати / змінити ліміт", "budget:add")]]
+    for c, p, *_ in items:
+        rows.append([(f"🗑 {c} · {BUDGET_PERIODS.get(p, p)}", f"budget:del:{budget_ref(c)}:{p}")])
+    rows.append([("🏠 Головне меню", "main:open")])
+    return ikb(rows)
+
+def budget_categories_ikb():
+    rows, row = [], []
+    for i, c in enumerate(CATEGORIES["💸 Витрати"]):
+        row.append((f"{CATEGORY_EMOJI.get(c, '')} {c}", f"budget:cat:{i}"))
+        if len(row) == 2:
+            rows.append(row); row = []
+    if row: rows.append(row)
+    rows.append([("↩️ Назад", "budget:open"), ("🏠 Головне меню", "main:open")])
+    return ikb(rows)
 
 def profile_menu_ikb():
     return ikb([
         [("✏️ Змінити ім’я", "profile:editname"), ("💱 Змінити валюту", "profile:editcur")],
         [("📜 Увесь історичний PDF", "profile:allpdf")],
+        [("📥 Імпорт з CSV / виписки", "profile:import"), ("🗂 Експорт CSV", "profile:export")],
         [("↩️ Назад", "back:main"), ("🏠 Головне меню", "main:open")]
     ])
 
@@ -535,14 +838,16 @@ async def send_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE, gre
         await update.message.reply_text(text, reply_markup=main_menu_ikb())
 
 # ===================== START / ONBOARD =====================
+@timed("handler_seconds")
 async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    u = get_user(update.effective_user.id)
+    u = await get_user(update.effective_user.id)
     if not u:
         await update.message.reply_text("👋 Привіт! Як до тебе звертатись?")
         return ASK_NAME
     await send_main_menu(update, context, f"👋 Привіт, {u[1]}!\n\n{INTRO_TEXT}")
     return MAIN
 
+@timed("handler_seconds")
 async def save_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = (update.message.text or "").strip()
     if not name:
@@ -553,264 +858,625 @@ async def save_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return MAIN
 
 # ===================== CALLBACK ROUTER =====================
+# Кожна кнопка — окремий маршрут (router.py): префікс + типізовані аргументи.
+router = CallbackRouter()
+
+@timed("handler_seconds")
 async def on_cb(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
-    data = q.data
     await q.answer()
-    uid = update.effective_user.id
+    return await router.dispatch(update, context, q.data, cb_unknown)
 
-    # ГОЛОВНЕ МЕНЮ
-    if data == "main:open":
-        await send_main_menu(update, context, "🏠 Повернувся в головне меню")
-        return MAIN
+async def cb_unknown(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.answer("Невідома дія.", show_alert=True)
+    return MAIN
 
-    # ОНБОРДИНГ: валюта
-    if data.startswith("onb:setcur:"):
-        curx = data.split(":", 2)[2]
-        name = context.user_data.get("pending_name", "Користувач")
-        create_or_update_user(uid, name, curx)
-        await send_main_menu(update, context, f"✅ Профіль створено!\n\n{INTRO_TEXT}")
-        context.user_data.pop("pending_name", None)
-        return MAIN
+# ГОЛОВНЕ МЕНЮ
+@router.route("main:open")
+async def cb_main_open(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await send_main_menu(update, context, "🏠 Повернувся в головне меню")
+    return MAIN
 
-    # ТИП (ВИТРАТИ/ДОХОДИ/ІНВЕСТ)
-    if data.startswith("type:"):
-        code = data.split(":")[1]
-        tname = {"exp": "💸 Витрати", "inc": "💰 Надходження", "inv": "📈 Інвестиції"}[code]
-        context.user_data["tname"] = tname
-        context.user_data["cat_list"] = list(CATEGORIES[tname].keys())
-        await q.edit_message_text(f"Обери категорію ({tname}):", reply_markup=categories_ikb(tname))
-        return MAIN
+@router.route("back:main")
+async def cb_back_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await send_main_menu(update, context, "↩️ Повернувся на головне меню")
+    return MAIN
+
+# ОНБОРДИНГ: валюта
+@router.route("onb:setcur:{curx}")
+async def cb_onboarding_currency(update: Update, context: ContextTypes.DEFAULT_TYPE, curx: str):
+    name = context.user_data.get("pending_name", "Користувач")
+    await create_or_update_user(update.effective_user.id, name, curx)
+    await send_main_menu(update, context, f"✅ Профіль створено!\n\n{INTRO_TEXT}")
+    context.user_data.pop("pending_name", None)
+    return MAIN
 
-    # КАТЕГОРІЇ
-    if data == "back:main":
-        await send_main_menu(update, context, "↩️ Повернувся на головне меню")
+# ТИП (ВИТРАТИ/ДОХОДИ/ІНВЕСТ)
+TYPE_CODES = {"exp": "💸 Витрати", "inc": "💰 Надходження", "inv": "📈 Інвестиції"}
+
+@router.route("type:{code}")
+async def cb_type(update: Update, context: ContextTypes.DEFAULT_TYPE, code: str):
+    tname = TYPE_CODES.get(code)
+    if tname is None:
+        return await cb_unknown(update, context)
+    context.user_data["tname"] = tname
+    context.user_data["cat_list"] = list(CATEGORIES[tname].keys())
+    await update.callback_query.edit_message_text(f"Обери категорію ({tname}):", reply_markup=categories_ikb(tname))
+    return MAIN
+
+# КАТЕГОРІЇ
+@router.route("cat:{idx:int}")
+async def cb_category(update: Update, context: ContextTypes.DEFAULT_TYPE, idx: int):
+    q = update.callback_query
+    cats = context.user_data.get("cat_list", [])
+    if idx < 0 or idx >= len(cats):
+        await q.edit_message_text("Обери категорію:", reply_markup=categories_ikb(context.user_data.get("tname", TYPES[0])))
         return MAIN
+    cat_name = cats[idx]
+    context.user_data["cat_name"] = cat_name
+    tname = context.user_data["tname"]
+    await q.edit_message_text(f"Обери підкатегорію ({CATEGORY_EMOJI.get(cat_name,'')} {cat_name}):", reply_markup=subcategories_ikb(tname, cat_name))
+    return MAIN
+
+# ПІДКАТЕГОРІЇ
+@router.route("back:cats")
+async def cb_back_cats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    tname = context.user_data.get("tname", TYPES[0])
+    await update.callback_query.edit_message_text(f"Обери категорію ({tname}):", reply_markup=categories_ikb(tname))
+    return MAIN
 
-    if data.startswith("cat:"):
-        idx = int(data.split(":")[1])
-        cats = context.user_data.get("cat_list", [])
-        if idx < 0 or idx >= len(cats):
-            await q.edit_message_text("Обери категорію:", reply_markup=categories_ikb(context.user_data.get("tname", TYPES[0])))
+@router.route("sub:{val}")
+async def cb_subcategory(update: Update, context: ContextTypes.DEFAULT_TYPE, val: str):
+    # val — індекс підкатегорії або "none"
+    q = update.callback_query
+    tname = context.user_data.get("tname", TYPES[0])
+    cat_name = context.user_data.get("cat_name")
+    if val == "none":
+        context.user_data["sub_name"] = None
+    else:
+        subs = CATEGORIES[tname][cat_name] or []
+        idx = int(val) if val.isdigit() else -1
+        if idx < 0 or idx >= len(subs):
+            await q.edit_message_text("Обери підкатегорію:", reply_markup=subcategories_ikb(tname, cat_name))
             return MAIN
-        cat_name = cats[idx]
-        context.user_data["cat_name"] = cat_name
-        tname = context.user_data["tname"]
-        await q.edit_message_text(f"Обери підкатегорію ({CATEGORY_EMOJI.get(cat_name,'')} {cat_name}):", reply_markup=subcategories_ikb(tname, cat_name))
-        return MAIN
+        context.user_data["sub_name"] = subs[idx]
+    await q.edit_message_text(
+        "Введи суму (наприклад 123.45):",
+        reply_markup=ikb([[("↩️ Назад", "back:cats"), ("🏠 Головне меню", "main:open")]])
+    )
+    return AMOUNT
+
+# СТАТИСТИКА
+@router.route("stats:open")
+@router.route("back:statsmode")
+async def cb_stats_open(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Оберіть режим:", reply_markup=stat_mode_ikb())
+    return MAIN
 
-    # ПІДКАТЕГОРІЇ
-    if data == "back:cats":
-        tname = context.user_data.get("tname", TYPES[0])
-        await q.edit_message_text(f"Обери категорію ({tname}):", reply_markup=categories_ikb(tname))
+@router.route("stats:mode:{mode}")
+async def cb_stats_mode(update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str):
+    q = update.callback_query
+    context.user_data["stat_mode"] = mode  # day|mon|week|qtr|year|yoy|custom
+    if mode == "week":
+        today = datetime.now().date()
+        await show_week(q, update.effective_user.id, date_key(today - timedelta(days=today.weekday())))
+        return MAIN
+    if mode == "custom":
+        await q.edit_message_text(RANGE_HINT, reply_markup=ikb([[("↩️ Назад", "back:statsmode"),
+                                                                 ("🏠 Головне меню", "main:open")]]))
+        return STAT_RANGE_INPUT
+    years = await fetch_years(update.effective_user.id)
+    await q.edit_message_text("Оберіть рік:", reply_markup=years_ikb(years))
+    return STAT_YEAR_SELECT
+
+@router.route("back:year")
+async def cb_back_year(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    years = await fetch_years(update.effective_user.id)
+    await update.callback_query.edit_message_text("Оберіть рік:", reply_markup=years_ikb(years))
+    return STAT_YEAR_SELECT
+
+@router.route("stats:year:{y:int}")
+async def cb_stats_year(update: Update, context: ContextTypes.DEFAULT_TYPE, y: int):
+    q = update.callback_query
+    context.user_data["year"] = y
+    mode = context.user_data.get("stat_mode")
+    if mode == "qtr":
+        await q.edit_message_text("Оберіть квартал:", reply_markup=quarters_ikb(y))
+        return STAT_MONTH_SELECT
+    if mode == "year":
+        await show_year(q, update.effective_user.id, y)
         return MAIN
+    if mode == "yoy":
+        await show_yoy(q, update.effective_user.id, y)
+        return MAIN
+    await q.edit_message_text("Оберіть місяць:", reply_markup=months_ikb())
+    return STAT_MONTH_SELECT
 
-    if data.startswith("sub:"):
-        val = data.split(":")[1]
-        tname = context.user_data.get("tname", TYPES[0])
-        cat_name = context.user_data.get("cat_name")
-        if val == "none":
-            context.user_data["sub_name"] = None
-        else:
-            subs = CATEGORIES[tname][cat_name] or []
-            idx = int(val)
-            if idx < 0 or idx >= len(subs):
-                await q.edit_message_text("Обери підкатегорію:", reply_markup=subcategories_ikb(tname, cat_name))
-                return MAIN
-            context.user_data["sub_name"] = subs[idx]
-        await q.edit_message_text(
-            "Введи суму (наприклад 123.45):",
-            reply_markup=ikb([[("↩️ Назад", "back:cats"), ("🏠 Головне меню", "main:open")]])
-        )
-        return AMOUNT
+@router.route("back:month")
+async def cb_back_month(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Оберіть місяць:", reply_markup=months_ikb())
+    return STAT_MONTH_SELECT
 
-    # СТАТИСТИКА
-    if data == "stats:open":
-        await q.edit_message_text("Оберіть режим:", reply_markup=stat_mode_ikb())
-        return MAIN
+@router.route("stats:month:{m:int}")
+async def cb_stats_month(update: Update, context: ContextTypes.DEFAULT_TYPE, m: int):
+    q = update.callback_query
+    context.user_data["month"] = m
+    y = context.user_data["year"]
+    if context.user_data.get("stat_mode") == "day":
+        await q.edit_message_text("Оберіть день:", reply_markup=days_ikb(y, m))
+        return STAT_DAY_SELECT
+    await show_stats_page(q, context, update.effective_user.id, y, m)
+    return MAIN
 
-    if data == "back:statsmode":
-        await q.edit_message_text("Оберіть режим:", reply_markup=stat_mode_ikb())
-        return MAIN
+@router.route("back:statselect")
+async def cb_back_statselect(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    if context.user_data.get("stat_mode") == "day":
+        y = context.user_data.get("year", datetime.now().year)
+        m = context.user_data.get("month", datetime.now().month)
+        await q.edit_message_text("Оберіть день:", reply_markup=days_ikb(y, m))
+        return STAT_DAY_SELECT
+    await q.edit_message_text("Оберіть місяць:", reply_markup=months_ikb())
+    return STAT_MONTH_SELECT
+
+@router.route("stats:day:{d:int}")
+async def cb_stats_day(update: Update, context: ContextTypes.DEFAULT_TYPE, d: int):
+    y, m = context.user_data["year"], context.user_data["month"]
+    await show_stats_page(update.callback_query, context, update.effective_user.id, y, m, d)
+    return MAIN
 
-    if data.startswith("stats:mode:"):
-        mode = data.split(":")[2]  # day|mon
-        context.user_data["stat_mode"] = mode
-        await q.edit_message_text("Оберіть рік:", reply_markup=years_ikb())
-        return STAT_YEAR_SELECT
+@router.route("stats:pg:{period}:{page:int}:{direction}:{cday:int}:{cid:int}")
+async def cb_stats_page(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                        period: str, page: int, direction: str, cday: int, cid: int):
+    # період YYYYMM|YYYYMMDD; курсор (cday, cid) — край поточної сторінки, direction n|p
+    if (not period.isdigit() or len(period) not in (6, 8) or direction not in ("n", "p") or page < 1
+            or parse_day(int(period) * 100 + 1 if len(period) == 6 else int(period)) is None):
+        return await cb_unknown(update, context)
+    y, m = int(period[:4]), int(period[4:6])
+    d = int(period[6:]) if len(period) == 8 else None
+    await show_stats_page(update.callback_query, context, update.effective_user.id,
+                          y, m, d, page, (cday, cid), direction == "p")
+    return MAIN
 
-    if data == "back:year":
-        await q.edit_message_text("Оберіть рік:", reply_markup=years_ikb())
-        return STAT_YEAR_SELECT
+# Тиждень / квартал / рік / свій період / рік до року — лише підсумки з префіксних сум
+RANGE_HINT = (
+    "Введи період: початок і кінець через пробіл.\n"
+    "Формати: 2025, 2025-03, 2025-03-14 або 14.03.2025\n"
+    "Напр.: 2025-01-15 2025-03-01 або просто 2024"
+)
+YOY_TOP = 5
+TRENDS_TOP = 8
+TREND_FLAT = 0.03   # |нахил| менше 3%/міс — «стабільно»
+
+def parse_range_text(text: str):
+    # -> (lo, hi) як YYYYMMDD; ValueError, якщо не розібрано
+    parts = [re.sub(r"^(\d{1,2})\.(\d{1,2})\.(\d{4})$", r"\3-\2-\1", p)
+             for p in re.split(r"\s+|—|–", text.strip()) if p]
+    if not 1 <= len(parts) <= 2:
+        raise ValueError(text)
+    lo, hi = parse_period(parts[0]), parse_period(parts[-1], end=True)
+    if lo > hi:
+        raise ValueError(text)
+    return lo, hi
+
+async def range_view(uid, lo, hi, title, nav=None, back="back:statsmode"):
+    currency = await user_currency(uid)
+    totals, count = await fetch_range_totals(uid, lo, hi, currency)
+    return build_range_text(title, totals, count, currency), range_ikb(lo, hi, nav, back)
+
+async def show_week(q, uid, monday: int):
+    start = key_date(monday)
+    end = start + timedelta(days=6)
+    nav = [("◀️", f"stats:wk:{date_key(start - timedelta(days=7))}")]
+    if end < datetime.now().date():
+        nav.append(("▶️", f"stats:wk:{date_key(start + timedelta(days=7))}"))
+    text, markup = await range_view(uid, monday, date_key(end),
+                                    f"🗓 Тиждень {start:%d.%m} — {end:%d.%m.%Y}", nav)
+    await q.edit_message_text(text, reply_markup=markup)
+
+async def show_quarter(q, uid, y: int, n: int):
+    prev = (y, n - 1) if n > 1 else (y - 1, 4)
+    nxt = (y, n + 1) if n < 4 else (y + 1, 1)
+    nav = [("◀️", f"stats:qtr:{prev[0]}:{prev[1]}")]
+    if (nxt[0], nxt[1] * 3 - 2) <= (datetime.now().year, datetime.now().month):
+        nav.append(("▶️", f"stats:qtr:{nxt[0]}:{nxt[1]}"))
+    lo, hi = month_range(y, n * 3 - 2)[0], month_range(y, n * 3)[1]
+    text, markup = await range_view(uid, lo, hi, f"📆 {QUARTERS[n]} квартал {y}", nav, back="back:year")
+    await q.edit_message_text(text, reply_markup=markup)
+
+async def show_year(q, uid, y: int):
+    nav = [("◀️", f"stats:yr:{y - 1}")]
+    if y < datetime.now().year:
+        nav.append(("▶️", f"stats:yr:{y + 1}"))
+    text, markup = await range_view(uid, day_key(y, 1, 1), day_key(y, 12, 31), f"📈 {y} рік", nav, back="back:year")
+    await q.edit_message_text(text, reply_markup=markup)
+
+async def show_yoy(q, uid, y: int):
+    # поточний рік порівнюється з тим самим відрізком минулого (по сьогоднішню дату)
+    today = datetime.now().date()
+    cutoff = (today.month, today.day) if y == today.year else (12, 31)
+    if cutoff == (2, 29):
+        cutoff = (2, 28)
+    currency = await user_currency(uid)
+    spans = [(month_range(yy, m)[0], min(month_range(yy, m)[1], day_key(yy, *cutoff)))
+             for m in range(1, cutoff[0] + 1) for yy in (y, y - 1)]
+    spans += [(day_key(yy, 1, 1), day_key(yy, *cutoff)) for yy in (y, y - 1)]
+    results = await asyncio.gather(*(fetch_totals(uid, lo, hi, currency) for lo, hi in spans))
+    expenses = [sum(a for t, _, a in totals if t == "💸 Витрати") for totals in results[:-2]]
+    months = [(m, expenses[2 * i], expenses[2 * i + 1]) for i, m in enumerate(range(1, cutoff[0] + 1))]
+    nav = [("◀️", f"stats:yoy:{y - 1}")]
+    if y < today.year:
+        nav.append(("▶️", f"stats:yoy:{y + 1}"))
+    text = build_yoy_text(y, months, results[-2], results[-1], currency)
+    await q.edit_message_text(text, reply_markup=ikb([nav, [("↩️ Назад", "back:year"),
+                                                             ("🏠 Головне меню", "main:open")]]))
+
+@router.route("stats:trend")
+async def cb_stats_trend(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    import analytics   # numpy — лише коли просять тренди, а не на кожному холодному старті
+    uid = update.effective_user.id
+    currency = await user_currency(uid)
+    report = analytics.analyze(*await fetch_expense_series(uid, currency), datetime.now().date())
+    await update.callback_query.edit_message_text(
+        build_trends_text(report, currency),
+        reply_markup=ikb([[("↩️ Назад", "back:statsmode"), ("🏠 Головне меню", "main:open")]]))
+    return MAIN
 
-    if data.startswith("stats:year:"):
-        y = int(data.split(":")[2])
-        context.user_data["year"] = y
-        await q.edit_message_text("Оберіть місяць:", reply_markup=months_ikb())
-        return STAT_MONTH_SELECT
+@router.route("stats:wk:{monday:int}")
+async def cb_stats_week(update: Update, context: ContextTypes.DEFAULT_TYPE, monday: int):
+    start = parse_day(monday)
+    # лише понеділки не пізніше сьогодні; рік 1 — щоб «◀️» не вийшов за межі date
+    if start is None or start.weekday() or start.year == 1 or start > datetime.now().date():
+        return await cb_unknown(update, context)
+    await show_week(update.callback_query, update.effective_user.id, monday)
+    return MAIN
 
-    if data == "back:month":
-        await q.edit_message_text("Оберіть місяць:", reply_markup=months_ikb())
-        return STAT_MONTH_SELECT
+@router.route("stats:qtr:{y:int}:{n:int}")
+async def cb_stats_quarter(update: Update, context: ContextTypes.DEFAULT_TYPE, y: int, n: int):
+    if n not in QUARTERS:
+        return await cb_unknown(update, context)
+    context.user_data["year"] = y
+    await show_quarter(update.callback_query, update.effective_user.id, y, n)
+    return MAIN
 
-    if data.startswith("stats:month:"):
-        m = int(data.split(":")[2])
-        context.user_data["month"] = m
-        if context.user_data.get("stat_mode") == "day":
-            y = context.user_data["year"]
-            await q.edit_message_text("Оберіть день:", reply_markup=days_ikb(y, m))
-            return STAT_DAY_SELECT
-        rows = fetch_month(uid, context.user_data["year"], m)
-        title = f"📆 {MONTHS[m]} {context.user_data['year']}"
-        context.user_data["last_report"] = ("month", rows, title)
-        await q.edit_message_text(build_stats_text(rows, title), reply_markup=stats_actions_ikb())
-        return MAIN
+@router.route("stats:yr:{y:int}")
+async def cb_stats_year_range(update: Update, context: ContextTypes.DEFAULT_TYPE, y: int):
+    context.user_data["year"] = y
+    await show_year(update.callback_query, update.effective_user.id, y)
+    return MAIN
 
-    if data == "back:statselect":
-        mode = context.user_data.get("stat_mode")
-        if mode == "day":
-            y = context.user_data.get("year", datetime.now().year)
-            m = context.user_data.get("month", datetime.now().month)
-            await q.edit_message_text("Оберіть день:", reply_markup=days_ikb(y, m))
-            return STAT_DAY_SELECT
-        else:
-            await q.edit_message_text("Оберіть місяць:", reply_markup=months_ikb())
-            return STAT_MONTH_SELECT
-
-    if data.startswith("stats:day:"):
-        d = int(data.split(":")[2])
-        y, m = context.user_data["year"], context.user_data["month"]
-        rows, _ = fetch_day(uid, y, m, d)
-        title = f"📅 {d} {MONTHS[m]} {y}"
-        context.user_data["last_report"] = ("day", rows, title)
-        await q.edit_message_text(build_stats_text(rows, title), reply_markup=stats_actions_ikb())
-        return MAIN
+@router.route("stats:yoy:{y:int}")
+async def cb_stats_yoy(update: Update, context: ContextTypes.DEFAULT_TYPE, y: int):
+    context.user_data["year"] = y
+    await show_yoy(update.callback_query, update.effective_user.id, y)
+    return MAIN
 
-    if data == "stats:pdf":
-        payload = context.user_data.get("last_report")
-        if not payload:
-            await q.answer("Спочатку сформуйте звіт.", show_alert=True)
-            return MAIN
-        _, rows, title = payload
-        fname = "report.pdf"
-        make_pdf(rows, title, fname)
-        with open(fname, "rb") as f:
-            await q.message.reply_document(document=InputFile(f, filename=fname), caption=title)
-        await q.message.reply_text("Що далі?", reply_markup=stats_actions_ikb())
+@router.route("stats:rpie:{lo:int}:{hi:int}")
+async def cb_stats_range_pie(update: Update, context: ContextTypes.DEFAULT_TYPE, lo: int, hi: int):
+    if not valid_range(lo, hi):
+        return await cb_unknown(update, context)
+    q = update.callback_query
+    uid = update.effective_user.id
+    currency = await user_currency(uid)
+    caption = f"Розподіл витрат — {fmt_day(lo)} — {fmt_day(hi)}"
+
+    async def render():
+        totals = await fetch_totals(uid, lo, hi, currency)
+        return await renderer.submit("charts:pie_expenses", totals, caption)
+
+    version = await fetch_period_version(uid, lo, hi)
+    try:
+        sent = await reply_rendered(q.message, (uid, f"{lo}-{hi}", version), f"pie:{currency}", render,
+                                    caption=caption)
+    except RenderBusy:
+        await q.message.reply_text(RENDER_BUSY_TEXT, reply_markup=range_ikb(lo, hi))
+        return MAIN
+    if sent is None:
+        await q.answer("Немає даних по витратах для діаграми.", show_alert=True)
         return MAIN
+    await q.message.reply_text("Що далі?", reply_markup=range_ikb(lo, hi))
+    return MAIN
 
-    if data == "stats:pie":
-        payload = context.user_data.get("last_report")
-        if not payload:
-            await q.answer("Немає даних по витратах для діаграми.", show_alert=True)
-            return MAIN
-        _, rows, title = payload
-        img = "pie.png"
-        ok = make_pie_expenses(rows, f"Розподіл витрат — {title}", img)
-        if not ok:
-            await q.answer("Немає даних по витратах для діаграми.", show_alert=True)
-            return MAIN
-        with open(img, "rb") as f:
-            await q.message.reply_photo(photo=f, caption=f"Розподіл витрат — {title}")
-        await q.message.reply_text("Що далі?", reply_markup=stats_actions_ikb())
+@router.route("stats:rcsv:{lo:int}:{hi:int}")
+async def cb_stats_range_csv(update: Update, context: ContextTypes.DEFAULT_TYPE, lo: int, hi: int):
+    if not valid_range(lo, hi):
+        return await cb_unknown(update, context)
+    q = update.callback_query
+    try:
+        sent = await send_export(q.message, update.effective_user.id, "csv", lo, hi)
+    except RenderBusy:
+        await q.message.reply_text(RENDER_BUSY_TEXT, reply_markup=range_ikb(lo, hi))
         return MAIN
+    if not sent:
+        await q.answer("За цей період немає записів.", show_alert=True)
+        return MAIN
+    await q.message.reply_text("Що далі?", reply_markup=range_ikb(lo, hi))
+    return MAIN
 
-    # ПРОФІЛЬ
-    if data == "profile:open":
-        txt, _ = profile_summary(uid)
-        await q.edit_message_text(txt or "Профіль не знайдено", reply_markup=profile_menu_ikb())
+@router.route("stats:pdf")
+async def cb_stats_pdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    uid = update.effective_user.id
+    payload = context.user_data.get("last_report")
+    if not payload or len(payload) != 7:
+        await q.answer("Спочатку сформуйте звіт.", show_alert=True)
         return MAIN
+    kind, _, y, m, d, *version = payload
+    title = report_title(y, m, d)
+    currency = await user_currency(uid)
 
-    if data == "profile:editname":
-        await q.edit_message_text("Введи нове ім’я:", reply_markup=ikb([[("↩️ Назад", "back:main"), ("🏠 Головне меню", "main:open")]]))
-        return PROFILE_EDIT_NAME
+    async def render():
+        rows = await fetch_report_rows(uid, y, m, d)
+        totals = await fetch_totals(uid, *report_range(y, m, d), currency)
+        return await renderer.submit("reports:make_pdf", rows, title, totals, currency)
 
-    if data == "profile:editcur":
-        await q.edit_message_text("Оберіть валюту:", reply_markup=currency_pick_ikb("prof"))
+    try:
+        await reply_rendered(q.message, (uid, report_period(y, m, d), version), f"pdf:{currency}", render,
+                             caption=title, filename="report.pdf")
+    except RenderBusy:
+        await q.message.reply_text(RENDER_BUSY_TEXT, reply_markup=stats_actions_ikb(kind))
         return MAIN
+    await q.message.reply_text("Що далі?", reply_markup=stats_actions_ikb(kind))
+    return MAIN
 
-    if data.startswith("prof:setcur:"):
-        curx = data.split(":", 2)[2]
-        cur.execute("UPDATE users SET currency=? WHERE user_id=?", (curx, uid))
-        conn.commit()
-        txt, _ = profile_summary(uid)
-        await q.edit_message_text("✅ Валюту оновлено.\n\n" + (txt or ""), reply_markup=profile_menu_ikb())
+@router.route("stats:pie", chart="pie")
+@router.route("stats:bar", chart="bar")
+@router.route("stats:stack", chart="stack")
+async def cb_stats_chart(update: Update, context: ContextTypes.DEFAULT_TYPE, chart: str):
+    q = update.callback_query
+    uid = update.effective_user.id
+    payload = context.user_data.get("last_report")
+    if not payload or len(payload) != 7:
+        await q.answer("Немає даних по витратах для діаграми.", show_alert=True)
         return MAIN
+    kind, _, y, m, d, *version = payload
+    title = report_title(y, m, d)
+    currency = await user_currency(uid)
+    caption = {"pie": "Розподіл витрат", "bar": "Витрати по днях",
+               "stack": "Рух коштів за типами"}[chart] + f" — {title}"
+
+    async def render():
+        if chart == "pie":
+            totals = await fetch_totals(uid, *report_range(y, m, d), currency)
+            return await renderer.submit("charts:pie_expenses", totals, caption)
+        daily = await fetch_month_daily_totals(uid, y, m, currency)
+        return await renderer.submit("charts:bar_by_day" if chart == "bar" else "charts:stacked_by_type", daily, caption)
 
-    if data == "profile:allpdf":
-        cur.execute("""SELECT type, category, subcategory, amount, currency, comment
-                       FROM transactions WHERE user_id=? ORDER BY date ASC, id ASC""", (uid,))
-        rows = cur.fetchall()
-        if not rows:
-            await q.answer("Поки що немає жодного запису.", show_alert=True)
-            return MAIN
-        title = "Повний звіт за всі роки"
-        fname = "all_history.pdf"
-        make_pdf(rows, title, fname)
-        with open(fname, "rb") as f:
-            await q.message.reply_document(InputFile(f, filename=fname), caption=title)
-        await q.message.reply_text("Готово. Обери наступну дію:", reply_markup=profile_menu_ikb())
+    try:
+        sent = await reply_rendered(q.message, (uid, report_period(y, m, d), version), f"{chart}:{currency}", render,
+                                    caption=caption)
+    except RenderBusy:
+        await q.message.reply_text(RENDER_BUSY_TEXT, reply_markup=stats_actions_ikb(kind))
+        return MAIN
+    if sent is None:
+        await q.answer("Немає даних по витратах для діаграми.", show_alert=True)
         return MAIN
+    await q.message.reply_text("Що далі?", reply_markup=stats_actions_ikb(kind))
+    return MAIN
 
-    # ВІКТОРИНА
-    if data == "quiz:start":
-        explain = (
-            "🎮 *Фінансова грамотність — міні-тест*\n"
-            "──────────────────────\n"
-            "• 20 коротких запитань (A/B/C/D)\n"
-            "• В кінці — бали + розбір помилок\n\n"
-            "Готовий? Зараз з’явиться перше питання 👇"
-        )
-        q_indexes = list(range(len(QUIZ_QUESTIONS_BASE)))
-        random.shuffle(q_indexes)
-        q_indexes = q_indexes[:20]
-        context.user_data["quiz_idx_list"] = q_indexes
-        context.user_data["quiz_pos"] = 0
-        context.user_data["quiz_score"] = 0
-        context.user_data["quiz_mistakes"] = []
-        await q.edit_message_text(explain, parse_mode="Markdown")
-        return await quiz_ask_next(update, context)
-
-    if data.startswith("quiz:ans:"):
-        parts = data.split(":")
-        qidx = int(parts[2])   # позиція (0..19)
-        choice = int(parts[3]) # 0..3
-
-        pos = context.user_data.get("quiz_pos", 0)
-        if qidx != pos:
-            await q.answer("Відповідь уже прийнята, рухаємось далі…")
-            return QUIZ_ACTIVE
-
-        idx_list = context.user_data.get("quiz_idx_list", [])
-        base_idx = idx_list[pos]
-        item = QUIZ_QUESTIONS_BASE[base_idx]
-
-        correct = item["ans"]
-        letters = ["A", "B", "C", "D"]
-        if choice == correct:
-            context.user_data["quiz_score"] = context.user_data.get("quiz_score", 0) + 1
-            await q.answer("✅ Правильно!")
-        else:
-            context.user_data["quiz_mistakes"].append(
-                (item["q"], letters[choice], letters[correct], item["opts"][correct])
-            )
-            await q.answer("❌ Неправильно")
-
-        context.user_data["quiz_pos"] = pos + 1
-        return await quiz_ask_next(update, context)
-
-    # 📚 ФІНАНСОВИЙ БЛОГ (нова кнопка)
-    if data == "blog:open":
-        blog_text = (
-            "📚 *Фінансовий блог*\n"
-            "— наша добірка статей про бюджет, інвестиції, подушку безпеки та економію.\n\n"
-            "🔎 Всередині: короткі практичні матеріали з прикладами, чек-листами та порадами.\n"
-            "Натисни кнопку нижче, щоб перейти на сайт зі *всіма статтями*."
-        )
-        await q.edit_message_text(blog_text, parse_mode="Markdown", reply_markup=blog_ikb())
+# БЮДЖЕТИ
+async def show_budgets(q, uid):
+    items = await budgets.list(uid, today_key())
+    await q.edit_message_text(build_budgets_text(items), reply_markup=budgets_ikb(items))
+
+@router.route("budget:open")
+async def cb_budget_open(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_budgets(update.callback_query, update.effective_user.id)
+    return MAIN
+
+@router.route("budget:add")
+async def cb_budget_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Категорія витрат для ліміту:", reply_markup=budget_categories_ikb())
+    return MAIN
+
+def budget_category(idx: int):
+    # індекс з callback_data -> категорія витрат або None (застарілі/підроблені кнопки)
+    cats = list(CATEGORIES["💸 Витрати"])
+    return cats[idx] if 0 <= idx < len(cats) else None
+
+@router.route("budget:cat:{idx:int}")
+async def cb_budget_cat(update: Update, context: ContextTypes.DEFAULT_TYPE, idx: int):
+    c = budget_category(idx)
+    if c is None:
+        return await cb_budget_add(update, context)
+    await update.callback_query.edit_message_text(
+        f"{CATEGORY_EMOJI.get(c, '')} {c}: ліміт на який період?",
+        reply_markup=ikb([[("📆 На місяць", f"budget:per:{idx}:month"), ("🗓 На тиждень", f"budget:per:{idx}:week")],
+                          [("↩️ Назад", "budget:add"), ("🏠 Головне меню", "main:open")]]))
+    return MAIN
+
+@router.route("budget:per:{idx:int}:{period}")
+async def cb_budget_period(update: Update, context: ContextTypes.DEFAULT_TYPE, idx: int, period: str):
+    c = budget_category(idx)
+    if c is None or period not in BUDGET_PERIODS:
+        return await cb_unknown(update, context)
+    context.user_data["budget_cat"] = c
+    context.user_data["budget_period"] = period
+    currency = await user_currency(update.effective_user.id)
+    await update.callback_query.edit_message_text(
+        f"Введи ліміт для «{c}» на {BUDGET_PERIODS[period]} ({currency}), напр. 8000:",
+        reply_markup=ikb([[("↩️ Назад", "budget:open"), ("🏠 Головне меню", "main:open")]]))
+    return BUDGET_LIMIT
+
+@router.route("budget:del:{ref}:{period}")
+async def cb_budget_delete(update: Update, context: ContextTypes.DEFAULT_TYPE, ref: str, period: str):
+    # ref — budget_ref(категорія) з самого бюджету; невідповідність — кнопка застаріла, лише оновлюємо екран
+    uid = update.effective_user.id
+    for c, p, *_ in await budgets.list(uid, today_key()):
+        if p == period and budget_ref(c) == ref:
+            await budgets.remove(uid, c, p)
+            break
+    await show_budgets(update.callback_query, uid)
+    return MAIN
+
+# ПРОФІЛЬ
+@router.route("profile:open")
+async def cb_profile_open(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    txt, _ = await profile_summary(update.effective_user.id)
+    await update.callback_query.edit_message_text(txt or "Профіль не знайдено", reply_markup=profile_menu_ikb())
+    return MAIN
+
+@router.route("profile:editname")
+async def cb_profile_editname(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Введи нове ім’я:", reply_markup=ikb([[("↩️ Назад", "back:main"), ("🏠 Головне меню", "main:open")]]))
+    return PROFILE_EDIT_NAME
+
+@router.route("profile:editcur")
+async def cb_profile_editcur(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text("Оберіть валюту:", reply_markup=currency_pick_ikb("prof"))
+    return MAIN
+
+@router.route("prof:setcur:{curx}")
+async def cb_profile_setcur(update: Update, context: ContextTypes.DEFAULT_TYPE, curx: str):
+    uid = update.effective_user.id
+    await set_user_currency(uid, curx)
+    txt, _ = await profile_summary(uid)
+    await update.callback_query.edit_message_text("✅ Валюту оновлено.\n\n" + (txt or ""), reply_markup=profile_menu_ikb())
+    return MAIN
+
+@router.route("profile:allpdf")
+async def cb_profile_allpdf(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    uid = update.effective_user.id
+    if not await has_transactions(uid):
+        await q.answer("Поки що немає жодного запису.", show_alert=True)
         return MAIN
+    title = "Повний звіт за всі роки"
+    currency = await user_currency(uid)
+
+    async def render():
+        # воркер сам читає історію курсором пачками і пише PDF у тимчасовий файл;
+        # підсумки — у валюті користувача за курсом на дату кожного запису
+        rates = await fetch_rate_factors(uid, currency)
+        path = await renderer.submit("reports:make_history_pdf", os.path.abspath(db.path), uid, title,
+                                     currency, rates)
+        return await asyncio.to_thread(read_and_remove, path)
+
+    version = await fetch_period_version(uid, 0, 99999999)
+    try:
+        await reply_rendered(q.message, (uid, "all", version), f"pdf:{currency}", render,
+                             caption=title, filename="all_history.pdf")
+    except RenderBusy:
+        await q.message.reply_text(RENDER_BUSY_TEXT, reply_markup=profile_menu_ikb())
+        return MAIN
+    await q.message.reply_text("Готово. Обери наступну дію:", reply_markup=profile_menu_ikb())
+    return MAIN
 
-    await q.answer("Невідома дія.", show_alert=True)
+EXPORT_HINT = (
+    "Формат: /export [csv|json] [з] [по]\n"
+    "Дати — РРРР, РРРР-ММ або РРРР-ММ-ДД, напр.:\n"
+    "/export — уся історія в CSV\n"
+    "/export json 2025 — 2025 рік у NDJSON\n"
+    "/export csv 2025-01 2025-03 — з січня по березень"
+)
+
+async def send_export(message, uid, fmt="csv", lo=0, hi=99999999):
+    # -> False, якщо за період немає записів; RenderBusy — як у PDF
+    version = await fetch_period_version(uid, lo, hi)
+    count = version[0]
+    if not count:
+        return False
+    period = "all" if (lo, hi) == (0, 99999999) else f"{lo}-{hi}"
+    suffix = "" if period == "all" else f"_{lo}_{hi}"
+
+    async def render():
+        # воркер читає курсором пачками і пише gzip-файл на диск
+        path = await renderer.submit("export:write_export", os.path.abspath(db.path), uid, fmt, lo, hi)
+        return await asyncio.to_thread(read_and_remove, path)
+
+    await reply_rendered(message, (uid, period, version), f"export:{fmt}", render,
+                         caption=f"🗂 Експорт: {count} записів", filename=f"transactions{suffix}{EXPORT_FORMATS[fmt]}")
+    return True
+
+@router.route("profile:export")
+async def cb_profile_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    q = update.callback_query
+    try:
+        sent = await send_export(q.message, update.effective_user.id)
+    except RenderBusy:
+        await q.message.reply_text(RENDER_BUSY_TEXT, reply_markup=profile_menu_ikb())
+        return MAIN
+    if not sent:
+        await q.answer("Поки що немає жодного запису.", show_alert=True)
+        return MAIN
+    await q.message.reply_text("Інші формати й періоди:\n" + EXPORT_HINT, reply_markup=profile_menu_ikb())
+    return MAIN
+
+IMPORT_HINT = (
+    "📥 ІМПОРТ ІСТОРІЇ\n"
+    "━━━━━━━━━━━━━━━━━━━\n"
+    "Надішли файл .csv документом — я додам усі записи з нього.\n\n"
+    "Підходять:\n"
+    "• виписка monobank (CSV з застосунку);\n"
+    "• виписка Приват24 (збережена як CSV);\n"
+    "• власна таблиця з колонками date, amount і, за бажання, type, category, subcategory, currency, comment "
+    "(так виглядає й експорт бота).\n\n"
+    "Категорії визначаю за описом і MCC, знак суми — витрата чи надходження. "
+    f"Записи, що вже є в базі (той самий день, тип і сума), пропускаю. Розмір файлу — до {IMPORT_MAX_MB} МБ."
+)
+
+@router.route("profile:import")
+async def cb_profile_import(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.callback_query.edit_message_text(IMPORT_HINT, reply_markup=profile_menu_ikb())
+    return MAIN
+
+# ВІКТОРИНА
+@router.route("quiz:start")
+async def cb_quiz_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    explain = (
+        "🎮 *Фінансова грамотність — міні-тест*\n"
+        "──────────────────────\n"
+        "• 20 коротких запитань (A/B/C/D)\n"
+        "• В кінці — бали + розбір помилок\n\n"
+        "Готовий? Зараз з’явиться перше питання 👇"
+    )
+    q_indexes = list(range(len(QUIZ_QUESTIONS_BASE)))
+    random.shuffle(q_indexes)
+    q_indexes = q_indexes[:20]
+    context.user_data["quiz_idx_list"] = q_indexes
+    context.user_data["quiz_pos"] = 0
+    context.user_data["quiz_score"] = 0
+    context.user_data["quiz_mistakes"] = []
+    await update.callback_query.edit_message_text(explain, parse_mode="Markdown")
+    return await quiz_ask_next(update, context)
+
+@router.route("quiz:ans:{qidx:int}:{choice:int}")
+async def cb_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE, qidx: int, choice: int):
+    # qidx — позиція питання (0..19), choice — варіант 0..3
+    q = update.callback_query
+    pos = context.user_data.get("quiz_pos", 0)
+    if qidx != pos:
+        await q.answer("Відповідь уже прийнята, рухаємось далі…")
+        return QUIZ_ACTIVE
+
+    idx_list = context.user_data.get("quiz_idx_list", [])
+    base_idx = idx_list[pos]
+    item = QUIZ_QUESTIONS_BASE[base_idx]
+
+    correct = item["ans"]
+    letters = ["A", "B", "C", "D"]
+    if choice == correct:
+        context.user_data["quiz_score"] = context.user_data.get("quiz_score", 0) + 1
+        await q.answer("✅ Правильно!")
+    else:
+        context.user_data["quiz_mistakes"].append(
+            (item["q"], letters[choice], letters[correct], item["opts"][correct])
+        )
+        await q.answer("❌ Неправильно")
+
+    context.user_data["quiz_pos"] = pos + 1
+    return await quiz_ask_next(update, context)
+
+# 📚 ФІНАНСОВИЙ БЛОГ
+@router.route("blog:open")
+async def cb_blog_open(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    blog_text = (
+        "📚 *Фінансовий блог*\n"
+        "— наша добірка статей про бюджет, інвестиції, подушку безпеки та економію.\n\n"
+        "🔎 Всередині: короткі практичні матеріали з прикладами, чек-листами та порадами.\n"
+        "Натисни кнопку нижче, щоб перейти на сайт зі *всіма статтями*."
+    )
+    await update.callback_query.edit_message_text(blog_text, parse_mode="Markdown", reply_markup=blog_ikb())
     return MAIN
 
 async def quiz_ask_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -845,6 +1511,7 @@ async def quiz_ask_next(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return QUIZ_ACTIVE
 
 # ===================== TEXT INPUT HANDLERS =====================
+@timed("handler_seconds")
 async def handle_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = (update.message.text or "").replace(",", ".").strip()
     try:
@@ -862,12 +1529,13 @@ async def handle_amount(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return COMMENT
 
+@timed("handler_seconds")
 async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     comment = update.message.text
     if comment == "-":
         comment = None
     uid = update.effective_user.id
-    u = get_user(uid)
+    u = await get_user(uid)
     currency = u[2] if u else "грн"
     tname = context.user_data.get("tname")
     cat = context.user_data.get("cat_name")
@@ -878,35 +1546,222 @@ async def handle_comment(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data.clear()
         return MAIN
     date_str = datetime.now().strftime("%Y-%m-%d")
-    save_tx(uid, tname, cat, sub, amount, currency, comment, date_str)
+    await save_tx(uid, tname, cat, sub, amount, currency, comment, date_str)
     context.user_data.clear()
+    # бюджет: сума періоду вже оновлена в save_tx — тут лише читання по PK
+    for period, spent, limit in await budgets.check(uid, cat, currency, today_key()):
+        context.job_queue.run_once(budget_alert_job, when=0, chat_id=uid, user_id=uid,
+                                   data=(cat, period, spent, limit, currency))
     await send_main_menu(update, context,
         f"✅ Записано: {tname} → {CATEGORY_EMOJI.get(cat,'')} {cat} → {sub or '-'}\n"
         f"Сума: {amount:.2f} {currency}\nДата: {date_str}"
     )
     return MAIN
 
+@timed("handler_seconds")
 async def handle_profile_edit_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     name = (update.message.text or "").strip()
     if not name:
         await update.message.reply_text("Введи коректне ім’я 🙂",
                                         reply_markup=ikb([[("↩️ Назад", "back:main"), ("🏠 Головне меню", "main:open")]]))
         return PROFILE_EDIT_NAME
-    cur.execute("UPDATE users SET name=? WHERE user_id=?", (name, update.effective_user.id))
-    conn.commit()
-    txt, _ = profile_summary(update.effective_user.id)
+    await set_user_name(update.effective_user.id, name)
+    txt, _ = await profile_summary(update.effective_user.id)
     await update.message.reply_text("✅ Ім’я оновлено.\n\n" + (txt or ""), reply_markup=profile_menu_ikb())
     return MAIN
 
+@timed("handler_seconds")
+async def handle_budget_limit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    uid = update.effective_user.id
+    cat, period = context.user_data.get("budget_cat"), context.user_data.get("budget_period")
+    try:
+        limit = float((update.message.text or "").replace(",", ".").replace(" ", ""))
+    except ValueError:
+        limit = 0
+    if cat is None or period not in BUDGET_PERIODS:
+        await update.message.reply_text("Щось пішло не так. Повертаю у меню.", reply_markup=main_menu_ikb())
+        return MAIN
+    if limit <= 0:
+        await update.message.reply_text("Ліміт має бути додатним числом. Спробуй ще раз:",
+                                        reply_markup=ikb([[("↩️ Назад", "budget:open"), ("🏠 Головне меню", "main:open")]]))
+        return BUDGET_LIMIT
+    await budgets.set(uid, cat, period, limit, await user_currency(uid), today_key())
+    context.user_data.pop("budget_cat", None)
+    context.user_data.pop("budget_period", None)
+    items = await budgets.list(uid, today_key())
+    await update.message.reply_text("✅ Ліміт збережено.\n\n" + build_budgets_text(items), reply_markup=budgets_ikb(items))
+    return MAIN
+
+@timed("handler_seconds")
+async def handle_range_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        lo, hi = parse_range_text(update.message.text or "")
+    except ValueError:
+        await update.message.reply_text("Не вдалося розібрати період 🙂\n" + RANGE_HINT,
+                                        reply_markup=ikb([[("↩️ Назад", "back:statsmode"),
+                                                           ("🏠 Головне меню", "main:open")]]))
+        return STAT_RANGE_INPUT
+    text, markup = await range_view(update.effective_user.id, lo, hi, range_title(lo, hi))
+    await update.message.reply_text(text, reply_markup=markup)
+    return MAIN
+
+# ===================== ЕКСПОРТ (/export) =====================
+@timed("handler_seconds")
+async def cmd_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    uid = update.effective_user.id
+    args = list(context.args or [])
+    fmt = args.pop(0).lower() if args and args[0].lower() in EXPORT_FORMATS else "csv"
+    try:
+        lo = parse_period(args[0]) if args else 0
+        hi = parse_period(args[1] if len(args) > 1 else args[0], end=True) if args else 99999999
+        if len(args) > 2 or lo > hi:
+            raise ValueError(args)
+    except ValueError:
+        await update.message.reply_text("Не розумію параметри.\n\n" + EXPORT_HINT)
+        return
+    try:
+        sent = await send_export(update.message, uid, fmt, lo, hi)
+    except RenderBusy:
+        await update.message.reply_text(RENDER_BUSY_TEXT)
+        return
+    if not sent:
+        await update.message.reply_text("За цей період записів немає.")
+
+# ===================== ІМПОРТ (документ) =====================
+def import_progress_text(stats, done=False) -> str:
+    head = "✅ Імпорт завершено" if done else f"📥 Імпортую… {stats['percent']}%"
+    text = (f"{head}\n"
+            f"Рядків: {stats['rows']}\n"
+            f"➕ Додано: {stats['added']}\n"
+            f"♻️ Уже були в базі: {stats['duplicates']}\n"
+            f"⚠️ Не розпізнано: {stats['errors']}")
+    if done and stats["error_lines"]:
+        text += "\n\nНапр.: " + "; ".join(f"рядок {n}: {why}" for n, why in stats["error_lines"])
+    return text
+
+async def run_import(status, uid, document):
+    # фоново: handler уже відповів, апдейти користувача обробляються далі
+    fd, path = tempfile.mkstemp(suffix=".csv")
+    os.close(fd)
+    last = [0.0]
+
+    async def progress(stats):
+        now = asyncio.get_running_loop().time()
+        if now - last[0] >= IMPORT_PROGRESS_EVERY:
+            last[0] = now
+            await status.edit_text(import_progress_text(stats))
+
+    try:
+        tg_file = await document.get_file()
+        await tg_file.download_to_drive(path)
+        stats = await importer.run(uid, path, await user_currency(uid), progress, reserved=True)
+        await budgets.refresh(uid, today_key())
+        await status.edit_text(import_progress_text(stats, done=True), reply_markup=main_menu_ikb())
+    except StatementError as exc:
+        await status.edit_text(f"❌ Не вдалося розібрати файл: {exc}.\n\n" + IMPORT_HINT,
+                               reply_markup=main_menu_ikb())
+    except Exception:
+        await status.edit_text("❌ Імпорт перервано через помилку. Уже додані пачки збережено — "
+                               "повторний імпорт того ж файлу їх пропустить.", reply_markup=main_menu_ikb())
+        raise
+    finally:
+        importer.release(uid)
+        os.remove(path)
+
+@timed("handler_seconds")
+async def handle_import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    doc = update.message.document
+    uid = update.effective_user.id
+    if not await get_user(uid):
+        await update.message.reply_text("Спершу натисни /start і заверши реєстрацію 🙂")
+        return
+    if not (doc.file_name or "").lower().endswith((".csv", ".txt")):
+        await update.message.reply_text("Підтримую лише CSV-файли.\n\n" + IMPORT_HINT)
+        return
+    if (doc.file_size or 0) > IMPORT_MAX_MB * 1024 * 1024:
+        await update.message.reply_text(f"Файл завеликий — максимум {IMPORT_MAX_MB} МБ.")
+        return
+    # займаємо до першого await: другий файл, що прийде, поки надсилається статус, побачить зайнятість
+    if not importer.reserve(uid):
+        await update.message.reply_text("⏳ Попередній імпорт ще триває — дочекайся його завершення.")
+        return
+    try:
+        status = await update.message.reply_text("📥 Завантажую файл…")
+    except BaseException:
+        importer.release(uid)
+        raise
+    context.application.create_task(run_import(status, uid, doc), update=update)
+
 # ===================== START/ONBOARD TEXT =====================
+@timed("handler_seconds")
 async def cmd_start_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return await cmd_start(update, context)
 
 # ===================== APP =====================
+@timed("job_seconds")
+async def evict_idle_job(context: ContextTypes.DEFAULT_TYPE):
+    await context.application.persistence.evict_idle(context.application)
+
+metrics_server = MetricsServer() if metrics.ENABLED else None
+
+def runtime_metrics(app: Application):
+    # метрики, які вже рахуються деінде (роутер, черги) — віддаються під час скрейпу
+    def collect():
+        for r in router.routes:
+            yield "histogram", "callback_seconds", {"route": r.pattern}, r.latency
+            yield "counter", "callback_errors_total", {"route": r.pattern}, r.errors
+        yield "gauge", "updates_pending", {}, app.pending_updates
+        yield "gauge", "render_pending", {}, renderer.pending
+        yield "gauge", "render_cache_bytes", {}, render_cache.size
+        yield "gauge", "send_pending", {}, app.bot.rate_limiter.pending
+    return collect
+
+async def on_startup(app: Application):
+    await asyncio.to_thread(render_cache.open)
+    if metrics_server is not None:
+        metrics.REGISTRY.add_collector(runtime_metrics(app))
+        await metrics_server.start()
+
+async def on_shutdown(app: Application):
+    if metrics_server is not None:
+        await metrics_server.stop()
+    await rates_provider.close()
+    await asyncio.to_thread(renderer.shutdown)   # чекає воркерів — не в event loop
+    await asyncio.to_thread(render_cache.save)
+    await db.close()
+
 def build_app():
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Апдейти різних користувачів обробляються паралельно, одного — по черзі (dispatch.py).
+    # Обмежена update_queue дає backpressure: при перевантаженні webhook чекає.
+    builder = Application.builder().token(BOT_TOKEN)
+    if BOT_API_URL:
+        builder = builder.base_url(f"{BOT_API_URL}/bot").base_file_url(f"{BOT_API_URL}/file/bot")
+    if metrics.ENABLED:
+        # час кожного виклику Bot API (getUpdates з long polling не міряємо)
+        builder = builder.request(TimedRequest(connection_pool_size=256))
+    # Усі вихідні запити йдуть через планувальник: ліміти Telegram, злиття правок, RetryAfter (outbound.py)
+    app = (builder
+           .rate_limiter(SendScheduler())
+           .application_class(OrderedApplication)
+           .update_queue(asyncio.Queue(maxsize=MAX_PENDING))
+           .persistence(SQLitePersistence(db))
+           .post_init(on_startup)
+           .post_shutdown(on_shutdown)
+           .build())
+    # стан користувача з БД підвантажується на його першому апдейті, до будь-якого handler-а
+    app.add_handler(TypeHandler(Update, app.persistence.preload), group=-1)
     # Авто-оновлення курсів щохвилини
     app.job_queue.run_repeating(refresh_rates_job, interval=60, first=0)
+    # Історія курсів: щогодини згортаємо старі хвилинні/годинні точки
+    app.job_queue.run_repeating(rates_downsample_job, interval=3600, first=600)
+    app.job_queue.run_repeating(rates_backfill_job, interval=600, first=30)
+    # user_data неактивних користувачів вивантажується з пам’яті (лежить у БД до наступного апдейту)
+    app.job_queue.run_repeating(evict_idle_job, interval=600, first=600)
+    if RENDER_WARM:
+        app.job_queue.run_once(warm_render_job, when=2)
+    # Підсумок за минулий місяць — 1-го числа о DIGEST_HOUR (DIGEST_TZ); при старті — догоняюча перевірка
+    app.job_queue.run_monthly(monthly_digest_job, when=digest_send_time(), day=1)
+    app.job_queue.run_once(monthly_digest_job, when=60, data={"catchup": True})
 
     conv = ConversationHandler(
         entry_points=[CommandHandler("start", cmd_start)],
@@ -930,18 +1785,40 @@ def build_app():
                                 CallbackQueryHandler(on_cb)],
 
             QUIZ_ACTIVE: [CallbackQueryHandler(on_cb)],
+
+            STAT_RANGE_INPUT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_range_input),
+                               CallbackQueryHandler(on_cb)],
+
+            BUDGET_LIMIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_budget_limit),
+                           CallbackQueryHandler(on_cb)],
         },
         fallbacks=[CallbackQueryHandler(on_cb)],
-        allow_reentry=True
+        allow_reentry=True,
+        name="main",
+        persistent=True,
     )
 
     app.add_handler(conv)
     app.add_handler(CommandHandler("start", cmd_start_text))
+    app.add_handler(CommandHandler("export", cmd_export))
+    # документ у будь-якому стані розмови — імпорт (ConversationHandler документи не перехоплює)
+    app.add_handler(MessageHandler(filters.Document.ALL, handle_import_document))
     return app
 
 def main():
     app = build_app()
-    app.run_polling(allowed_updates=Update.ALL_TYPES)
+    if WEBHOOK_URL:
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=f"{WEBHOOK_URL}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=40,
+        )
+    else:
+        app.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == "__main__":
     main()
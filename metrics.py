@@ -0,0 +1,234 @@
+# metrics.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# МЕТРИКИ
+# Гістограма з фіксованими межами (як у Prometheus): observe() — це bisect
+# і два додавання, без алокацій, тож її можна ставити в гарячі шляхи.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict, deque
+
+from telegram.request import HTTPXRequest
+
+# секунди: від 5 мс до 10 с
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)   # останній — +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # оцінка за межею бакета, у який потрапляє q-та частка спостережень
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.bounds, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative(self):
+        # [(межа, кількість ≤ межі), ...] включно з +Inf — формат бакетів Prometheus
+        out, seen = [], 0
+        for bound, n in zip(self.bounds + (float("inf"),), self.counts):
+            seen += n
+            out.append((bound, seen))
+        return out
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# РЕЄСТР І ЕКСПОРТЕР
+# Метрики вмикаються змінною METRICS_PORT: тоді на METRICS_HOST:METRICS_PORT
+# піднімається локальний HTTP-ендпоінт (/metrics — формат Prometheus,
+# /slow — журнал повільних SQL у JSON). Без неї timed() повертає функцію
+# як є, а решта хуків — одна перевірка ENABLED.
+# ─────────────────────────────────────────────────────────────────────────────
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+ENABLED = METRICS_PORT > 0
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "50"))
+SLOW_LOG_SIZE = 200
+PREFIX = "finbot_"
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = {}    # (name, labels) -> Histogram
+        self.counters = {}      # (name, labels) -> float
+        self.collectors = []    # fn() -> [(kind, name, labels: dict, value), ...], kind: histogram|counter|gauge
+        self.slow = deque(maxlen=SLOW_LOG_SIZE)
+
+    def histogram(self, name, **labels) -> Histogram:
+        key = _key(name, labels)
+        h = self.histograms.get(key)
+        if h is None:
+            h = self.histograms[key] = Histogram()
+        return h
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_collector(self, fn):
+        self.collectors.append(fn)
+
+    def render(self) -> str:
+        # текстовий формат експозиції Prometheus 0.0.4
+        series = defaultdict(list)   # name -> [(kind, labels, value)]
+        for (name, labels), h in self.histograms.items():
+            series[name].append(("histogram", dict(labels), h))
+        for (name, labels), v in self.counters.items():
+            series[name].append(("counter", dict(labels), v))
+        for fn in self.collectors:
+            for kind, name, labels, value in fn():
+                series[name].append((kind, labels, value))
+        out = []
+        for name in sorted(series):
+            full = PREFIX + name
+            out.append(f"# TYPE {full} {series[name][0][0]}")
+            for kind, labels, value in series[name]:
+                if kind == "histogram":
+                    for bound, n in value.cumulative():
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        out.append(f"{full}_bucket{_labels(labels, le=le)} {n}")
+                    out.append(f"{full}_sum{_labels(labels)} {value.sum}")
+                    out.append(f"{full}_count{_labels(labels)} {value.count}")
+                else:
+                    out.append(f"{full}{_labels(labels)} {value}")
+        return "\n".join(out) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items.items()) + "}"
+
+
+REGISTRY = Registry()
+
+
+def observe(name, seconds, **labels):
+    if ENABLED:
+        REGISTRY.histogram(name, **labels).observe(seconds)
+
+
+def inc(name, value=1, **labels):
+    if ENABLED:
+        REGISTRY.inc(name, value, **labels)
+
+
+def timed(name, **labels):
+    # декоратор для async-функцій; мітка fn — ім’я функції, якщо не задано інше
+    def deco(fn):
+        if not ENABLED:
+            return fn
+        hist = REGISTRY.histogram(name, **{"fn": fn.__name__, **labels})
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                hist.observe(time.perf_counter() - start)
+        return wrapper
+    return deco
+
+
+def record_query(op, sql, seconds, n_ops=1):
+    # op: read|write; SQL повільніші за SLOW_QUERY_MS потрапляють у журнал /slow
+    REGISTRY.histogram("db_query_seconds", op=op).observe(seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        REGISTRY.inc("db_slow_queries_total", op=op)
+        sql = " ".join(sql.split())
+        REGISTRY.slow.append({"ts": time.time(), "op": op, "ms": round(seconds * 1000, 2),
+                              "ops": n_ops, "sql": sql[:500]})
+        _LOGGER.warning("Повільний SQL (%.1f мс, %s): %s", seconds * 1000, op, sql[:200])
+
+
+class TimedRequest(HTTPXRequest):
+    # час кожного виклику Bot API за методом (sendMessage, editMessageText, …)
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        start = time.perf_counter()
+        api = url.rsplit("/", 1)[-1]
+        try:
+            return await super().do_request(url, method, request_data, *args, **kwargs)
+        except Exception:
+            REGISTRY.inc("telegram_api_errors_total", method=api)
+            raise
+        finally:
+            REGISTRY.histogram("telegram_api_seconds", method=api).observe(time.perf_counter() - start)
+
+
+class MetricsServer:
+    # мінімальний HTTP/1.0 на asyncio: GET /metrics і GET /slow, лише для локального скрейпера
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def _handle(self, reader, writer):
+        try:
+            line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = line.decode("latin-1").split()
+            path = parts[1].split("?")[0] if len(parts) > 1 else ""
+            if path == "/metrics":
+                status, ctype, body = "200 OK", "text/plain; version=0.0.4", self.registry.render()
+            elif path == "/slow":
+                status, ctype = "200 OK", "application/json"
+                body = json.dumps(list(self.registry.slow), ensure_ascii=False)
+            else:
+                status, ctype, body = "404 Not Found", "text/plain", "not found\n"
+            data = body.encode()
+            writer.write(f"HTTP/1.0 {status}\r\nContent-Type: {ctype}; charset=utf-8\r\n"
+                         f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
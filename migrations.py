@@ -0,0 +1,193 @@
+# migrations.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ВЕРСІОНОВАНІ МІГРАЦІЇ СХЕМИ
+# Поточна версія схеми зберігається у PRAGMA user_version. Кожна міграція —
+# (версія, список SQL або функція conn -> None) і виконується в окремій
+# транзакції разом зі зміною user_version, тож обрив посередині не лишає
+# базу в проміжному стані. DDL усіх таблиць живе тут, а не в модулях
+# функцій: міграції не тягнуть telegram/render і не утворюють циклів
+# імпорту. rollups — лише для перерахунку даних (залежить тільки від sqlite3).
+# ─────────────────────────────────────────────────────────────────────────────
+
+import sqlite3
+
+import rollups
+
+
+def _day_expr(col: str = "date") -> str:
+    # 'YYYY-MM-DD' -> YYYYMMDD (INTEGER)
+    return f"CAST(REPLACE(substr({col}, 1, 10), '-', '') AS INTEGER)"
+
+
+# 3: підсумки по днях і місяцях (rollups.py); колонок cum_* ще немає — їх додає міграція 7
+_ROLLUP_TABLES = [
+    """CREATE TABLE IF NOT EXISTS daily_rollup (
+        user_id INTEGER NOT NULL,
+        day INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        cnt INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day, type, category, currency)
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS monthly_rollup (
+        user_id INTEGER NOT NULL,
+        month INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        category TEXT NOT NULL,
+        currency TEXT NOT NULL,
+        amount REAL NOT NULL DEFAULT 0,
+        cnt INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, type, category, currency)
+    ) WITHOUT ROWID""",
+]
+
+# 7: накопичувальні суми в daily_rollup для діапазонних запитів
+_ROLLUP_CUMULATIVE = [
+    "ALTER TABLE daily_rollup ADD COLUMN cum_amount REAL NOT NULL DEFAULT 0",
+    "ALTER TABLE daily_rollup ADD COLUMN cum_cnt INTEGER NOT NULL DEFAULT 0",
+    "CREATE INDEX IF NOT EXISTS idx_rollup_series ON daily_rollup(user_id, type, category, currency, day)",
+]
+
+
+def _rollups_step(conn: sqlite3.Connection):
+    for sql in _ROLLUP_TABLES:
+        conn.execute(sql)
+    rollups.rebuild(conn, cumulative=False)
+
+
+def _cumulative_step(conn: sqlite3.Connection):
+    for sql in _ROLLUP_CUMULATIVE:
+        conn.execute(sql)
+    rollups.refresh_cumulative(conn)
+
+
+MIGRATIONS = [
+    # 1: початкова схема (та, що раніше створювалась через CREATE TABLE IF NOT EXISTS)
+    (1, [
+        """CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            name TEXT,
+            currency TEXT DEFAULT 'грн',
+            created_at TEXT
+        )""",
+        """CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            type TEXT,
+            category TEXT,
+            subcategory TEXT,
+            amount REAL,
+            currency TEXT,
+            comment TEXT,
+            date TEXT,
+            created_at TEXT
+        )""",
+    ]),
+    # 2: числовий день YYYYMMDD + складений індекс, щоб день/місяць/вся історія
+    #    читались діапазоном по індексу, а не повним скануванням таблиці
+    (2, [
+        "ALTER TABLE transactions ADD COLUMN day INTEGER",
+        f"UPDATE transactions SET day = {_day_expr()}",
+        "CREATE INDEX IF NOT EXISTS idx_tx_user_day ON transactions(user_id, day)",
+    ]),
+    # 3: rollup-таблиці підсумків по днях і місяцях (заповнюються з наявної історії)
+    (3, _rollups_step),
+    # 4: історія курсів з пониженням роздільності (хвилини → години → дні), rate_history.py
+    (4, [
+        """CREATE TABLE IF NOT EXISTS rate_history (
+            pair TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (pair, resolution, ts)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_rate_pair_ts ON rate_history(pair, ts)",
+    ]),
+    # 5: стан розмов і user_data (переживає редеплой), persistence.py
+    (5, [
+        """CREATE TABLE IF NOT EXISTS user_state (
+            user_id INTEGER PRIMARY KEY,
+            data BLOB NOT NULL,
+            updated_at INTEGER NOT NULL
+        )""",
+        # key — JSON ключа ConversationHandler, напр. [chat_id, user_id]; user_id — для ледачого читання
+        """CREATE TABLE IF NOT EXISTS conversation_state (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            state,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID""",
+        "CREATE INDEX IF NOT EXISTS idx_conv_user ON conversation_state(user_id)",
+    ]),
+    # 6: прогрес щомісячної розсилки підсумків (продовження після рестарту), digest.py;
+    #    month — YYYYMM місяця, за який розсилка; last_user_id — кінець останньої завершеної пачки
+    (6, [
+        """CREATE TABLE IF NOT EXISTS digest_runs (
+            month INTEGER PRIMARY KEY,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            sent INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT,
+            finished_at TEXT
+        )""",
+    ]),
+    # 7: префіксні суми в daily_rollup (підсумок за будь-який діапазон — дві суми на серію)
+    (7, _cumulative_step),
+    # 8: бюджети по категоріях з поточною сумою періоду, budgets.py
+    (8, [
+        """CREATE TABLE IF NOT EXISTS budgets (
+            user_id INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            period TEXT NOT NULL,
+            limit_amount REAL NOT NULL,
+            currency TEXT NOT NULL,
+            bucket INTEGER NOT NULL DEFAULT 0,
+            spent REAL NOT NULL DEFAULT 0,
+            notified INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category, period)
+        ) WITHOUT ROWID""",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: int = SCHEMA_VERSION) -> int:
+    # conn має бути в autocommit (isolation_level=None): транзакціями керуємо тут
+    current = schema_version(conn)
+    for version, steps in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if callable(steps):
+                steps(conn)
+            else:
+                for sql in steps:
+                    conn.execute(sql)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        current = version
+    return current
+
+
+def day_key(y: int, m: int, d: int) -> int:
+    return y * 10000 + m * 100 + d
+
+
+def month_range(y: int, m: int):
+    # [перший, останній] день місяця як YYYYMMDD; 31 підходить для будь-якого місяця
+    return day_key(y, m, 1), day_key(y, m, 31)
@@ -0,0 +1,300 @@
+# outbound.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ПЛАНУВАЛЬНИК ВИХІДНИХ ЗАПИТІВ ДО BOT API (FLOOD CONTROL)
+# Підключається як rate_limiter бота, тож через нього проходить кожен
+# send*/edit*/copy*/forward*/delete* з handler-ів — без змін у місцях виклику.
+# Ліміти Telegram: ~30 повідомлень/с на бота, ~1/с у приватний чат
+# (дозволяємо короткий сплеск), ~20/хв у групу. Тому:
+#  • глобальний token bucket + окремий bucket на кожен чат;
+#  • на глобальний токен чекають у купі за пріоритетом: INTERACTIVE
+#    (відповіді на дії користувача, за замовчуванням) раніше за BULK
+#    (розсилки: rate_limit_args=BULK);
+#  • редагування того ж повідомлення, яке ще стоїть у черзі, не додає
+#    запит, а підміняє текст попереднього — піде лише останній стан;
+#  • RetryAfter ставить на паузу лише свій чат і повторює запит; якщо
+#    за FLOOD_WINDOW секунду його отримали FLOOD_CHATS різних чатів —
+#    це глобальний ліміт, і пауза стає глобальною.
+# Запити без chat_id (answerCallbackQuery, getMe, setWebhook, …) не
+# лімітуються, але RetryAfter для них теж обробляється.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections import deque
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+import metrics
+
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "30"))     # запитів/с на весь бот
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))          # запитів/с у приватний чат
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", "3"))        # сплеск у приватний чат
+SEND_GROUP_RATE = float(os.getenv("SEND_GROUP_RATE", str(20 / 60)))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+FLOOD_CHATS = 3
+FLOOD_WINDOW = 1.0
+CHAT_SWEEP_EVERY = 60.0
+
+INTERACTIVE = 0
+BULK = 1
+
+# chatAction не рахується як повідомлення; решта send*/edit*/… — рахується
+_UNTHROTTLED = frozenset({"sendChatAction"})
+_THROTTLED_PREFIXES = ("send", "edit", "copy", "forward", "delete")
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "stamp")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def delay(self, now: float) -> float:
+        # скільки чекати до наступного токена (0 — можна зараз)
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Chat:
+    __slots__ = ("bucket", "lock", "paused_until")
+
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.lock = asyncio.Lock()   # FIFO: порядок повідомлень у чаті зберігається
+        self.paused_until = 0.0
+
+
+class _Edit:
+    # редагування, яке ще чекає на токени; пізніші правки того ж повідомлення підміняють data
+    __slots__ = ("endpoint", "data", "future", "merged")
+
+    def __init__(self, endpoint: str, data: dict):
+        self.endpoint = endpoint
+        self.data = data
+        self.future = asyncio.get_running_loop().create_future()
+        self.merged = 0
+
+
+def _priority(rate_limit_args) -> int:
+    if isinstance(rate_limit_args, dict):
+        return rate_limit_args.get("priority", INTERACTIVE)
+    return INTERACTIVE if rate_limit_args is None else int(rate_limit_args)
+
+
+class SendScheduler(BaseRateLimiter):
+    def __init__(self, global_rate: float = SEND_GLOBAL_RATE, chat_rate: float = SEND_CHAT_RATE,
+                 chat_burst: float = SEND_CHAT_BURST, group_rate: float = SEND_GROUP_RATE,
+                 max_retries: int = SEND_MAX_RETRIES):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self._bucket = TokenBucket(global_rate, global_rate)   # сплеск — секунда ліміту
+        self._paused_until = 0.0
+        self._heap = []            # (пріоритет, seq, future) — очікують глобальний токен
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._pump_task = None
+        self._chats = {}           # chat_id -> _Chat
+        self._edits = {}           # (chat_id | inline_message_id, message_id) -> _Edit
+        self._floods = deque(maxlen=FLOOD_CHATS)   # (час, chat_id) останніх RetryAfter
+        self._swept = time.monotonic()
+        self.merged = 0
+        self.retries = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    # ---------- BaseRateLimiter ----------
+    async def initialize(self):
+        if self._pump_task is None:
+            self._wakeup = asyncio.Event()
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def shutdown(self):
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+        for _, _, fut in self._heap:
+            fut.cancel()
+        self._heap.clear()
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if (endpoint in _UNTHROTTLED or not endpoint.startswith(_THROTTLED_PREFIXES)
+                or (chat_id is None and "inline_message_id" not in data)):
+            return await self._call(callback, args, kwargs, None, INTERACTIVE, endpoint)
+        priority = _priority(rate_limit_args)
+
+        edit = None
+        if endpoint.startswith("edit"):
+            key = (chat_id if chat_id is not None else data["inline_message_id"], data.get("message_id"))
+            pending = self._edits.get(key)
+            if pending is not None and pending.endpoint == endpoint:
+                # попередня правка ще не пішла — відправимо один запит з найсвіжішим вмістом
+                pending.data.clear()
+                pending.data.update(data)
+                pending.merged += 1
+                self.merged += 1
+                metrics.inc("send_merged_edits_total", endpoint=endpoint)
+                return await asyncio.shield(pending.future)
+            edit = self._edits[key] = _Edit(endpoint, data)
+
+        try:
+            await self._acquire(chat_id, priority)
+        except BaseException as exc:
+            if edit is not None:
+                self._release_edit(key, edit)
+                self._fail_edit(edit, exc)
+            raise
+        if edit is not None:
+            # з цього моменту вміст зафіксовано; нові правки стають у чергу окремо
+            self._release_edit(key, edit)
+        try:
+            result = await self._call(callback, args, kwargs, chat_id, priority, endpoint)
+        except BaseException as exc:
+            # і скасування: злиті виклики чекають на edit.future і інакше зависли б назавжди
+            if edit is not None:
+                self._fail_edit(edit, exc)
+            raise
+        if edit is not None and edit.merged:
+            edit.future.set_result(result)
+        return result
+
+    def _release_edit(self, key, edit: _Edit):
+        if self._edits.get(key) is edit:
+            del self._edits[key]
+
+    @staticmethod
+    def _fail_edit(edit: _Edit, exc: BaseException):
+        if not edit.merged or edit.future.done():
+            return
+        if isinstance(exc, asyncio.CancelledError):
+            edit.future.cancel()
+        else:
+            edit.future.set_exception(exc)
+
+    # ---------- токени ----------
+    def _chat(self, chat_id) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            chat = self._chats[chat_id] = _Chat(bucket)
+        return chat
+
+    async def _acquire(self, chat_id, priority: int):
+        now = time.monotonic()
+        if now - self._swept > CHAT_SWEEP_EVERY:
+            self._sweep(now)
+        if chat_id is not None:
+            chat = self._chat(chat_id)
+            async with chat.lock:
+                while True:
+                    now = time.monotonic()
+                    wait = max(chat.paused_until - now, chat.bucket.delay(now))
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                chat.bucket.take(now)
+                await self._global(priority)
+        else:
+            await self._global(priority)
+
+    async def _global(self, priority: int):
+        now = time.monotonic()
+        if not self._heap and self._paused_until <= now and self._bucket.delay(now) == 0:
+            self._bucket.take(now)   # швидкий шлях: черга порожня і токен є
+            return
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), fut))
+        self._wakeup.set()
+        await fut
+
+    async def _pump(self):
+        # єдиний роздавальник глобальних токенів: найвищий пріоритет, у межах нього — FIFO
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            wait = max(self._paused_until - now, self._bucket.delay(now))
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, fut = heapq.heappop(self._heap)
+            if not fut.done():   # скасовані (handler перервано) токен не забирають
+                self._bucket.take(now)
+                fut.set_result(None)
+
+    def _sweep(self, now: float):
+        # чати без черги, паузи і з повним bucket-ом нічого не пам’ятають — прибираємо
+        self._swept = now
+        for chat_id in [cid for cid, c in self._chats.items()
+                        if not c.lock.locked() and c.paused_until <= now and c.bucket.idle(now)]:
+            del self._chats[chat_id]
+
+    # ---------- RetryAfter ----------
+    async def _call(self, callback, args, kwargs, chat_id, priority: int, endpoint: str):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt == self.max_retries:
+                    raise
+                self.retries += 1
+                scope = self._pause(chat_id, exc.retry_after)
+                metrics.inc("telegram_retry_after_total", scope=scope)
+                _LOGGER.warning("RetryAfter %s с на %s (%s, чат %s), спроба %d",
+                                exc.retry_after, endpoint, scope, chat_id, attempt + 1)
+                if chat_id is None:
+                    await asyncio.sleep(exc.retry_after)
+                else:
+                    await self._acquire(chat_id, priority)
+
+    def _pause(self, chat_id, retry_after: float) -> str:
+        now = time.monotonic()
+        until = now + retry_after
+        if chat_id is None:
+            self._paused_until = max(self._paused_until, until)
+            return "global"
+        chat = self._chat(chat_id)
+        chat.paused_until = max(chat.paused_until, until)
+        self._floods.append((now, chat_id))
+        if (len(self._floods) == FLOOD_CHATS and now - self._floods[0][0] <= FLOOD_WINDOW
+                and len({cid for _, cid in self._floods}) == FLOOD_CHATS):
+            self._paused_until = max(self._paused_until, until)
+            return "global"
+        return "chat"
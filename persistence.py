@@ -0,0 +1,187 @@
+# persistence.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ЗБЕРЕЖЕННЯ СТАНУ РОЗМОВ І user_data У SQLITE
+# Стан діалогу (стадія ConversationHandler) і user_data (tname, amount,
+# прогрес вікторини, …) пишуться в ту ж finance.db, тож редеплой не губить
+# недописаний запис. PTB раз на update_interval віддає лише користувачів,
+# яких торкались апдейти; з них пишемо тих, чий серіалізований стан
+# справді змінився — одним пакетом (Storage зливає write-и в одну
+# транзакцію). Формат — компактний JSON, стиснутий zlib, якщо він великий.
+# При старті нічого не читаємо: стан користувача підвантажує preload()
+# (TypeHandler у групі -1) на його першому апдейті. evict_idle() дописує
+# стан і вивантажує з пам’яті user_data і стадії розмов тих, хто мовчить
+# довше USER_IDLE_TTL (рядки в БД лишаються — preload їх поверне).
+# ─────────────────────────────────────────────────────────────────────────────
+
+import json
+import os
+import time
+import zlib
+
+from telegram import Update
+from telegram.ext import BasePersistence, ContextTypes, PersistenceInput
+
+PERSIST_INTERVAL = float(os.getenv("PERSIST_INTERVAL", "15"))
+USER_IDLE_TTL = float(os.getenv("USER_IDLE_TTL", "1800"))
+COMPRESS_OVER = 256   # байт; менші блоби zlib лише роздуває
+
+_UPSERT_USER = """INSERT INTO user_state (user_id, data, updated_at) VALUES (?, ?, ?)
+                  ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at"""
+_DELETE_USER = "DELETE FROM user_state WHERE user_id = ?"
+_UPSERT_CONV = """INSERT INTO conversation_state (name, key, user_id, state) VALUES (?, ?, ?, ?)
+                  ON CONFLICT(name, key) DO UPDATE SET state = excluded.state"""
+_DELETE_CONV = "DELETE FROM conversation_state WHERE name = ? AND key = ?"
+
+
+def _private(application, attr: str):
+    # PTB не має публічного API для ледачого стану: беремо внутрішні dict-и Application
+    # (версія PTB закріплена в requirements.txt саме через це); якщо їх перейменують —
+    # падаємо зрозуміло, а не тихо перестаємо відновлювати розмови
+    try:
+        return getattr(application, attr)
+    except AttributeError:
+        raise RuntimeError(f"SQLitePersistence: у Application немає {attr} — "
+                           "несумісна версія python-telegram-bot") from None
+
+
+def dumps(data: dict) -> bytes:
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+    if len(raw) > COMPRESS_OVER:
+        return b"z" + zlib.compress(raw, 6)
+    return b"j" + raw
+
+
+def loads(blob: bytes) -> dict:
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return json.loads(raw)
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, db, update_interval: float = PERSIST_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.db = db
+        self._loaded = set()     # користувачі, чий стан уже в пам’яті застосунку
+        self._written = {}       # user_id -> crc32 останнього записаного блоба
+        self._seen = {}          # user_id -> monotonic час останнього апдейту
+
+    # ---------- ледаче завантаження ----------
+    async def preload(self, update: object, context: ContextTypes.DEFAULT_TYPE):
+        if not isinstance(update, Update) or not update.effective_user:
+            return
+        uid = update.effective_user.id
+        self._seen[uid] = time.monotonic()
+        if uid in self._loaded:
+            return
+        self._loaded.add(uid)
+        row = await self.db.fetchone("SELECT data FROM user_state WHERE user_id=?", (uid,))
+        if row:
+            data = loads(row[0])
+            self._written[uid] = zlib.crc32(bytes(row[0]))
+            # user_data може вже містити щось, записане до першого апдейту (напр. job) — не затираємо
+            for k, v in data.items():
+                context.user_data.setdefault(k, v)
+        convs = await self.db.fetchall(
+            "SELECT name, key, state FROM conversation_state WHERE user_id=?", (uid,))
+        # TrackingDict-и ConversationHandler-ів живуть в Application; update_no_track не позначає їх брудними
+        handlers = _private(context.application, "_conversation_handler_conversations")
+        for name, key, state in convs:
+            if name in handlers:
+                key = tuple(json.loads(key))
+                if key not in handlers[name]:
+                    handlers[name].update_no_track({key: state})
+
+    def forget(self, user_id: int):
+        # користувач вивантажений з пам’яті — наступний апдейт прочитає стан з БД знову
+        self._loaded.discard(user_id)
+        self._written.pop(user_id, None)
+        self._seen.pop(user_id, None)
+
+    async def evict_idle(self, application, ttl: float = USER_IDLE_TTL) -> int:
+        # спершу дописуємо все змінене, тоді прибираємо з пам’яті тих, хто давно мовчить
+        await application.update_persistence()
+        cutoff = time.monotonic() - ttl
+        idle = {uid for uid, seen in self._seen.items() if seen < cutoff}
+        if not idle:
+            return 0
+        # Application.user_data — лише read-only проксі; drop_user_data() стерло б і запис у БД
+        user_data = _private(application, "_user_data")
+        for uid in idle:
+            user_data.pop(uid, None)
+            self.forget(uid)
+        # стадії розмов: ключ закінчується user_id; прибираємо з .data повз TrackingDict,
+        # щоб update_persistence не сприйняв це як кінець розмови й не стер рядок у БД
+        for conversations in _private(application, "_conversation_handler_conversations").values():
+            for key in [k for k in conversations.data if k[-1] in idle]:
+                del conversations.data[key]
+        return len(idle)
+
+    # ---------- BasePersistence: читання (при старті — нічого) ----------
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    # ---------- BasePersistence: запис ----------
+    async def update_user_data(self, user_id, data):
+        if not data:
+            if self._written.pop(user_id, None) is not None:
+                await self.db.execute(_DELETE_USER, (user_id,))
+            return
+        blob = dumps(data)
+        crc = zlib.crc32(blob)
+        if self._written.get(user_id) == crc:
+            return
+        await self.db.execute(_UPSERT_USER, (user_id, blob, int(time.time())))
+        self._written[user_id] = crc
+
+    async def drop_user_data(self, user_id):
+        self.forget(user_id)
+        await self.db.execute(_DELETE_USER, (user_id,))
+
+    async def update_conversation(self, name, key, new_state):
+        key_json = json.dumps(list(key))
+        if new_state is None:
+            await self.db.execute(_DELETE_CONV, (name, key_json))
+        else:
+            await self.db.execute(_UPSERT_CONV, (name, key_json, key[-1], new_state))
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def flush(self):
+        # кожен update_* дочікується COMMIT-у, тож у буфері нічого не лишається
+        pass
@@ -0,0 +1,152 @@
+# rate_history.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# ІСТОРІЯ КУРСІВ
+# refresh_rates_job пише знімок курсів у rate_history з хвилинною
+# роздільністю; щогодинна задача downsample() згортає старі точки:
+# хвилини старші за добу → години, години старші за 30 днів → дні (середнє).
+# Для конвертації вся серія пари тримається в пам’яті як два numpy-масиви,
+# тож курс «станом на» для будь-якої кількості дат — один searchsorted.
+# Дні з валютними записами, для яких точок немає (записи до запуску історії,
+# простої бота), backfill() дозаповнює денними курсами НБУ на ту дату —
+# пачками по RATE_BACKFILL_BATCH днів за запуск задачі.
+# numpy імпортується в методах: модуль тягне main, а numpy (~75 мс) не
+# потрібен, доки хтось не попросить конвертацію.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import calendar
+import os
+import time
+from datetime import date
+
+MINUTE, HOUR, DAY = 60, 3600, 86400
+MINUTES_KEEP = DAY          # хвилинні точки живуть добу
+HOURS_KEEP = 30 * DAY       # годинні — 30 днів, далі лише денні
+RATE_BACKFILL_BATCH = int(os.getenv("RATE_BACKFILL_BATCH", "30"))   # днів за один запуск backfill()
+
+UPSERT = """INSERT INTO rate_history (pair, resolution, ts, rate) VALUES (?, ?, ?, ?)
+            ON CONFLICT(pair, resolution, ts) DO UPDATE SET rate = excluded.rate"""
+
+# згортання: усі точки роздільності src старші за cutoff → бакети dst (середнє), потім видалення
+_ROLL = """INSERT INTO rate_history (pair, resolution, ts, rate)
+           SELECT pair, {dst}, ts / {dst} * {dst}, AVG(rate) FROM rate_history
+           WHERE resolution = {src} AND ts < ?
+           GROUP BY pair, ts / {dst}
+           ON CONFLICT(pair, resolution, ts) DO UPDATE SET rate = excluded.rate"""
+_DROP = "DELETE FROM rate_history WHERE resolution = ? AND ts < ?"
+
+# валюти застосунку → пара до гривні
+CURRENCY_PAIRS = {"$": "usd_uah"}
+BASE_CURRENCY = "грн"
+
+
+def day_end_ts(day: int) -> int:
+    # YYYYMMDD → unix-час кінця цього дня (UTC): курс «станом на» дату операції
+    d = date(day // 10000, day // 100 % 100, day % 100)
+    return calendar.timegm(d.timetuple()) + DAY - 1
+
+
+class RateHistory:
+    def __init__(self, db):
+        self.db = db
+        self._series = {}   # pair -> (ts: int64[], rate: float64[])
+
+    async def record(self, rates: dict, now: float | None = None):
+        ts = int(now or time.time()) // MINUTE * MINUTE
+        ops = [(UPSERT, (pair, MINUTE, ts, float(v))) for pair, v in rates.items() if v]
+        if not ops:
+            return
+        await self.db.write(ops)
+        for pair, _, t, v in (p for _, p in ops):
+            if pair in self._series:
+                tss, vals = self._series[pair]
+                if not len(tss) or t > tss[-1]:
+                    import numpy as np   # серія вже в пам’яті — numpy завантажено
+                    self._series[pair] = (np.append(tss, t), np.append(vals, v))
+                else:
+                    del self._series[pair]   # нетипово (рестарт у ту ж хвилину) — перечитаємо
+
+    async def downsample(self, now: float | None = None):
+        now = int(now or time.time())
+        minute_cut = (now - MINUTES_KEEP) // HOUR * HOUR
+        hour_cut = (now - HOURS_KEEP) // DAY * DAY
+        await self.db.write([
+            (_ROLL.format(src=MINUTE, dst=HOUR), (minute_cut,)),
+            (_DROP, (MINUTE, minute_cut)),
+            (_ROLL.format(src=HOUR, dst=DAY), (hour_cut,)),
+            (_DROP, (HOUR, hour_cut)),
+        ])
+        self._series.clear()
+
+    async def missing_days(self, today: int) -> list:
+        # дні до today з записами у валюті з CURRENCY_PAIRS, за які в історії немає жодної точки пари
+        missing = set()
+        for cur, pair in CURRENCY_PAIRS.items():
+            days = await self.db.fetchall("SELECT DISTINCT day FROM daily_rollup WHERE currency=? AND day<?",
+                                          (cur, today))
+            if not days:
+                continue
+            known = {r[0] for r in await self.db.fetchall(
+                f"SELECT DISTINCT ts / {DAY} FROM rate_history WHERE pair=?", (pair,))}
+            missing |= {d for d, in days if (day_end_ts(d) - DAY + 1) // DAY not in known}
+        return sorted(missing, reverse=True)
+
+    async def backfill(self, fetch_day, today: int, limit: int = RATE_BACKFILL_BATCH) -> int:
+        # fetch_day(day) -> {pair: rate} — курси на дату (RatesProvider.fetch_nbu_day);
+        # пише денні точки на початок дня, новіші дні першими. -> скільки днів ще бракувало
+        days = await self.missing_days(today)
+        ops = []
+        for day in days[:limit]:
+            ts = day_end_ts(day) - DAY + 1
+            ops += [(UPSERT, (pair, DAY, ts, float(v))) for pair, v in (await fetch_day(day)).items() if v]
+        if ops:
+            await self.db.write(ops)
+            self._series.clear()
+        return len(days)
+
+    async def series(self, pair: str):
+        if pair not in self._series:
+            import numpy as np
+            rows = await self.db.fetchall("SELECT ts, rate FROM rate_history WHERE pair=? ORDER BY ts", (pair,))
+            self._series[pair] = (np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)),
+                                  np.fromiter((r[1] for r in rows), dtype=np.float64, count=len(rows)))
+        return self._series[pair]
+
+    async def asof(self, pair: str, ts):
+        # -> np.ndarray: останній відомий курс ≤ ts; без історії — NaN. До першої точки —
+        # найраніший відомий, доки backfill() не дозаповнив ті дні курсами НБУ
+        import numpy as np
+        tss, vals = await self.series(pair)
+        ts = np.asarray(ts, dtype=np.int64)
+        if not len(tss):
+            return np.full(ts.shape, np.nan)
+        idx = np.searchsorted(tss, ts, side="right") - 1
+        return vals[np.clip(idx, 0, len(vals) - 1)]
+
+    async def _rates(self, pair, ts, current):
+        import numpy as np
+        rate = await self.asof(pair, ts)
+        fallback = current.get(pair)
+        return np.where(np.isnan(rate), fallback if fallback else np.nan, rate)
+
+    async def convert(self, amounts, currencies, days, to_currency: str, current: dict | None = None):
+        # Перераховує суми в to_currency за курсом на дату кожної операції одним проходом.
+        # Пропуски в історії закриває поточним курсом; якщо курсу нема зовсім — сума лишається як є.
+        import numpy as np
+        amounts = np.asarray(amounts, dtype=np.float64)
+        currencies = np.asarray(currencies, dtype=object)
+        ts = np.fromiter((day_end_ts(d) for d in days), dtype=np.int64, count=len(amounts))
+        current = current or {}
+        # курс валюти рядка до гривні на його дату
+        to_uah = np.where(currencies == BASE_CURRENCY, 1.0, np.nan)
+        for cur, pair in CURRENCY_PAIRS.items():
+            mask = currencies == cur
+            if mask.any():
+                to_uah[mask] = await self._rates(pair, ts[mask], current)
+        if to_currency in CURRENCY_PAIRS:
+            target = await self._rates(CURRENCY_PAIRS[to_currency], ts, current)
+        else:
+            target = np.ones(len(amounts))
+        factor = to_uah / target
+        return np.where(np.isnan(factor), amounts, amounts * factor)
@@ -0,0 +1,191 @@
+# rates.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КУРСИ ВАЛЮТ/КРИПТИ (НБУ + CoinGecko), асинхронно
+# Обидва джерела опитуються паралельно через один httpx.AsyncClient з пулом
+# з’єднань. Для кожного джерела пам’ятаємо ETag/Last-Modified (умовні
+# запити → 304), поважаємо Cache-Control: max-age і при збоях відступаємо
+# експоненційно, не чіпаючи інше джерело. snapshot() віддає метадані
+# свіжості. fetch_nbu_day() — офіційний курс НБУ на минулу дату (&date=) для
+# дозаповнення rate_history. URL-и можна перевизначити (NBU_URL / COINGECKO_URL) — напр.
+# на локальний stub-сервер для тестів.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import os
+import random
+import re
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+NBU_URL = os.getenv("NBU_URL", "https://bank.gov.ua/NBUStatService/v1/statdirectory/exchange?json")
+COINGECKO_URL = os.getenv("COINGECKO_URL", "https://api.coingecko.com/api/v3/simple/price")
+
+HTTP_TIMEOUT = 12
+BACKOFF_BASE = 30        # сек після першого збою
+BACKOFF_MAX = 30 * 60    # стеля відступу
+STALE_AFTER = 10 * 60    # після скількох секунд без успіху дані вважаються застарілими
+
+
+def _parse_nbu(data):
+    usd = next((x for x in data if str(x.get("r030")) == "840"), None)
+    eur = next((x for x in data if str(x.get("r030")) == "978"), None)
+    out = {}
+    if usd:
+        out["usd_uah"] = float(usd["rate"])
+    if eur:
+        out["eur_uah"] = float(eur["rate"])
+    return out
+
+
+def _parse_coingecko(data):
+    out = {}
+    btc = float(data.get("bitcoin", {}).get("usd", 0) or 0)
+    eth = float(data.get("ethereum", {}).get("usd", 0) or 0)
+    if btc:
+        out["btc_usd"] = btc
+    if eth:
+        out["eth_usd"] = eth
+    return out
+
+
+class RateSource:
+    def __init__(self, name, url, parse, params=None):
+        self.name = name
+        self.url = url
+        self.parse = parse
+        self.params = params
+        self.rates = {}
+        self.etag = None
+        self.last_modified = None
+        self.fresh_until = 0.0    # monotonic: до цього моменту не питаємо (max-age)
+        self.retry_at = 0.0       # monotonic: до цього моменту відступаємо після збою
+        self.failures = 0
+        self.failing_since = 0.0  # monotonic: перший збій після останнього успіху
+        self.ok_at = 0.0          # monotonic останнього успіху
+        self.updated_at = None    # wall-clock останнього успіху (200 або 304)
+        self.last_error = None
+
+    def due(self, now: float) -> bool:
+        return now >= self.fresh_until and now >= self.retry_at
+
+    def ok(self, now: float, max_age):
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+        self.updated_at = time.time()
+        self.ok_at = now
+        self.fresh_until = now + max_age if max_age else 0.0
+
+    def stale(self, now: float) -> bool:
+        # застарілі: жодного успіху, або max-age минув і відтоді понад STALE_AFTER
+        # немає успіху — через збої (рахуємо від першого) чи бо задача не запускалась
+        if self.updated_at is None:
+            return True
+        expired = max(self.fresh_until, self.ok_at)
+        if self.failures:
+            expired = max(expired, self.failing_since)
+        return now - expired > STALE_AFTER
+
+    def failed(self, now: float, err):
+        if not self.failures:
+            self.failing_since = now
+        self.failures += 1
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (self.failures - 1))
+        self.retry_at = now + delay * random.uniform(0.8, 1.2)
+        self.last_error = f"{type(err).__name__}: {err}"[:200]
+
+
+def _max_age(headers):
+    m = re.search(r"max-age=(\d+)", headers.get("cache-control", ""))
+    return int(m.group(1)) if m else 0
+
+
+class RatesProvider:
+    def __init__(self, nbu_url: str = NBU_URL, coingecko_url: str = COINGECKO_URL,
+                 timeout: float = HTTP_TIMEOUT):
+        self.sources = [
+            RateSource("nbu", nbu_url, _parse_nbu),
+            RateSource("coingecko", coingecko_url, _parse_coingecko,
+                       params={"ids": "bitcoin,ethereum", "vs_currencies": "usd"}),
+        ]
+        self.nbu_url = nbu_url
+        self.timeout = timeout
+        self._client = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=4),
+                headers={"Accept": "application/json"},
+            )
+        return self._client
+
+    async def _fetch(self, src: RateSource):
+        now = time.monotonic()
+        if not src.due(now):
+            return
+        headers = {}
+        if src.etag:
+            headers["If-None-Match"] = src.etag
+        if src.last_modified:
+            headers["If-Modified-Since"] = src.last_modified
+        try:
+            r = await self._http().get(src.url, params=src.params, headers=headers)
+            if r.status_code != 304:
+                r.raise_for_status()
+                rates = src.parse(r.json())
+                if not rates:
+                    raise ValueError("порожня відповідь")
+                src.rates = rates
+                src.etag = r.headers.get("etag")
+                src.last_modified = r.headers.get("last-modified")
+            src.ok(time.monotonic(), _max_age(r.headers))
+        except Exception as e:
+            src.failed(time.monotonic(), e)
+
+    async def refresh(self) -> dict:
+        await asyncio.gather(*(self._fetch(s) for s in self.sources))
+        return self.rates()
+
+    async def fetch_nbu_day(self, day: int) -> dict:
+        # курси НБУ на дату YYYYMMDD; {} при збої — день лишиться незаповненим до наступної спроби
+        try:
+            # дописуємо рядком: params= переписав би «?json» на «?json=»
+            sep = "&" if "?" in self.nbu_url else "?"
+            r = await self._http().get(f"{self.nbu_url}{sep}date={day}")
+            r.raise_for_status()
+            return _parse_nbu(r.json())
+        except Exception:
+            return {}
+
+    def rates(self) -> dict:
+        out = {}
+        for s in self.sources:
+            out.update(s.rates)
+        return out
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        mono = time.monotonic()
+        meta = {}
+        for s in self.sources:
+            age = now - s.updated_at if s.updated_at else None
+            meta[s.name] = {
+                "updated_at": datetime.fromtimestamp(s.updated_at, timezone.utc).isoformat() if s.updated_at else None,
+                "age": age,
+                "stale": s.stale(mono),
+                "failures": s.failures,
+                "retry_in": max(0.0, s.retry_at - time.monotonic()) if s.failures else 0.0,
+                "error": s.last_error,
+            }
+        return meta
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,92 @@
+# render.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# СЕРВІС РЕНДЕРУ
+# Важкі CPU-задачі (PDF через ReportLab, діаграми matplotlib) виконуються в обмеженому пулі
+# процесів. Handler просто await-ить результат, а решта апдейтів
+# обробляється далі. Якщо в черзі вже забагато задач — RenderBusy, і бот
+# відповідає «зайнято, спробуй пізніше» замість того, щоб накопичувати чергу.
+# Задача задається рядком "модуль:функція" — matplotlib/ReportLab імпортуються
+# лише у воркерах, головний процес (бот) їх не вантажить. warm() після
+# старту заздалегідь піднімає воркери з уже імпортованими модулями.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import importlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import metrics
+
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+RENDER_MAX_PENDING = int(os.getenv("RENDER_MAX_PENDING", "8"))
+WARM_MODULES = ("reports", "charts")
+
+
+def _resolve(target):
+    if callable(target):
+        return target
+    module, name = target.split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _call(target, args):
+    return _resolve(target)(*args)
+
+
+def _warm():
+    # імпорт важких модулів + одноразове налаштування (шрифт DejaVu, rcParams)
+    for name in WARM_MODULES:
+        mod = importlib.import_module(name)
+        if hasattr(mod, "warm"):
+            mod.warm()
+    return os.getpid()
+
+
+class RenderBusy(Exception):
+    pass
+
+
+class RenderService:
+    def __init__(self, workers: int = RENDER_WORKERS, max_pending: int = RENDER_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def submit(self, fn, *args):
+        # fn — "модуль:функція" (напр. "reports:make_pdf") або функція рівня модуля (pickle)
+        if self._pending >= self.max_pending:
+            metrics.inc("render_busy_total")
+            raise RenderBusy()
+        pool = self._executor()
+        self._pending += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, _call, fn, args)
+        finally:
+            self._pending -= 1
+            metrics.observe("render_seconds", time.perf_counter() - start,
+                            target=fn if isinstance(fn, str) else fn.__name__)
+
+    async def warm(self):
+        # по задачі на воркер: пул піднімає процеси, кожен імпортує reports/charts заздалегідь
+        loop = asyncio.get_running_loop()
+        pool = self._executor()
+        await asyncio.gather(*(loop.run_in_executor(pool, _warm) for _ in range(self.workers)))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,170 @@
+# render_cache.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# КЕШ ГОТОВИХ PDF/ДІАГРАМ
+# Ключ — (користувач, період, вид звіту, версія даних), де версія міняється з
+# кожною новою транзакцією в періоді. Байти лежать на диску, індекс — в
+# пам’яті як LRU з обмеженням за сумарним розміром. Для вже відправлених
+# файлів пам’ятаємо Telegram file_id, щоб повторно не вивантажувати файл.
+# save_tx та імпорт викликають invalidate() із днями записів: скидаються
+# всі періоди користувача, що їх покривають — день, місяць, довільний
+# діапазон «lo-hi» (тиждень, квартал, свій період) і «all».
+# Кеш володіє лише підкаталогом renders/ у RENDER_CACHE_DIR і лише своїми
+# *.bin у ньому. Індекс (разом із file_id) зберігається в index.json при
+# зупинці й читається в open() (on_startup, поза event loop), тож рестарт
+# кеш не скидає; .bin без запису в індексі (напр. після аварійної зупинки)
+# видаляються. До open() кеш порожній і нічого не пише (скрипти/бенчі).
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict, defaultdict
+
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", "render_cache")
+RENDER_CACHE_MB = int(os.getenv("RENDER_CACHE_MB", "200"))
+SUBDIR = "renders"
+INDEX = "index.json"
+
+
+class RenderCache:
+    def __init__(self, directory: str = RENDER_CACHE_DIR, max_bytes: int = RENDER_CACHE_MB * 1024 * 1024):
+        self.dir = os.path.join(directory, SUBDIR)
+        self.max_bytes = max_bytes
+        self._lru = OrderedDict()          # key -> [size, file_id, (user_id, period)]
+        self._scopes = defaultdict(dict)   # user_id -> {period: {key}}
+        self._bytes = 0
+        self._opened = False
+
+    def open(self):
+        # викликається один раз з on_startup (asyncio.to_thread), до першого апдейту;
+        # не в конструкторі — імпорт main зі скриптів/бенчів диск не чіпає
+        if self._opened:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        index_path = os.path.join(self.dir, INDEX)
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                entries = json.load(f)
+            os.remove(index_path)   # до наступного save() індекс живе лише в пам’яті
+        except (FileNotFoundError, ValueError):
+            entries = []
+        for key, size, file_id, user_id, period in entries:
+            if os.path.exists(self._path(key)) and self._bytes + size <= self.max_bytes:
+                self._add(key, size, file_id, user_id, period)
+        for name in os.listdir(self.dir):
+            if name.endswith((".bin", ".bin.tmp")) and name.split(".", 1)[0] not in self._lru:
+                os.remove(os.path.join(self.dir, name))
+        self._opened = True
+
+    def save(self):
+        # при зупинці: індекс від найстаріших до найновіших, щоб LRU-порядок зберігся
+        if not self._opened:
+            return
+        entries = [[key, size, file_id, *scope] for key, (size, file_id, scope) in self._lru.items()]
+        _write(os.path.join(self.dir, INDEX), json.dumps(entries).encode())
+
+    @staticmethod
+    def _key(user_id, period, kind, version) -> str:
+        raw = f"{user_id}|{period}|{kind}|{version}".encode()
+        return hashlib.sha1(raw).hexdigest()
+
+    def _path(self, key) -> str:
+        return os.path.join(self.dir, key + ".bin")
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    async def get(self, user_id, period, kind, version):
+        # -> (bytes|None, file_id|None)
+        key = self._key(user_id, period, kind, version)
+        entry = self._lru.get(key)
+        if entry is None:
+            return None, None
+        self._lru.move_to_end(key)
+        if entry[1]:
+            return None, entry[1]
+        try:
+            data = await asyncio.to_thread(_read, self._path(key))
+        except FileNotFoundError:
+            self._drop(key)
+            return None, None
+        return data, None
+
+    async def put(self, user_id, period, kind, version, data: bytes):
+        if not self._opened:
+            return
+        key = self._key(user_id, period, kind, version)
+        if key in self._lru or len(data) > self.max_bytes:
+            return
+        await asyncio.to_thread(_write, self._path(key), data)
+        if key in self._lru:
+            return   # паралельний put того ж ключа встиг раніше — файл той самий, розмір уже враховано
+        self._add(key, len(data), None, user_id, str(period))
+        while self._bytes > self.max_bytes and self._lru:
+            self._drop(next(iter(self._lru)))
+
+    def set_file_id(self, user_id, period, kind, version, file_id: str):
+        entry = self._lru.get(self._key(user_id, period, kind, version))
+        if entry is not None:
+            entry[1] = file_id
+
+    def invalidate(self, user_id, days):
+        # days — YYYYMMDD змінених записів; скидає кожен період користувача, що покриває хоч один
+        periods = self._scopes.get(user_id)
+        if not periods:
+            return
+        days = set(days)
+        months = {d // 100 for d in days}
+        for period in [p for p in periods if _covers(p, days, months)]:
+            for key in list(periods.get(period, ())):
+                self._drop(key)
+
+    def _add(self, key, size, file_id, user_id, period):
+        self._lru[key] = [size, file_id, (user_id, period)]
+        self._scopes[user_id].setdefault(period, set()).add(key)
+        self._bytes += size
+
+    def _drop(self, key):
+        entry = self._lru.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[0]
+        user_id, period = entry[2]
+        periods = self._scopes.get(user_id)
+        keys = periods.get(period) if periods else None
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del periods[period]
+                if not periods:
+                    del self._scopes[user_id]
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+def _covers(period: str, days: set, months: set) -> bool:
+    # період кешу: "all", "YYYYMM", "YYYYMMDD" або діапазон "lo-hi" (YYYYMMDD включно)
+    if period == "all":
+        return True
+    if "-" in period:
+        lo, hi = map(int, period.split("-", 1))
+        return any(lo <= d <= hi for d in days)
+    return int(period) in (months if len(period) == 6 else days)
+
+
+def _read(path) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write(path, data: bytes):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
@@ -0,0 +1,211 @@
+# reports.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# PDF-ЗВІТИ (ReportLab)
+# Функції тут виконуються у процесах RenderService (render.py), тому вони
+# не чіпають бота чи event loop і повертають готові байти (або шлях до
+# унікального тимчасового файлу) — паралельні експорти не перетинаються.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import io
+import os
+import sqlite3
+import tempfile
+import zlib
+from collections import defaultdict
+
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.pdfdoc import PDFStream, PDFDictionary, PDFArray, PDFName
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Frame
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+from constants import CATEGORY_EMOJI, MONTHS, TYPES
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "DejaVuSans.ttf")
+
+HEADER = ["Тип", "Категорія", "Підкатегорія", "Сума", "Валюта", "Коментар"]
+HISTORY_CHUNK = 500          # скільки рядків тягнемо з курсора за раз
+HISTORY_ROWS_PER_TABLE = 45  # ≈ одна сторінка A4 при шрифті 8
+HISTORY_COL_WIDTHS = [80, 115, 95, 60, 40, 133]
+MARGIN = 36
+
+_styles = None
+
+
+def _ukr_styles():
+    # шрифт і стилі реєструються один раз на процес-воркер
+    global _styles
+    if _styles is None:
+        pdfmetrics.registerFont(TTFont('DejaVu', FONT_PATH))
+        _styles = getSampleStyleSheet()
+        _styles.add(ParagraphStyle(name="Ukr", fontName="DejaVu", fontSize=12, leading=15))
+    return _styles
+
+
+def warm():
+    _ukr_styles()
+
+
+def make_pdf(rows, title, totals=None, currency="") -> bytes:
+    # totals: [(type, category, amount)] вже у валюті звіту; без них — сума рядків як є
+    buf = io.BytesIO()
+    doc = SimpleDocTemplate(buf, pagesize=A4)
+    styles = _ukr_styles()
+    elements = [Paragraph(title, styles["Ukr"])]
+    data = [HEADER]
+    sums = defaultdict(float)
+    for t, c, s, a, curx, com in rows:
+        a = float(a or 0)
+        sums[t] += a
+        data.append([t, f"{CATEGORY_EMOJI.get(c,'')} {c}", s or "-", f"{a:.2f}", curx, com or "-"])
+    if totals is not None:
+        by_type = defaultdict(float)
+        for t, _, a in totals:
+            by_type[t] += float(a or 0)
+        sums = by_type
+    data.append(["", "", "", "", "", ""])
+    for k in ["💸 Витрати", "💰 Надходження", "📈 Інвестиції"]:
+        data.append([k, "", "", f"{sums[k]:.2f}", currency, ""])
+    table = Table(data, repeatRows=1, hAlign='LEFT')
+    table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), 'DejaVu'),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ]))
+    elements.append(table)
+    doc.build(elements)
+    return buf.getvalue()
+
+
+# ===================== ПОВНА ІСТОРІЯ (потоково) =====================
+# Рядки читаються з курсора пачками по HISTORY_CHUNK і одразу розкладаються
+# на сторінки невеликими таблицями фіксованої ширини, тож в пам’яті одночасно
+# живе лише одна сторінка, скільки б транзакцій не було в історії.
+
+class _CompactCanvas(Canvas):
+    # ReportLab тримає нестиснутий вміст кожної сторінки аж до save().
+    # Стискаємо його одразу після showPage — пам’ять на сторінку падає в рази,
+    # а фільтр у словнику каже pdfdoc не кодувати потік вдруге.
+    def showPage(self):
+        super().showPage()
+        page = self._doc.Pages.pages[-1]
+        data = page.stream.encode("utf8") if isinstance(page.stream, str) else page.stream
+        page.Contents = PDFStream(
+            PDFDictionary({"Filter": PDFArray([PDFName("FlateDecode")])}), zlib.compress(data))
+        page.stream = None
+
+
+def _history_table(data, subtotal_rows):
+    cmds = [
+        ('FONTNAME', (0, 0), (-1, -1), 'DejaVu'),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ]
+    for i in subtotal_rows:
+        cmds.append(('BACKGROUND', (0, i), (-1, i), colors.lightgrey))
+    table = Table(data, colWidths=HISTORY_COL_WIDTHS, repeatRows=1, hAlign='LEFT')
+    table.setStyle(TableStyle(cmds))
+    return table
+
+
+def _history_rows(conn, user_id, currency="", rates=None):
+    # генерує (рядок_таблиці, це_підсумок) з місячними підсумками між місяцями.
+    # Рядки — у валюті запису; підсумки — у currency: rates[(day, валюта)] — множник
+    # за курсом на дату (рахує main через rate_history), без курсу сума йде як є
+    rates = rates or {}
+    cur = conn.execute("""SELECT day, type, category, subcategory, amount, currency, comment
+                          FROM transactions WHERE user_id=? ORDER BY day, id""", (user_id,))
+    month, month_tot, grand = None, defaultdict(float), defaultdict(float)
+
+    def subtotal(ym):
+        label = f"Σ {MONTHS.get(ym % 100, ym % 100)} {ym // 100}"
+        parts = [f"{k.split()[-1]}: {month_tot[k]:.2f} {currency}".rstrip() for k in TYPES if month_tot[k]]
+        return [label, "", "", "", "", "; ".join(parts) or "-"], True
+
+    while True:
+        chunk = cur.fetchmany(HISTORY_CHUNK)
+        if not chunk:
+            break
+        for day, t, c, s, a, curx, com in chunk:
+            ym = (day or 0) // 100
+            if month is not None and ym != month:
+                yield subtotal(month)
+                month_tot.clear()
+            month = ym
+            a = float(a or 0)
+            conv = a if curx in (currency, "", None) else a * rates.get((day, curx), 1.0)
+            month_tot[t] += conv
+            grand[t] += conv
+            com = (com or "-")
+            if len(com) > 40:
+                com = com[:39] + "…"
+            yield [t, f"{CATEGORY_EMOJI.get(c,'')} {c}", s or "-", f"{a:.2f}", curx, com], False
+    if month is not None:
+        yield subtotal(month)
+    yield ["", "", "", "", "", ""], False
+    for k in TYPES:
+        yield [k, "", "", f"{grand[k]:.2f}", currency, ""], True
+
+
+def make_history_pdf(db_path, user_id, title, currency="", rates=None) -> str:
+    # повертає шлях до тимчасового PDF; видаляє його той, хто відправляє;
+    # currency/rates — валюта підсумків і множники курсу (див. _history_rows)
+    styles = _ukr_styles()
+    fd, path = tempfile.mkstemp(prefix="history_", suffix=".pdf")
+    os.close(fd)
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        canvas = _CompactCanvas(path, pagesize=A4)
+        width, height = A4
+        page = [1]
+
+        def new_frame():
+            canvas.setFont('DejaVu', 7)
+            canvas.drawRightString(width - MARGIN, MARGIN / 2, f"стор. {page[0]}")
+            return Frame(MARGIN, MARGIN, width - 2 * MARGIN, height - 2 * MARGIN,
+                         leftPadding=0, rightPadding=0, topPadding=0, bottomPadding=0)
+
+        def flush(flowable, frame):
+            # таблиця, що не влазить у залишок сторінки, ділиться; решта — на нову сторінку
+            while not frame.add(flowable, canvas):
+                parts = frame.split(flowable, canvas)
+                if len(parts) == 2 and frame.add(parts[0], canvas):
+                    flowable = parts[1]
+                elif frame._atTop:
+                    raise ValueError("рядок таблиці не вміщується на сторінку")
+                canvas.showPage()
+                page[0] += 1
+                frame = new_frame()
+            return frame
+
+        frame = new_frame()
+        frame = flush(Paragraph(title, styles["Ukr"]), frame)
+        data, marks = [HEADER], []
+        for row, is_subtotal in _history_rows(conn, user_id, currency, rates):
+            if is_subtotal:
+                marks.append(len(data))
+            data.append(row)
+            if len(data) > HISTORY_ROWS_PER_TABLE:
+                frame = flush(_history_table(data, marks), frame)
+                data, marks = [HEADER], []
+        if len(data) > 1:
+            flush(_history_table(data, marks), frame)
+        canvas.showPage()
+        canvas.save()
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        conn.close()
+    return path
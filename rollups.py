@@ -0,0 +1,182 @@
+# rollups.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# МАТЕРІАЛІЗОВАНІ ПІДСУМКИ (ROLLUPS)
+# daily_rollup / monthly_rollup тримають суму і кількість транзакцій на
+# (користувач, день|місяць, тип, категорія, валюта). Оновлюються в тій самій
+# транзакції, що й INSERT у transactions (див. rollup_ops), тож звіти читають
+# кілька готових рядків замість усієї історії.
+#
+# Крім денної суми, daily_rollup тримає накопичувальні cum_amount/cum_cnt —
+# суму від першого дня серії (тип, категорія, валюта) до цього дня включно.
+# Підсумок за будь-який діапазон [lo, hi] — різниця двох префіксних сум на
+# серію: останній рядок з day <= hi мінус останній з day < lo (по одному
+# seek-у в idx_rollup_series), незалежно від довжини діапазону.
+#
+# Перебудова з нуля (напр. після ручних правок у БД):
+#   python rollups.py rebuild [--db finance.db] [--user 123]
+# ─────────────────────────────────────────────────────────────────────────────
+
+import argparse
+import sqlite3
+
+UPSERT_DAILY = """
+INSERT INTO daily_rollup (user_id, day, type, category, currency, amount, cnt)
+VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT(user_id, day, type, category, currency)
+DO UPDATE SET amount = amount + excluded.amount, cnt = cnt + 1
+"""
+
+# те саме + префіксна сума: новий день серії стартує від попереднього дня цієї ж серії
+UPSERT_DAILY_CUM = """
+INSERT INTO daily_rollup (user_id, day, type, category, currency, amount, cnt, cum_amount, cum_cnt)
+SELECT ?1, ?2, ?3, ?4, ?5, ?6, 1,
+       COALESCE(prev.cum_amount, 0) + ?6, COALESCE(prev.cum_cnt, 0) + 1
+FROM (SELECT 1) LEFT JOIN (
+    SELECT cum_amount, cum_cnt FROM daily_rollup INDEXED BY idx_rollup_series
+    WHERE user_id = ?1 AND type = ?3 AND category = ?4 AND currency = ?5 AND day < ?2
+    ORDER BY day DESC LIMIT 1
+) AS prev
+WHERE true  -- без WHERE парсер читає ON CONFLICT як ON від JOIN
+ON CONFLICT(user_id, day, type, category, currency)
+DO UPDATE SET amount = amount + excluded.amount, cnt = cnt + 1,
+              cum_amount = cum_amount + excluded.amount, cum_cnt = cum_cnt + 1
+"""
+
+# запис «заднім числом» зсуває префіксні суми всіх пізніших днів серії (для сьогоднішніх — нуль рядків)
+SHIFT_CUM = """
+UPDATE daily_rollup SET cum_amount = cum_amount + ?, cum_cnt = cum_cnt + 1
+WHERE user_id = ? AND type = ? AND category = ? AND currency = ? AND day > ?
+"""
+
+# масові вставки (імпорт): префіксні суми серій користувача перераховуються віконною функцією від ?2
+REFRESH_CUM = """
+UPDATE daily_rollup AS d SET cum_amount = c.ca, cum_cnt = c.cc
+FROM (SELECT day, type, category, currency,
+             SUM(amount) OVER w AS ca, SUM(cnt) OVER w AS cc
+      FROM daily_rollup WHERE user_id = ?1
+      WINDOW w AS (PARTITION BY type, category, currency ORDER BY day)) AS c
+WHERE d.user_id = ?1 AND d.day >= ?2 AND d.day = c.day
+  AND d.type = c.type AND d.category = c.category AND d.currency = c.currency
+"""
+
+_REFRESH_ALL_CUM = """
+UPDATE daily_rollup AS d SET cum_amount = c.ca, cum_cnt = c.cc
+FROM (SELECT user_id, day, type, category, currency,
+             SUM(amount) OVER w AS ca, SUM(cnt) OVER w AS cc
+      FROM daily_rollup {where}
+      WINDOW w AS (PARTITION BY user_id, type, category, currency ORDER BY day)) AS c
+WHERE d.user_id = c.user_id AND d.day = c.day
+  AND d.type = c.type AND d.category = c.category AND d.currency = c.currency
+"""
+
+# підсумки за [?2, ?3] по серіях: дві префіксні суми на серію; серії — з monthly_rollup (їх небагато).
+# INDEXED BY: без ANALYZE планувальник бере PK (user_id, day) і перебирає всі дні до межі
+RANGE_TOTALS = """
+SELECT s.type, s.category, s.currency,
+       COALESCE((SELECT cum_amount FROM daily_rollup d INDEXED BY idx_rollup_series
+                 WHERE d.user_id = ?1 AND d.type = s.type AND d.category = s.category
+                   AND d.currency = s.currency AND d.day <= ?3 ORDER BY d.day DESC LIMIT 1), 0)
+     - COALESCE((SELECT cum_amount FROM daily_rollup d INDEXED BY idx_rollup_series
+                 WHERE d.user_id = ?1 AND d.type = s.type AND d.category = s.category
+                   AND d.currency = s.currency AND d.day < ?2 ORDER BY d.day DESC LIMIT 1), 0),
+       COALESCE((SELECT cum_cnt FROM daily_rollup d INDEXED BY idx_rollup_series
+                 WHERE d.user_id = ?1 AND d.type = s.type AND d.category = s.category
+                   AND d.currency = s.currency AND d.day <= ?3 ORDER BY d.day DESC LIMIT 1), 0)
+     - COALESCE((SELECT cum_cnt FROM daily_rollup d INDEXED BY idx_rollup_series
+                 WHERE d.user_id = ?1 AND d.type = s.type AND d.category = s.category
+                   AND d.currency = s.currency AND d.day < ?2 ORDER BY d.day DESC LIMIT 1), 0)
+FROM (SELECT DISTINCT type, category, currency FROM monthly_rollup
+      WHERE user_id = ?1 AND month BETWEEN ?2 / 100 AND ?3 / 100) AS s
+"""
+
+UPSERT_MONTHLY = """
+INSERT INTO monthly_rollup (user_id, month, type, category, currency, amount, cnt)
+VALUES (?, ?, ?, ?, ?, ?, 1)
+ON CONFLICT(user_id, month, type, category, currency)
+DO UPDATE SET amount = amount + excluded.amount, cnt = cnt + 1
+"""
+
+# спільний SELECT для перебудови: NULL-и з давніх записів зводимо до ''
+_REBUILD_DAILY = """
+INSERT INTO daily_rollup (user_id, day, type, category, currency, amount, cnt)
+SELECT user_id, day, COALESCE(type, ''), COALESCE(category, ''), COALESCE(currency, ''),
+       SUM(COALESCE(amount, 0)), COUNT(*)
+FROM transactions {where}
+GROUP BY user_id, day, COALESCE(type, ''), COALESCE(category, ''), COALESCE(currency, '')
+"""
+
+_REBUILD_MONTHLY = """
+INSERT INTO monthly_rollup (user_id, month, type, category, currency, amount, cnt)
+SELECT user_id, day / 100, type, category, currency, SUM(amount), SUM(cnt)
+FROM daily_rollup {where}
+GROUP BY user_id, day / 100, type, category, currency
+"""
+
+
+def rollup_ops(user_id, day, ttype, cat, currency, amount):
+    # операції для Storage.write(): виконуються атомарно разом з INSERT транзакції
+    amount = float(amount or 0)
+    key = (ttype or "", cat or "", currency or "")
+    return [
+        (UPSERT_DAILY_CUM, (user_id, day, *key, amount)),
+        (SHIFT_CUM, (amount, user_id, *key, day)),
+        (UPSERT_MONTHLY, (user_id, day // 100, *key, amount)),
+    ]
+
+
+def bulk_rollup_ops(user_id, items):
+    # items: [(day, type, category, currency, amount), ...] одного користувача (імпорт).
+    # Замість SHIFT_CUM на кожен рядок — один перерахунок префіксних сум від найранішого дня.
+    daily, monthly = [], []
+    for day, ttype, cat, currency, amount in items:
+        key = (ttype or "", cat or "", currency or "")
+        amount = float(amount or 0)
+        daily.append((UPSERT_DAILY, (user_id, day, *key, amount)))
+        monthly.append((UPSERT_MONTHLY, (user_id, day // 100, *key, amount)))
+    if not items:
+        return []
+    return daily + monthly + [(REFRESH_CUM, (user_id, min(i[0] for i in items)))]
+
+
+def rebuild(conn: sqlite3.Connection, user_id=None, cumulative: bool = True):
+    # викликається всередині відкритої транзакції (міграція) або через main() нижче
+    where, params = ("WHERE user_id=?", (user_id,)) if user_id is not None else ("", ())
+    conn.execute(f"DELETE FROM daily_rollup {where}", params)
+    conn.execute(f"DELETE FROM monthly_rollup {where}", params)
+    conn.execute(_REBUILD_DAILY.format(where=where), params)
+    conn.execute(_REBUILD_MONTHLY.format(where=where), params)
+    if cumulative:
+        conn.execute(_REFRESH_ALL_CUM.format(where=where), params)
+
+
+def refresh_cumulative(conn: sqlite3.Connection):
+    # cum_* усіх серій з денних сум (міграція 7; таблиці створює migrations.py)
+    conn.execute(_REFRESH_ALL_CUM.format(where=""))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Обслуговування rollup-таблиць")
+    ap.add_argument("command", choices=["rebuild"])
+    ap.add_argument("--db", default="finance.db")
+    ap.add_argument("--user", type=int, default=None)
+    args = ap.parse_args()
+
+    from migrations import migrate
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    migrate(conn)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rebuild(conn, args.user)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    n = conn.execute("SELECT COUNT(*) FROM daily_rollup").fetchone()[0]
+    print(f"✅ Rollups перебудовано ({n} денних рядків)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
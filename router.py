@@ -0,0 +1,118 @@
+# router.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# РОУТЕР CALLBACK-КНОПОК
+# Маршрут — шаблон callback_data на кшталт "stats:day:{d:int}": статичний
+# префікс ("stats:day") і типізовані аргументи. Маршрути лежать у словнику
+# за префіксом, тож dispatch — це split + кілька dict-lookup-ів (по одному
+# на кожну наявну довжину префікса), а не перебір if-ів. Для кожного
+# маршруту рахуються виклики, помилки і гістограма часу обробки.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import re
+import time
+
+from metrics import Histogram
+
+CONVERTERS = {"int": int, "str": str}
+_SEGMENT = re.compile(r"\{[^}]*\}|[^:]+")
+
+
+class Route:
+    __slots__ = ("pattern", "prefix", "args", "handler", "extra", "calls", "errors", "latency")
+
+    def __init__(self, pattern, prefix, args, handler, extra):
+        self.pattern = pattern
+        self.prefix = prefix
+        self.args = args          # [(назва, конвертер), ...]
+        self.handler = handler
+        self.extra = extra        # фіксовані kwargs (один handler на кілька кнопок)
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+
+def _parse(pattern: str):
+    prefix, args = [], []
+    for part in _SEGMENT.findall(pattern):
+        if part.startswith("{") and part.endswith("}"):
+            name, _, kind = part[1:-1].partition(":")
+            args.append((name, CONVERTERS[kind or "str"]))
+        elif args:
+            raise ValueError(f"статичний сегмент після аргументів у {pattern!r}")
+        else:
+            prefix.append(part)
+    return ":".join(prefix), len(prefix), args
+
+
+class CallbackRouter:
+    def __init__(self):
+        self._routes = {}       # префікс -> Route
+        self._depths = []       # наявні довжини префіксів, від довших до коротших
+
+    def route(self, pattern: str, **extra):
+        # декоратор; handler(update, context, **args) -> наступний стан розмови
+        def deco(handler):
+            self.add(pattern, handler, **extra)
+            return handler
+        return deco
+
+    def add(self, pattern: str, handler, **extra):
+        prefix, depth, args = _parse(pattern)
+        if prefix in self._routes:
+            raise ValueError(f"маршрут {prefix!r} уже зареєстровано")
+        self._routes[prefix] = Route(pattern, prefix, args, handler, extra)
+        if depth not in self._depths:
+            self._depths.append(depth)
+            self._depths.sort(reverse=True)
+
+    def match(self, data: str):
+        # -> (Route, kwargs) або (None, None)
+        parts = data.split(":")
+        for depth in self._depths:
+            if depth > len(parts):
+                continue
+            route = self._routes.get(":".join(parts[:depth]))
+            if route is None or len(parts) - depth != len(route.args):
+                continue
+            try:
+                kwargs = {name: conv(v) for (name, conv), v in zip(route.args, parts[depth:])}
+            except ValueError:
+                return None, None
+            kwargs.update(route.extra)
+            return route, kwargs
+        return None, None
+
+    async def dispatch(self, update, context, data: str, fallback):
+        route, kwargs = self.match(data or "")
+        if route is None:
+            return await fallback(update, context)
+        start = time.perf_counter()
+        try:
+            return await route.handler(update, context, **kwargs)
+        except Exception:
+            route.errors += 1
+            raise
+        finally:
+            route.calls += 1
+            route.latency.observe(time.perf_counter() - start)
+
+    @property
+    def routes(self):
+        return list(self._routes.values())
+
+    def snapshot(self):
+        # для логів/діагностики: гарячі маршрути першими
+        out = []
+        for r in sorted(self._routes.values(), key=lambda r: r.calls, reverse=True):
+            h = r.latency
+            out.append({
+                "route": r.pattern,
+                "calls": r.calls,
+                "errors": r.errors,
+                "avg_ms": h.sum / h.count * 1000 if h.count else 0.0,
+                "p50_ms": h.quantile(0.5) * 1000,
+                "p99_ms": h.quantile(0.99) * 1000,
+            })
+        return out
@@ -0,0 +1,177 @@
+# storage.py
+# -*- coding: utf-8 -*-
+
+# ─────────────────────────────────────────────────────────────────────────────
+# АСИНХРОННИЙ ДОСТУП ДО SQLITE
+# Запити виконуються у пулі потоків з невеликим пулом з’єднань, тож event loop
+# бота ніколи не чекає на диск. Читання йдуть паралельно, записи — через одну
+# фонову задачу-writer, яка збирає операції в пачки і комітить їх однією
+# транзакцією (group commit). База працює в режимі WAL.
+# ─────────────────────────────────────────────────────────────────────────────
+
+import asyncio
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+READ_POOL_SIZE = 4
+BUSY_TIMEOUT_MS = 5000
+FLUSH_INTERVAL = 0.005   # скільки чекати на «попутні» записи, сек
+FLUSH_MAX_OPS = 500      # або скільки операцій максимум в одній транзакції
+
+
+class Storage:
+    def __init__(self, path: str, readers: int = READ_POOL_SIZE):
+        self.path = path
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+        self._read_pool = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._write_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+        self._writer = self._connect()
+        self._writer.isolation_level = None  # транзакціями керуємо самі
+        self._writer.execute("PRAGMA journal_mode=WAL")
+        self._writer.execute("PRAGMA synchronous=FULL")
+        self._queue = None
+        self._task = None
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        return conn
+
+    # ---------- синхронний бутстрап (до старту event loop) ----------
+    def bootstrap(self, fn):
+        # fn(conn) отримує з’єднання writer-а в режимі autocommit (напр. migrations.migrate)
+        return fn(self._writer)
+
+    # ---------- читання ----------
+    def _read(self, fn):
+        conn = self._readers.get()
+        try:
+            return fn(conn)
+        finally:
+            self._readers.put(conn)
+
+    async def run(self, fn):
+        # fn(conn) виконується у потоці пулу з вільним з’єднанням на читання
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_pool, self._read, fn)
+
+    async def fetchone(self, sql: str, params=()):
+        if metrics.ENABLED:
+            return await self._timed_read(sql, lambda c: c.execute(sql, params).fetchone())
+        return await self.run(lambda c: c.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()):
+        if metrics.ENABLED:
+            return await self._timed_read(sql, lambda c: c.execute(sql, params).fetchall())
+        return await self.run(lambda c: c.execute(sql, params).fetchall())
+
+    async def _timed_read(self, sql, fn):
+        # час міряється в потоці — лише сам запит, без черги до пулу
+        def timed(conn):
+            start = time.perf_counter()
+            return fn(conn), time.perf_counter() - start
+        result, elapsed = await self.run(timed)
+        metrics.record_query("read", sql, elapsed)
+        return result
+
+    # ---------- запис (write-behind + group commit) ----------
+    # Кожна операція — список (sql, params), що має виконатись атомарно.
+    # Handler отримує підтвердження лише після COMMIT пачки, в яку вона потрапила.
+    async def write(self, ops):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._writer_loop())
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((ops, fut))
+        await fut
+
+    async def execute(self, sql: str, params=()):
+        await self.write([(sql, params)])
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        stop = False
+        while not stop:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch, n_ops = [item], len(item[0])
+            deadline = loop.time() + FLUSH_INTERVAL
+            while n_ops < FLUSH_MAX_OPS:
+                timeout = deadline - loop.time()
+                try:
+                    item = self._queue.get_nowait() if timeout <= 0 else \
+                        await asyncio.wait_for(self._queue.get(), timeout)
+                except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+                n_ops += len(item[0])
+            start = time.perf_counter()
+            errors = await loop.run_in_executor(self._write_pool, self._flush, [ops for ops, _ in batch])
+            if metrics.ENABLED:
+                first_sql = batch[0][0][0][0] if batch[0][0] else ""
+                metrics.record_query("write", f"COMMIT {n_ops} ops; {first_sql}", time.perf_counter() - start, n_ops)
+                metrics.REGISTRY.inc("db_write_ops_total", n_ops)
+            for (_, fut), err in zip(batch, errors):
+                if fut.done():
+                    continue
+                if err is None:
+                    fut.set_result(None)
+                else:
+                    fut.set_exception(err)
+
+    def _commit(self, jobs):
+        # підряд однакові SQL зливаються в один executemany
+        groups = []
+        for ops in jobs:
+            for sql, params in ops:
+                if groups and groups[-1][0] == sql:
+                    groups[-1][1].append(params)
+                else:
+                    groups.append((sql, [params]))
+        self._writer.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params in groups:
+                self._writer.executemany(sql, params)
+            self._writer.execute("COMMIT")
+        except Exception:
+            self._writer.execute("ROLLBACK")
+            raise
+
+    def _flush(self, jobs):
+        try:
+            self._commit(jobs)
+            return [None] * len(jobs)
+        except Exception as e:
+            if len(jobs) == 1:
+                return [e]
+        # пачка впала — повторюємо поштучно, щоб один битий запис не тягнув інших
+        errors = []
+        for ops in jobs:
+            try:
+                self._commit([ops])
+                errors.append(None)
+            except Exception as e:
+                errors.append(e)
+        return errors
+
+    # ---------- завершення ----------
+    async def close(self):
+        if self._task is not None:
+            await self._queue.put(None)  # спершу дописуємо все, що в черзі
+            await self._task
+            self._task = None
+        self._write_pool.shutdown(wait=True)
+        self._read_pool.shutdown(wait=True)
+        self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()